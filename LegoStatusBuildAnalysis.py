@@ -59,6 +59,8 @@ from matplotlib.backends.backend_pdf import PdfPages
 import logging
 from pathlib import Path
 
+from metrics import stage_timer
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -313,11 +315,12 @@ class LegoColorReport:
         return int(el.text) if el is not None and el.text and el.text.isdigit() else 0
 
 class LegoXmlCombiner:
-    def __init__(self, folder_path, filtered_folder, output_file, excluded_files=None):
+    def __init__(self, folder_path, filtered_folder, output_file, excluded_files=None, progress=None):
         self.folder_path = self._validate_folder_path(folder_path)
         self.filtered_folder = filtered_folder
         self.output_file = output_file
         self.excluded_files = excluded_files if excluded_files else []
+        self.progress = progress  # Optional progress.Operation receiving stage/batch events
         self._create_output_directory()
         self.xml_files = self._get_xml_files()
         self.combined_root = ET.Element("INVENTORY")
@@ -367,9 +370,15 @@ class LegoXmlCombiner:
         """Process all XML files and generate combined output"""
         logging.info("XML files found (excluding specified files): %s", self.xml_files)
         
-        for xml_file in self.xml_files:
+        if self.progress:
+            self.progress.stage('combine', f"Combining {len(self.xml_files)} files")
+        for index, xml_file in enumerate(self.xml_files, 1):
             self.process_single_file(xml_file)
+            if self.progress:
+                self.progress.batch(index, len(self.xml_files), f"Processed {xml_file}")
         
+        if self.progress:
+            self.progress.stage('xml_write', "Writing wanted list")
         self.write_combined_xml()
         self.print_statistics()
 
@@ -458,7 +467,8 @@ class LegoXmlCombiner:
         try:
             filtered_file_path = os.path.join(self.filtered_folder, f"filtered_{xml_file}")
             filtered_tree = ET.ElementTree(filtered_root)
-            filtered_tree.write(filtered_file_path, encoding='utf-8', xml_declaration=True)
+            with stage_timer('xml_write'):
+                filtered_tree.write(filtered_file_path, encoding='utf-8', xml_declaration=True)
             logging.info(f"Created filtered file: {filtered_file_path} ({items_added} items)")
         except Exception as e:
             error_msg = f"Error writing filtered file for {xml_file}: {e}"
@@ -484,7 +494,8 @@ class LegoXmlCombiner:
             self.stats['total_pieces_needed'] = total_pieces
             
             combined_tree = ET.ElementTree(self.combined_root)
-            combined_tree.write(self.output_file, encoding='utf-8', xml_declaration=True)
+            with stage_timer('xml_write'):
+                combined_tree.write(self.output_file, encoding='utf-8', xml_declaration=True)
             logging.info("Combined wanted list XML file created: %s", self.output_file)
             logging.info(f"Combined file contains {len(self.item_tracker)} unique items")
             logging.info(f"Total pieces needed: {total_pieces}")
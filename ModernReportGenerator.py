@@ -23,6 +23,10 @@ from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 import logging
 import tempfile
+import threading
+import time
+
+from metrics import stage_timer
 
 # ReportLab imports
 try:
@@ -71,10 +75,54 @@ except ImportError:
     logging.warning("Matplotlib/Seaborn not available for advanced charts")
 
 
+# Process-wide caches: filled on first use or ahead of time by warm_up()
+_color_mapping_cache = {}
+_stylesheet_cache = None
+_cache_lock = threading.Lock()
+
+
+def _modern_palette():
+    """Palette colori moderna del report"""
+    return {
+        'primary': HexColor('#2C3E50'),      # Dark blue-gray
+        'secondary': HexColor('#3498DB'),     # Bright blue
+        'accent': HexColor('#E74C3C'),        # Red
+        'success': HexColor('#27AE60'),       # Green
+        'warning': HexColor('#F39C12'),       # Orange
+        'info': HexColor('#9B59B6'),          # Purple
+        'light': HexColor('#ECF0F1'),         # Light gray
+        'dark': HexColor('#34495E'),          # Dark gray
+        'white': colors.white,
+        'black': colors.black
+    }
+
+
+def load_color_mapping(color_mapping_path):
+    """
+    Load a color mapping JSON once per process.
+
+    The parsed mapping is shared by every report; it is reloaded only when
+    the file's modification time changes. Callers must treat it as read-only.
+    """
+    path = os.path.abspath(color_mapping_path)
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        cached = _color_mapping_cache.get(path)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    with _cache_lock:
+        _color_mapping_cache[path] = (mtime_ns, mapping)
+    logging.info(f"Loaded {len(mapping)} color mappings from {color_mapping_path}")
+    return mapping
+
+
 class ModernReportGenerator:
     """Generatore di report PDF moderni per collezioni LEGO"""
     
-    def __init__(self, folder_path, color_mapping_path, output_pdf, report_type='complete'):
+    def __init__(self, folder_path, color_mapping_path, output_pdf, report_type='complete', parsed_items=None,
+                 progress=None):
         """
         Inizializza il generatore di report moderni
         
@@ -83,28 +131,22 @@ class ModernReportGenerator:
             color_mapping_path (str): Percorso del file di mappatura colori
             output_pdf (str): Percorso del file PDF di output
             report_type (str): Tipo di report ('summary', 'detailed', 'complete')
+            parsed_items (dict): Item già analizzati per file XML (nome file -> lista di item
+                nel formato di input_handlers), usati al posto di rileggere l'XML
+            progress (progress.Operation): Riceve gli eventi di avanzamento per fase
         """
         if not REPORTLAB_AVAILABLE:
             raise ImportError("ReportLab is required for modern reports. Install with: pip install reportlab")
         
         # Modern color palette (defined only when ReportLab is available)
-        self.COLORS = {
-            'primary': HexColor('#2C3E50'),      # Dark blue-gray
-            'secondary': HexColor('#3498DB'),     # Bright blue
-            'accent': HexColor('#E74C3C'),        # Red
-            'success': HexColor('#27AE60'),       # Green
-            'warning': HexColor('#F39C12'),       # Orange
-            'info': HexColor('#9B59B6'),          # Purple
-            'light': HexColor('#ECF0F1'),         # Light gray
-            'dark': HexColor('#34495E'),          # Dark gray
-            'white': colors.white,
-            'black': colors.black
-        }
+        self.COLORS = _modern_palette()
             
         self.folder_path = folder_path
         self.color_mapping_path = color_mapping_path
         self.output_pdf = output_pdf
         self.report_type = report_type
+        self.parsed_items = parsed_items or {}
+        self.progress = progress
         
         # Load data
         self.color_mapping = self._load_color_mapping()
@@ -1108,10 +1150,9 @@ class ModernReportGenerator:
             return None
 
     def _load_color_mapping(self):
-        """Carica la mappatura dei colori"""
+        """Carica la mappatura dei colori (condivisa tra i report del processo)"""
         try:
-            with open(self.color_mapping_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return load_color_mapping(self.color_mapping_path)
         except Exception as e:
             logging.warning(f"Could not load color mapping: {e}")
             return {}
@@ -1139,6 +1180,11 @@ class ModernReportGenerator:
         self.temp_files.clear()
     
     def _create_styles(self):
+        """Restituisce gli stili personalizzati (costruiti una sola volta per processo)"""
+        return get_stylesheet()
+
+    @staticmethod
+    def _build_styles(palette):
         """Crea gli stili personalizzati per il documento"""
         styles = getSampleStyleSheet()
         
@@ -1147,7 +1193,7 @@ class ModernReportGenerator:
             name='ModernTitle',
             parent=styles['Title'],
             fontSize=24,
-            textColor=self.COLORS['primary'],
+            textColor=palette['primary'],
             spaceAfter=30,
             alignment=TA_CENTER,
             fontName='Helvetica-Bold'
@@ -1158,7 +1204,7 @@ class ModernReportGenerator:
             name='ModernSubtitle',
             parent=styles['Heading1'],
             fontSize=18,
-            textColor=self.COLORS['secondary'],
+            textColor=palette['secondary'],
             spaceAfter=20,
             spaceBefore=20,
             fontName='Helvetica-Bold'
@@ -1169,14 +1215,14 @@ class ModernReportGenerator:
             name='SectionHeader',
             parent=styles['Heading2'],
             fontSize=14,
-            textColor=self.COLORS['dark'],
+            textColor=palette['dark'],
             spaceAfter=12,
             spaceBefore=16,
             fontName='Helvetica-Bold',
             borderWidth=1,
-            borderColor=self.COLORS['light'],
+            borderColor=palette['light'],
             borderPadding=8,
-            backColor=self.COLORS['light']
+            backColor=palette['light']
         ))
         
         # KPI style
@@ -1184,7 +1230,7 @@ class ModernReportGenerator:
             name='KPIValue',
             parent=styles['Normal'],
             fontSize=18,
-            textColor=self.COLORS['accent'],
+            textColor=palette['accent'],
             alignment=TA_CENTER,
             fontName='Helvetica-Bold',
             spaceAfter=3
@@ -1195,7 +1241,7 @@ class ModernReportGenerator:
             name='KPILabel',
             parent=styles['Normal'],
             fontSize=10,
-            textColor=self.COLORS['dark'],
+            textColor=palette['dark'],
             alignment=TA_CENTER,
             fontName='Helvetica',
             spaceAfter=15
@@ -1206,7 +1252,7 @@ class ModernReportGenerator:
             name='ModernBody',
             parent=styles['Normal'],
             fontSize=11,
-            textColor=self.COLORS['dark'],
+            textColor=palette['dark'],
             spaceAfter=8,
             fontName='Helvetica'
         ))
@@ -1216,7 +1262,7 @@ class ModernReportGenerator:
             name='Caption',
             parent=styles['Normal'],
             fontSize=9,
-            textColor=self.COLORS['dark'],
+            textColor=palette['dark'],
             alignment=TA_CENTER,
             fontName='Helvetica-Oblique',
             spaceAfter=10
@@ -1246,23 +1292,7 @@ class ModernReportGenerator:
             }
             
             try:
-                tree = ET.parse(file_path)
-                root = tree.getroot()
-                
-                for item in root.findall('ITEM'):
-                    # Extract item data
-                    item_id = item.find('ITEMID')
-                    item_id = item_id.text if item_id is not None else 'Unknown'
-                    
-                    color_code = item.find('COLOR')
-                    color_code = color_code.text if color_code is not None else '0'
-                    
-                    min_qty = item.find('MINQTY')
-                    min_qty = int(min_qty.text) if min_qty is not None and min_qty.text.isdigit() else 0
-                    
-                    qty_filled = item.find('QTYFILLED')
-                    qty_filled = int(qty_filled.text) if qty_filled is not None and qty_filled.text.isdigit() else 0
-                    
+                for item_id, color_code, min_qty, qty_filled in self._iter_file_items(xml_file, file_path):
                     total_qty = min_qty + qty_filled
                     
                     # Update analytics
@@ -1333,6 +1363,32 @@ class ModernReportGenerator:
         
         logging.info(f"Analysis complete: {self.analytics['total_pieces']} pieces, {len(self.analytics['unique_colors'])} colors")
     
+    def _iter_file_items(self, xml_file, file_path):
+        """Restituisce (item_id, colore, min_qty, qty_filled) da item già analizzati o dall'XML"""
+        if xml_file in self.parsed_items:
+            for item in self.parsed_items[xml_file]:
+                yield (item['item_id'] or 'Unknown', item['color'], item['min_qty'], item['qty_filled'])
+            return
+        
+        tree = ET.parse(file_path)
+        root = tree.getroot()
+        
+        for item in root.findall('ITEM'):
+            # Extract item data
+            item_id = item.find('ITEMID')
+            item_id = item_id.text if item_id is not None else 'Unknown'
+            
+            color_code = item.find('COLOR')
+            color_code = color_code.text if color_code is not None else '0'
+            
+            min_qty = item.find('MINQTY')
+            min_qty = int(min_qty.text) if min_qty is not None and min_qty.text.isdigit() else 0
+            
+            qty_filled = item.find('QTYFILLED')
+            qty_filled = int(qty_filled.text) if qty_filled is not None and qty_filled.text.isdigit() else 0
+            
+            yield item_id, color_code, min_qty, qty_filled
+    
     def _calculate_rarity_analysis(self):
         """Calcola l'analisi di rarità dei pezzi"""
         piece_counts = Counter()
@@ -1350,12 +1406,19 @@ class ModernReportGenerator:
             'common': sorted_pieces[int(total_pieces * 0.50):]  # Top 50%
         }
     
+    def _progress_stage(self, stage, message):
+        """Segnala l'inizio di una fase a chi segue l'avanzamento (se presente)"""
+        if self.progress is not None:
+            self.progress.stage(stage, message)
+
     def generate_report(self):
         """Genera il report PDF completo"""
         logging.info(f"Generating {self.report_type} report...")
         
         # Analyze data first
-        self.analyze_data()
+        self._progress_stage('aggregate', 'Analisi dei dati')
+        with stage_timer('aggregate'):
+            self.analyze_data()
         
         # Create PDF document
         doc = SimpleDocTemplate(
@@ -1367,38 +1430,42 @@ class ModernReportGenerator:
             bottomMargin=2*cm
         )
         
-        # Build story
-        story = []
-        
-        # Add cover page
-        story.extend(self._create_cover_page())
-        story.append(PageBreak())
-        
-        # Add executive summary
-        story.extend(self._create_executive_summary())
-        story.append(PageBreak())
+        # Build story (charts and flowables)
+        self._progress_stage('render', 'Creazione grafici e sezioni')
+        with stage_timer('render'):
+            story = []
         
-        # Add different sections based on report type
-        if self.report_type in ['summary', 'complete']:
-            story.extend(self._create_overview_section())
+            # Add cover page
+            story.extend(self._create_cover_page())
             story.append(PageBreak())
         
-        if self.report_type in ['detailed', 'complete']:
-            story.extend(self._create_detailed_analysis())
+            # Add executive summary
+            story.extend(self._create_executive_summary())
             story.append(PageBreak())
+        
+            # Add different sections based on report type
+            if self.report_type in ['summary', 'complete']:
+                story.extend(self._create_overview_section())
+                story.append(PageBreak())
+        
+            if self.report_type in ['detailed', 'complete']:
+                story.extend(self._create_detailed_analysis())
+                story.append(PageBreak())
             
-            story.extend(self._create_color_analysis())
-            story.append(PageBreak())
+                story.extend(self._create_color_analysis())
+                story.append(PageBreak())
             
-            story.extend(self._create_rarity_analysis())
-            story.append(PageBreak())
+                story.extend(self._create_rarity_analysis())
+                story.append(PageBreak())
         
-        # Always include recommendations
-        story.extend(self._create_recommendations())
+            # Always include recommendations
+            story.extend(self._create_recommendations())
         
         # Build PDF
         try:
-            doc.build(story)
+            self._progress_stage('pdf_build', 'Composizione PDF')
+            with stage_timer('pdf_build'):
+                doc.build(story)
             logging.info(f"Modern report generated successfully: {self.output_pdf}")
             
             # Clean up temporary files
@@ -1766,6 +1833,43 @@ class ModernReportGenerator:
         return self.generate_report()
 
 
+def get_stylesheet():
+    """ReportLab stylesheet shared by every report of the process (read-only)"""
+    global _stylesheet_cache
+    with _cache_lock:
+        if _stylesheet_cache is None:
+            _stylesheet_cache = ModernReportGenerator._build_styles(_modern_palette())
+        return _stylesheet_cache
+
+
+def warm_up(color_mapping_path='BL_color_mapping.json'):
+    """
+    Preload the caches the first report would otherwise pay for.
+
+    Loads the color mapping, builds the ReportLab stylesheet and makes
+    matplotlib load (or build) its font cache and render one text glyph run.
+    Called once at server startup, before worker processes are forked.
+    """
+    start = time.perf_counter()
+    try:
+        load_color_mapping(color_mapping_path)
+    except Exception as e:
+        logging.warning(f"Warm-up could not load color mapping: {e}")
+
+    if REPORTLAB_AVAILABLE:
+        get_stylesheet()
+
+    if MATPLOTLIB_AVAILABLE:
+        from matplotlib import font_manager
+        font_manager.findfont('DejaVu Sans')
+        fig, ax = plt.subplots(figsize=(1, 1), dpi=72)
+        ax.set_title('warm-up')
+        fig.canvas.draw()
+        plt.close(fig)
+
+    logging.info(f"Report generator warm-up done in {time.perf_counter() - start:.2f}s")
+
+
 # Backward compatibility function
 def generate_modern_report(folder_path, color_mapping_path, output_pdf, report_type='complete'):
     """
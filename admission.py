@@ -0,0 +1,299 @@
+"""
+Admission Control for LEGO Analysis System
+Per-endpoint-class concurrency limits with fast rejection under overload
+"""
+
+import os
+import math
+import time
+import logging
+import threading
+from functools import wraps
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: no worker processes to share the limits with
+    fcntl = None
+
+
+# Defaults sized for one process rendering 600-dpi figures: heavy work is
+# serialized, light work (BrickLink calls mostly wait on the network) less so
+DEFAULT_LIMITS = {
+    'report': {'max_concurrent': 2, 'max_queue': 4, 'queue_timeout': 15},
+    'wanted_list': {'max_concurrent': 4, 'max_queue': 8, 'queue_timeout': 10},
+    'bricklink_sync': {'max_concurrent': 2, 'max_queue': 4, 'queue_timeout': 5}
+}
+
+ADMISSION_IN_FLIGHT = metrics.registry.gauge(
+    'lego_admission_in_flight', 'Requests currently executing per endpoint class', ('endpoint_class',)
+)
+ADMISSION_QUEUE_DEPTH = metrics.registry.gauge(
+    'lego_admission_queue_depth', 'Requests waiting for a slot per endpoint class', ('endpoint_class',)
+)
+ADMISSION_REJECTED = metrics.registry.counter(
+    'lego_admission_rejected_total', 'Requests rejected by admission control', ('endpoint_class', 'reason')
+)
+ADMISSION_WAIT = metrics.registry.histogram(
+    'lego_admission_wait_seconds', 'Time admitted requests spent queued', ('endpoint_class',),
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted"""
+
+    def __init__(self, endpoint_class, status_code, retry_after, reason):
+        super().__init__(f"{endpoint_class} is at capacity ({reason})")
+        self.endpoint_class = endpoint_class
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class ProcessSlots:
+    """
+    Concurrency slots shared by every worker process of the server.
+
+    Each slot is a lock file held with flock(): a request takes the first
+    free one. The kernel drops the locks of a process that dies, so a
+    crashed worker never leaks slots.
+    """
+
+    def __init__(self, directory, name, count, poll_interval=0.05):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"{name}.{index}.lock") for index in range(count)]
+        self.poll_interval = poll_interval
+
+    def try_acquire(self):
+        """Return a held slot (file descriptor), or None if all are taken"""
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def acquire(self, timeout):
+        """Wait up to `timeout` seconds for a slot; None if none became free"""
+        deadline = time.monotonic() + timeout
+        while True:
+            fd = self.try_acquire()
+            if fd is not None or time.monotonic() >= deadline:
+                return fd
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def release(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class EndpointLimiter:
+    """
+    Concurrency limit with a short bounded queue for one endpoint class.
+
+    Up to `max_concurrent` requests run at once and up to `max_queue` more
+    wait at most `queue_timeout` seconds for a slot. A request arriving when
+    the queue is full is rejected immediately with 429; one that times out
+    in the queue gets 503. Retry-After is estimated from the recent average
+    duration of admitted requests.
+
+    Once `share()` is called the `max_concurrent` slots are held across all
+    worker processes (see ProcessSlots); the queue stays per process.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue=0, queue_timeout=0):
+        self.name = name
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = float(queue_timeout)
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_duration = None
+        self._slots = None
+        ADMISSION_IN_FLIGHT.set(0, endpoint_class=name)
+        ADMISSION_QUEUE_DEPTH.set(0, endpoint_class=name)
+
+    def _retry_after(self):
+        """Seconds until a slot is likely free for a newcomer"""
+        average = self._avg_duration or 5.0
+        rounds = (self._waiting // self.max_concurrent) + 1
+        return max(1, int(math.ceil(average * rounds)))
+
+    def share(self, directory, max_queue=None):
+        """Hold the concurrency slots across processes through lock files in `directory`"""
+        self._slots = ProcessSlots(directory, self.name, self.max_concurrent)
+        if max_queue is not None:
+            self.max_queue = max(0, int(max_queue))
+
+    def acquire(self):
+        """
+        Take a slot or raise AdmissionRejected.
+
+        Returns:
+            The held process-shared slot, to pass to release() (None if not shared)
+        """
+        if self._slots is not None:
+            return self._acquire_shared()
+        with self._condition:
+            if self._in_flight < self.max_concurrent and not self._waiting:
+                self._in_flight += 1
+                ADMISSION_IN_FLIGHT.set(self._in_flight, endpoint_class=self.name)
+                ADMISSION_WAIT.observe(0.0, endpoint_class=self.name)
+                return
+
+            if self._waiting >= self.max_queue:
+                ADMISSION_REJECTED.inc(endpoint_class=self.name, reason='queue_full')
+                raise AdmissionRejected(self.name, 429, self._retry_after(), 'queue full')
+
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting, endpoint_class=self.name)
+            start = time.monotonic()
+            try:
+                admitted = self._condition.wait_for(
+                    lambda: self._in_flight < self.max_concurrent, timeout=self.queue_timeout
+                )
+            finally:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._waiting, endpoint_class=self.name)
+
+            if not admitted:
+                ADMISSION_REJECTED.inc(endpoint_class=self.name, reason='timeout')
+                raise AdmissionRejected(self.name, 503, self._retry_after(), 'queue timeout')
+
+            self._in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self._in_flight, endpoint_class=self.name)
+            ADMISSION_WAIT.observe(time.monotonic() - start, endpoint_class=self.name)
+
+    def _acquire_shared(self):
+        # Same queue rules, but the slot is a lock file other workers compete for
+        with self._condition:
+            slot = None if self._waiting else self._slots.try_acquire()
+            if slot is not None:
+                self._in_flight += 1
+                ADMISSION_IN_FLIGHT.set(self._in_flight, endpoint_class=self.name)
+                ADMISSION_WAIT.observe(0.0, endpoint_class=self.name)
+                return slot
+
+            if self._waiting >= self.max_queue:
+                ADMISSION_REJECTED.inc(endpoint_class=self.name, reason='queue_full')
+                raise AdmissionRejected(self.name, 429, self._retry_after(), 'queue full')
+
+            self._waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(self._waiting, endpoint_class=self.name)
+
+        start = time.monotonic()
+        try:
+            slot = self._slots.acquire(self.queue_timeout)
+        finally:
+            with self._condition:
+                self._waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._waiting, endpoint_class=self.name)
+
+        with self._condition:
+            if slot is None:
+                ADMISSION_REJECTED.inc(endpoint_class=self.name, reason='timeout')
+                raise AdmissionRejected(self.name, 503, self._retry_after(), 'queue timeout')
+            self._in_flight += 1
+            ADMISSION_IN_FLIGHT.set(self._in_flight, endpoint_class=self.name)
+            ADMISSION_WAIT.observe(time.monotonic() - start, endpoint_class=self.name)
+        return slot
+
+    def release(self, duration=None, slot=None):
+        """Free a slot, folding the request duration into the Retry-After estimate"""
+        if slot is not None:
+            self._slots.release(slot)
+        with self._condition:
+            self._in_flight -= 1
+            ADMISSION_IN_FLIGHT.set(self._in_flight, endpoint_class=self.name)
+            if duration is not None:
+                self._avg_duration = duration if self._avg_duration is None else (
+                    0.8 * self._avg_duration + 0.2 * duration
+                )
+            self._condition.notify()
+
+    def status(self):
+        with self._condition:
+            return {
+                'shared_across_workers': self._slots is not None,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_timeout': self.queue_timeout,
+                'in_flight': self._in_flight,
+                'queued': self._waiting,
+                'avg_duration_seconds': round(self._avg_duration, 3) if self._avg_duration else None
+            }
+
+
+class AdmissionController:
+    """Registry of endpoint limiters configured from the `admission` config section"""
+
+    def __init__(self, limits=None):
+        """
+        Args:
+            limits (dict): Endpoint class -> {'max_concurrent', 'max_queue', 'queue_timeout'};
+                merged over DEFAULT_LIMITS
+        """
+        merged = {name: dict(values) for name, values in DEFAULT_LIMITS.items()}
+        for name, values in (limits or {}).items():
+            merged.setdefault(name, {}).update(values)
+        self.limiters = {
+            name: EndpointLimiter(
+                name,
+                values.get('max_concurrent', 1),
+                values.get('max_queue', 0),
+                values.get('queue_timeout', 0)
+            )
+            for name, values in merged.items()
+        }
+
+    def limit(self, endpoint_class):
+        """Decorator admitting a Flask view through the named limiter"""
+        limiter = self.limiters[endpoint_class]
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                from flask import jsonify
+                try:
+                    slot = limiter.acquire()
+                except AdmissionRejected as e:
+                    logging.warning(f"Admission rejected for {endpoint_class}: {e.reason}")
+                    response = jsonify({
+                        'error': f'Server busy, please retry in {e.retry_after}s',
+                        'endpoint_class': endpoint_class,
+                        'retry_after': e.retry_after
+                    })
+                    response.status_code = e.status_code
+                    response.headers['Retry-After'] = str(e.retry_after)
+                    return response
+
+                start = time.monotonic()
+                try:
+                    return view(*args, **kwargs)
+                finally:
+                    limiter.release(time.monotonic() - start, slot)
+            return wrapper
+        return decorator
+
+    def share_across_processes(self, directory, workers):
+        """
+        Apply the limits to all worker processes together, not to each one.
+
+        Concurrency slots become lock files in `directory`; each worker's
+        queue gets its share of `max_queue`. Without fcntl (Windows, where
+        the server runs a single process) the limits stay per process.
+        """
+        if fcntl is None:
+            return
+        for limiter in self.limiters.values():
+            limiter.share(directory, max_queue=math.ceil(limiter.max_queue / max(1, workers)))
+
+    def status(self):
+        """Current limits and occupancy for every endpoint class"""
+        return {name: limiter.status() for name, limiter in self.limiters.items()}
@@ -0,0 +1,398 @@
+"""
+Analytics Database Connections for LEGO Analysis System
+Pooled SQLite connections with consistent pragmas and a single writer thread
+"""
+
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import metrics
+
+
+DEFAULT_PRAGMAS = (
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA synchronous = NORMAL",     # Durable in WAL mode at a fraction of the fsyncs
+    "PRAGMA cache_size = -20000",      # ~20MB page cache per connection
+    "PRAGMA mmap_size = 268435456",    # Read pages through a 256MB memory map
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON"
+)
+
+WRITE_JOBS = metrics.registry.counter(
+    'lego_analytics_writes_total', 'Write jobs run by the analytics writer thread', ('result',)
+)
+WRITE_BATCH_SIZE = metrics.registry.histogram(
+    'lego_analytics_write_batch_size', 'Write jobs committed per transaction (group commit)',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+WRITE_QUEUE_DEPTH = metrics.registry.gauge(
+    'lego_analytics_write_queue_depth', 'Write jobs waiting for the analytics writer thread'
+)
+
+
+class SQLiteConnectionManager:
+    """
+    Connection pool for one SQLite database file.
+
+    Connections are opened once, configured with the same pragmas and
+    reused: a thread checks one out for the duration of a `read()` or
+    `write()` block (nested blocks in the same thread share it) and returns
+    it to the idle pool afterwards. This suits the Flask threaded server,
+    which runs every request on a fresh thread.
+
+    All writes of the process go through one writer thread that owns the
+    only write connection. Callers `submit()` a function of the connection
+    and get a Future; the writer drains the bounded queue and runs every job
+    it finds in one transaction (group commit), each job inside its own
+    savepoint so a failing job rolls back alone. Futures resolve after the
+    COMMIT. Readers use pooled connections and, in WAL mode, never wait for
+    the writer. `BEGIN IMMEDIATE` plus busy_timeout covers other worker
+    processes. Work that manages its own transactions (migrations, VACUUM)
+    goes through `execute_exclusive()`, which runs it on the writer between
+    two groups.
+    """
+
+    def __init__(self, db_path, pragmas=DEFAULT_PRAGMAS, max_idle=8, max_queue=256, max_batch=64,
+                 submit_timeout=30):
+        """
+        Args:
+            db_path (str): SQLite database file
+            pragmas (tuple): Statements run on every new connection
+            max_idle (int): Idle connections kept open for reuse
+            max_queue (int): Pending write jobs before submit() blocks
+            max_batch (int): Most jobs committed in one transaction
+            submit_timeout (float): Seconds submit() waits for room in a full queue
+        """
+        self.db_path = db_path
+        self.pragmas = tuple(pragmas)
+        self.max_idle = max_idle
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.submit_timeout = submit_timeout
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._writer = None
+        self._jobs = queue.Queue(max_queue)
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._wal_checked = False
+
+    def _reset_after_fork(self):
+        # Connections and threads never cross a fork: drop (without closing) the parent's
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._idle = []
+            self._pool_lock = threading.Lock()
+            self._writer_lock = threading.Lock()
+            self._writer = None
+            self._jobs = queue.Queue(self.max_queue)
+            self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        for pragma in self.pragmas:
+            conn.execute(pragma)
+        if not self._wal_checked:
+            # Only takes effect on a new, empty database: lets maintenance free pages incrementally
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")  # Persistent: stored in the database file
+            self._wal_checked = True
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection in autocommit mode (shared by nested blocks in this thread)"""
+        self._reset_after_fork()
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        with self._pool_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            with self._pool_lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def read(self):
+        """Connection inside a read transaction: all queries see one consistent snapshot"""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute("BEGIN")
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.execute("COMMIT")
+
+    def submit(self, work, *args, **kwargs):
+        """
+        Queue `work(conn, *args, **kwargs)` for the writer thread.
+
+        The job runs inside the writer's transaction and must not COMMIT or
+        ROLLBACK itself; raising rolls back only this job.
+
+        Returns:
+            Future: Result of `work`, set once its transaction has committed
+
+        Raises:
+            sqlite3.OperationalError: The queue stayed full for submit_timeout seconds
+        """
+        return self._submit(work, args, kwargs, exclusive=False)
+
+    def _submit(self, work, args, kwargs, exclusive):
+        self._reset_after_fork()
+        if getattr(self._local, 'writing', False):
+            # Already inside a write (on the writer, or a write() block): join that transaction
+            future = Future()
+            try:
+                future.set_result(work(self._local.conn, *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        future = Future()
+        # Held across the put so stop_writer() cannot queue its sentinel in between
+        with self._writer_lock:
+            self._ensure_writer()
+            try:
+                self._jobs.put((work, args, kwargs, future, exclusive), timeout=self.submit_timeout)
+            except queue.Full:
+                raise sqlite3.OperationalError(
+                    f"Analytics write queue full ({self.max_queue} jobs pending for {self.submit_timeout}s)"
+                )
+        WRITE_QUEUE_DEPTH.set(self._jobs.qsize())
+        return future
+
+    def execute_write(self, work, *args, **kwargs):
+        """Run `work(conn, ...)` on the writer thread and wait for its commit"""
+        return self.submit(work, *args, **kwargs).result()
+
+    def execute_exclusive(self, work, *args, **kwargs):
+        """
+        Run `work(conn, ...)` on the writer's connection outside any transaction.
+
+        For statements that manage their own transactions or cannot run in
+        one (migrations, VACUUM, wal_checkpoint): the writer commits the
+        group before it, runs `work` alone, then resumes. A transaction
+        `work` leaves open is rolled back.
+
+        Returns:
+            Result of `work`
+        """
+        return self._submit(work, args, kwargs, exclusive=True).result()
+
+    @contextmanager
+    def write(self):
+        """
+        Connection inside a write transaction, for multi-statement blocks.
+
+        The block runs in the calling thread on the writer's connection, lent
+        for the duration of one job: the writer waits for it, so it stays the
+        only writer. Exiting normally waits for the commit of the group the
+        block was part of; an exception rolls back just the block.
+        """
+        self._reset_after_fork()
+        if getattr(self._local, 'writing', False):
+            yield self._local.conn  # Nested write: part of the enclosing transaction
+            return
+
+        held = getattr(self._local, 'conn', None)
+        if held is not None and held.in_transaction:
+            held.execute("COMMIT")  # Upgrade from an enclosing read snapshot, as before
+
+        ready = threading.Event()
+        finished = threading.Event()
+        lent = {}
+
+        def lend(conn):
+            lent['conn'] = conn
+            ready.set()
+            finished.wait()
+            if 'error' in lent:
+                # Roll back the block's savepoint; the caller re-raises the original error
+                raise sqlite3.OperationalError(f"Write block failed: {lent['error']!r}")
+
+        future = self.submit(lend)
+        future.add_done_callback(lambda _: ready.set())
+        ready.wait()
+        if 'conn' not in lent:
+            future.result()  # The transaction could not start: raise why
+
+        self._local.conn, self._local.writing = lent['conn'], True
+        try:
+            yield lent['conn']
+        except BaseException as e:
+            lent['error'] = e
+            raise
+        finally:
+            self._local.conn, self._local.writing = held, False
+            finished.set()
+        future.result()
+
+    def _ensure_writer(self):
+        # Called with _writer_lock held
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._writer_loop, args=(self._jobs,),
+                                            name='analytics-writer', daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self, jobs):
+        conn = self._open()
+        self._local.conn, self._local.writing = conn, True
+        try:
+            stopping = False
+            while not stopping:
+                job = jobs.get()
+                if job is None:
+                    break
+                batch = [job]
+                # Group commit: everything already waiting joins this transaction
+                while len(batch) < self.max_batch:
+                    try:
+                        job = jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    if job is None:
+                        stopping = True
+                        break
+                    batch.append(job)
+                WRITE_QUEUE_DEPTH.set(jobs.qsize())
+                group = []
+                for job in batch:
+                    if job[4]:
+                        self._run_batch(conn, group)
+                        group = []
+                        self._run_exclusive(conn, job)
+                    else:
+                        group.append(job)
+                self._run_batch(conn, group)
+        finally:
+            conn.close()
+
+    def _run_exclusive(self, conn, job):
+        """Run one job in autocommit mode, between two groups"""
+        work, args, kwargs, future, _ = job
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = work(conn, *args, **kwargs)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            future.set_exception(e)
+            WRITE_JOBS.inc(result='failed')
+            return
+        if conn.in_transaction:
+            logging.warning("Exclusive analytics write left a transaction open; rolled back")
+            conn.execute("ROLLBACK")
+        WRITE_JOBS.inc(result='committed')
+        future.set_result(result)
+
+    def _run_batch(self, conn, batch):
+        """Run jobs in one transaction, one savepoint each; resolve their futures after COMMIT"""
+        done = []
+        for work, args, kwargs, future, _ in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                conn.execute("SAVEPOINT write_job")
+            except sqlite3.Error as e:
+                future.set_exception(e)
+                WRITE_JOBS.inc(result='failed')
+                continue
+            try:
+                result = work(conn, *args, **kwargs)
+                conn.execute("RELEASE write_job")
+                done.append((future, result))
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK TO write_job")
+                    conn.execute("RELEASE write_job")
+                else:
+                    # SQLite aborted the whole transaction: earlier jobs of the batch are lost too
+                    for lost, _ in done:
+                        lost.set_exception(e)
+                    WRITE_JOBS.inc(len(done), result='failed')
+                    done = []
+                future.set_exception(e)
+                WRITE_JOBS.inc(result='failed')
+
+        if not conn.in_transaction:
+            return
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logging.error(f"Analytics group commit of {len(done)} writes failed: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, _ in done:
+                future.set_exception(e)
+            WRITE_JOBS.inc(len(done), result='failed')
+            return
+        WRITE_BATCH_SIZE.observe(len(done))
+        WRITE_JOBS.inc(len(done), result='committed')
+        for future, result in done:
+            future.set_result(result)
+
+    def stop_writer(self, timeout=30):
+        """Finish the queued writes and stop the writer thread (restarted by the next write)"""
+        self._reset_after_fork()
+        # Same lock as submit(): no job can be queued behind the sentinel. A writer
+        # still draining after the timeout keeps its queue; the next one gets a new one
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+            if writer is not None and writer.is_alive():
+                self._jobs.put(None)
+                writer.join(timeout)
+                if writer.is_alive():
+                    self._jobs = queue.Queue(self.max_queue)
+
+    def close_all(self):
+        """Stop the writer and close idle connections (checked-out ones close on return)"""
+        self.stop_writer()
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logging.warning(f"Error closing analytics connection: {e}")
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path="analytics.db"):
+    """Process-wide connection manager for a database file"""
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = SQLiteConnectionManager(db_path)
+        return manager
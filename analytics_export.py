@@ -0,0 +1,212 @@
+"""
+Analytics Export for LEGO Analysis System
+Streaming columnar export of analytics.db for offline analysis (notebooks)
+
+Usage:
+    python analytics_export.py [analytics.db] [--output exports] [--format parquet|csv]
+        [--chunk-rows 50000] [--tables collections items color_stats price_history]
+
+Each table is written as one file: Parquet (zstd, one row group per chunk)
+when pyarrow is installed, gzip CSV otherwise. Rows are read with
+fetchmany() and written chunk by chunk, so memory stays bounded by the
+chunk size whatever the size of the database. All tables are read in one
+read transaction: the export is a consistent snapshot while saves go on.
+
+In a notebook:
+    pd.read_parquet('exports/analytics_20250101_120000/items.parquet')
+    pd.read_csv('exports/analytics_20250101_120000/items.csv.gz')
+"""
+
+import os
+import csv
+import sys
+import gzip
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+
+from analytics_db import get_connection_manager
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_AVAILABLE = False
+
+
+# Exported tables: name -> (query, [(column, type)]); types are 'int', 'float' or 'str'
+EXPORT_TABLES = {
+    'collections': ("""
+        SELECT id, name, created_at, file_count, total_items, completion_percentage
+        FROM collections ORDER BY id
+    """, [('id', 'int'), ('name', 'str'), ('created_at', 'str'), ('file_count', 'int'),
+          ('total_items', 'int'), ('completion_percentage', 'float')]),
+    # The denormalized item layout notebooks expect, resolved from the dimensions
+    'items': ("""
+        SELECT f.id, f.collection_id, p.item_id, p.item_type, co.color_id, co.color_name,
+               ca.name, s.source_file, f.min_qty, f.qty_filled, f.price
+        FROM item_facts f
+        LEFT JOIN parts p ON p.id = f.part_key
+        LEFT JOIN colors co ON co.id = f.color_key
+        LEFT JOIN categories ca ON ca.id = f.category_key
+        LEFT JOIN source_sets s ON s.id = f.set_key
+        ORDER BY f.id
+    """, [('id', 'int'), ('collection_id', 'int'), ('item_id', 'str'), ('item_type', 'str'),
+          ('color_id', 'str'), ('color_name', 'str'), ('category', 'str'), ('source_file', 'str'),
+          ('min_qty', 'int'), ('qty_filled', 'int'), ('price', 'float')]),
+    'color_stats': ("""
+        SELECT cs.collection_id, cs.color_id, co.color_name, cs.total_pieces, cs.owned_pieces,
+               cs.missing_pieces, cs.completion_rate
+        FROM color_stats cs
+        LEFT JOIN colors co ON co.color_id = cs.color_id
+        ORDER BY cs.id
+    """, [('collection_id', 'int'), ('color_id', 'str'), ('color_name', 'str'), ('total_pieces', 'int'),
+          ('owned_pieces', 'int'), ('missing_pieces', 'int'), ('completion_rate', 'float')]),
+    'price_history': ("""
+        SELECT id, item_key, price, currency, date_recorded FROM price_history ORDER BY id
+    """, [('id', 'int'), ('item_key', 'str'), ('price', 'float'), ('currency', 'str'),
+          ('date_recorded', 'str')]),
+}
+
+
+def _cast(value, kind):
+    """Coerce SQLite's dynamic typing to the column type (bad values become None)"""
+    if value is None or kind == 'str':
+        return value if value is None else str(value)
+    try:
+        return int(value) if kind == 'int' else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_parquet(path, cursor, columns, chunk_rows):
+    arrow_types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            arrays = [
+                pa.array([_cast(row[i], kind) for row in chunk], type=arrow_types[kind])
+                for i, (_, kind) in enumerate(columns)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def _write_csv(path, cursor, columns, chunk_rows):
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6) as f:
+        writer = csv.writer(f)
+        writer.writerow([name for name, _ in columns])
+        while True:
+            chunk = cursor.fetchmany(chunk_rows)
+            if not chunk:
+                break
+            writer.writerows(chunk)
+            rows += len(chunk)
+    return rows
+
+
+def export_analytics(db_path='analytics.db', output_folder='exports', file_format=None,
+                     tables=None, chunk_rows=50000):
+    """
+    Export analytics tables to a new timestamped folder.
+
+    Args:
+        db_path (str): Analytics database
+        output_folder (str): Parent folder of the export
+        file_format (str): 'parquet' or 'csv'; default parquet if pyarrow is installed
+        tables (list): Subset of EXPORT_TABLES (default: all)
+        chunk_rows (int): Rows read and written at a time
+
+    Returns:
+        dict: Manifest with the export folder, format and per-table rows, paths and sizes
+    """
+    file_format = file_format or ('parquet' if PYARROW_AVAILABLE else 'csv')
+    if file_format == 'parquet' and not PYARROW_AVAILABLE:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow); use --format csv")
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError(f"Unknown export format '{file_format}'")
+    tables = tables or list(EXPORT_TABLES)
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(unknown)}")
+
+    folder = os.path.join(output_folder, f"analytics_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(folder, exist_ok=True)
+    write = _write_parquet if file_format == 'parquet' else _write_csv
+    extension = '.parquet' if file_format == 'parquet' else '.csv.gz'
+
+    manifest = {
+        'folder': folder,
+        'format': file_format,
+        'exported_at': datetime.now().isoformat(),
+        'tables': {}
+    }
+    started = time.time()
+    db = get_connection_manager(db_path)
+    # One read transaction: every table comes from the same snapshot
+    with db.read() as conn:
+        for table in tables:
+            query, columns = EXPORT_TABLES[table]
+            path = os.path.join(folder, table + extension)
+            table_started = time.time()
+            cursor = conn.execute(query)
+            try:
+                rows = write(path, cursor, columns, chunk_rows)
+            finally:
+                cursor.close()
+            manifest['tables'][table] = {
+                'path': path,
+                'rows': rows,
+                'bytes': os.path.getsize(path),
+                'columns': [name for name, _ in columns],
+                'seconds': round(time.time() - table_started, 2)
+            }
+            logging.info(f"Exported {rows} rows of {table} to {path}")
+    manifest['seconds'] = round(time.time() - started, 2)
+
+    with open(os.path.join(folder, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export analytics.db to Parquet or gzip CSV')
+    parser.add_argument('db_path', nargs='?', default='analytics.db')
+    parser.add_argument('--output', default='exports', help='Parent folder of the export')
+    parser.add_argument('--format', choices=('parquet', 'csv'),
+                        help='Default: parquet if pyarrow is installed, else csv')
+    parser.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES))
+    parser.add_argument('--chunk-rows', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Creating the analytics object applies pending schema migrations
+    from dashboard import DashboardAnalytics
+    DashboardAnalytics(args.db_path)
+
+    try:
+        manifest = export_analytics(args.db_path, args.output, args.format, args.tables, args.chunk_rows)
+    except (RuntimeError, ValueError) as e:
+        print(f"Export failed: {e}")
+        return 1
+
+    print(f"Export ({manifest['format']}) in {manifest['folder']}, {manifest['seconds']}s")
+    for table, info in manifest['tables'].items():
+        print(f"  {table:<14} {info['rows']:>10,} rows  {info['bytes'] / 1024:>10,.0f} KiB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,372 @@
+"""
+Analytics Maintenance for LEGO Analysis System
+Retention, archival and compaction of analytics.db, as a command or a background task
+
+Usage:
+    python analytics_maintenance.py [analytics.db] [--max-age-days 365] [--keep 30]
+        [--price-history-days 365] [--archive-folder analytics_archive] [--no-archive]
+        [--dry-run] [--vacuum-full]
+
+Old analyses (collections rows with their item facts, color/category/set
+stats and completion snapshots) are written to a gzip JSON-lines archive and
+then deleted. The daily completion rollups are kept, so progress timelines
+still cover the whole history. Dimension tables (parts, colors, categories,
+source sets) are append-only and never pruned.
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from analytics_db import get_connection_manager
+
+
+DEFAULT_POLICY = {
+    'max_age_days': 365,          # Analyses older than this are expired...
+    'keep_per_collection': 30,    # ...as are all but the newest N saves of each collection name
+    'min_keep': 1,                # The newest N saves of each name are always kept
+    'price_history_days': 365,
+    'archive': True,
+    'vacuum_pages': 2000          # Free pages returned to the OS per run (incremental vacuum)
+}
+
+# Per-analysis tables deleted together with the collections row
+COLLECTION_TABLES = ('item_facts', 'color_stats', 'category_stats', 'set_stats', 'completion_snapshots')
+
+
+class AnalyticsMaintenance:
+    """
+    Keeps analytics.db bounded: expires old analyses, trims price history and
+    compacts the file.
+
+    Each analysis is deleted by its own write job: the writer thread
+    commits them in bounded groups, between which queued dashboard saves
+    get their turn. Queries are keyed by
+    collection id or by (name, day), so their latency does not depend on how
+    much history is kept; retention bounds the file size and the cost of
+    whole-table statements (backups, exports, ANALYZE).
+    """
+
+    def __init__(self, db_path='analytics.db', policy=None, archive_folder='analytics_archive',
+                 interval_seconds=24 * 3600):
+        """
+        Args:
+            db_path (str): Analytics database
+            policy (dict): Overrides for DEFAULT_POLICY; None disables a limit
+            archive_folder (str): Where archives of deleted rows are written
+            interval_seconds (int): Pause between background runs
+        """
+        self.db = get_connection_manager(db_path)
+        self.policy = dict(DEFAULT_POLICY, **(policy or {}))
+        self.archive_folder = archive_folder
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self._metrics = {
+            'runs': 0,
+            'collections_deleted': 0,
+            'price_rows_deleted': 0,
+            'pages_vacuumed': 0,
+            'last_run': None,
+            'last_result': None
+        }
+
+    def start(self):
+        """Run maintenance periodically in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def run_maintenance():
+            while not self._stop_event.wait(self.interval_seconds):
+                try:
+                    self.run()
+                except Exception as e:
+                    logging.error(f"Analytics maintenance failed: {e}")
+
+        self._thread = threading.Thread(target=run_maintenance, name='analytics-maintenance', daemon=True)
+        self._thread.start()
+        logging.info(f"Analytics maintenance started (every {self.interval_seconds}s)")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        logging.info("Analytics maintenance stopped")
+
+    def expired_collections(self, now=None):
+        """Ids of the analyses the retention policy expires, oldest first"""
+        policy = self.policy
+        cutoff = None
+        if policy.get('max_age_days') is not None:
+            cutoff = ((now or datetime.utcnow()) - timedelta(days=policy['max_age_days'])).strftime('%Y-%m-%d %H:%M:%S')
+
+        with self.db.read() as conn:
+            rows = conn.execute("""
+                SELECT id FROM (
+                    SELECT id, created_at,
+                           ROW_NUMBER() OVER (PARTITION BY name ORDER BY id DESC) AS recency
+                    FROM collections
+                )
+                WHERE recency > :min_keep
+                  AND ((:keep IS NOT NULL AND recency > :keep)
+                       OR (:cutoff IS NOT NULL AND created_at < :cutoff))
+                ORDER BY id
+            """, {
+                'min_keep': policy.get('min_keep') or 0,
+                'keep': policy.get('keep_per_collection'),
+                'cutoff': cutoff
+            }).fetchall()
+        return [row[0] for row in rows]
+
+    def _archive_path(self, kind):
+        os.makedirs(self.archive_folder, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return os.path.join(self.archive_folder, f"{kind}_{stamp}.jsonl.gz")
+
+    def archive_collections(self, collection_ids):
+        """
+        Write the analyses to a gzip JSON-lines file, one line per analysis.
+
+        Returns:
+            str: Archive path (None when there was nothing to archive)
+        """
+        if not collection_ids:
+            return None
+        path = self._archive_path('collections')
+        with gzip.open(path, 'wt', encoding='utf-8') as archive:
+            for collection_id in collection_ids:
+                with self.db.read() as conn:
+                    record = self._collection_record(conn, collection_id)
+                if record is not None:
+                    archive.write(json.dumps(record) + '\n')
+        return path
+
+    @staticmethod
+    def _collection_record(conn, collection_id):
+        row = conn.execute("""
+            SELECT id, name, created_at, file_count, total_items, completion_percentage
+            FROM collections WHERE id = ?
+        """, (collection_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'type': 'collection',
+            'collection': dict(zip(('id', 'name', 'created_at', 'file_count', 'total_items',
+                                    'completion_percentage'), row)),
+            # Same columns as the items view, resolved from the dimensions
+            'items_columns': ['item_id', 'item_type', 'color_id', 'category', 'source_file',
+                              'min_qty', 'qty_filled', 'price'],
+            'items': conn.execute("""
+                SELECT p.item_id, p.item_type, co.color_id, ca.name, s.source_file,
+                       f.min_qty, f.qty_filled, f.price
+                FROM item_facts f
+                LEFT JOIN parts p ON p.id = f.part_key
+                LEFT JOIN colors co ON co.id = f.color_key
+                LEFT JOIN categories ca ON ca.id = f.category_key
+                LEFT JOIN source_sets s ON s.id = f.set_key
+                WHERE f.collection_id = ?
+                ORDER BY f.id
+            """, (collection_id,)).fetchall(),
+            'color_stats': conn.execute("""
+                SELECT color_id, total_pieces, owned_pieces, missing_pieces, completion_rate
+                FROM color_stats WHERE collection_id = ?
+            """, (collection_id,)).fetchall()
+        }
+
+    @staticmethod
+    def _delete_collection(conn, collection_id):
+        for table in COLLECTION_TABLES:
+            conn.execute(f"DELETE FROM {table} WHERE collection_id = ?", (collection_id,))
+        return conn.execute("DELETE FROM collections WHERE id = ?", (collection_id,)).rowcount
+
+    def delete_collections(self, collection_ids):
+        """Delete analyses and their per-analysis rows, one write job each (group-committed)"""
+        futures = [self.db.submit(self._delete_collection, collection_id) for collection_id in collection_ids]
+        return sum(future.result() for future in futures)
+
+    def trim_price_history(self, archive=True, batch_size=5000):
+        """
+        Archive and delete price_history rows older than the policy allows.
+
+        Returns:
+            tuple: (rows deleted, archive path or None)
+        """
+        days = self.policy.get('price_history_days')
+        if days is None:
+            return 0, None
+        cutoff = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+
+        path = None
+        if archive:
+            with self.db.read() as conn:
+                rows = conn.execute("""
+                    SELECT id, item_key, price, currency, date_recorded FROM price_history
+                    WHERE date_recorded < ? ORDER BY date_recorded
+                """, (cutoff,))
+                first = rows.fetchone()
+                if first is not None:
+                    path = self._archive_path('price_history')
+                    with gzip.open(path, 'wt', encoding='utf-8') as out:
+                        for row in [first] + rows.fetchall():
+                            out.write(json.dumps(dict(zip(
+                                ('id', 'item_key', 'price', 'currency', 'date_recorded'), row
+                            ), type='price')) + '\n')
+
+        deleted = 0
+        while True:
+            with self.db.write() as conn:
+                count = conn.execute("""
+                    DELETE FROM price_history WHERE id IN (
+                        SELECT id FROM price_history WHERE date_recorded < ?
+                        ORDER BY date_recorded LIMIT ?
+                    )
+                """, (cutoff, batch_size)).rowcount
+            deleted += count
+            if count < batch_size:
+                return deleted, path
+
+    def compact(self, full=False):
+        """
+        Reclaim free pages and refresh planner statistics.
+
+        Incremental vacuum needs auto_vacuum=INCREMENTAL, which new databases
+        get on creation; an older database is converted once by `full=True`
+        (a blocking VACUUM that rewrites the whole file).
+
+        Returns:
+            int: Pages returned to the filesystem
+        """
+        def vacuum(conn):
+            if full:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                before = conn.execute("PRAGMA page_count").fetchone()[0]
+                conn.execute("VACUUM")
+                freed = before - conn.execute("PRAGMA page_count").fetchone()[0]
+            elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                pages = min(free_pages, self.policy.get('vacuum_pages') or free_pages)
+                # The pragma frees one page per step; executescript() steps it to completion
+                conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+                freed = free_pages - conn.execute("PRAGMA freelist_count").fetchone()[0]
+            else:
+                freed = 0
+                logging.info("analytics.db has no incremental auto-vacuum; run "
+                             "'python analytics_maintenance.py --vacuum-full' once to enable it")
+
+            # Re-analyze only the tables whose statistics drifted, with a bounded cost
+            conn.execute("PRAGMA analysis_limit = 1000")
+            conn.execute("PRAGMA optimize")
+            # Keep the WAL from growing after large deletes
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            return freed
+
+        # VACUUM and the checkpoint cannot run inside a transaction: run them on the
+        # writer thread between two groups rather than next to it
+        return self.db.execute_exclusive(vacuum)
+
+    def run(self, dry_run=False, full_vacuum=False):
+        """
+        One maintenance pass: expire, archive, delete, trim price history, compact.
+
+        Returns:
+            dict: What was (or, with dry_run, would be) removed
+        """
+        with self._run_lock:
+            started = time.time()
+            expired = self.expired_collections()
+            result = {
+                'expired_collections': expired,
+                'collections_deleted': 0,
+                'price_rows_deleted': 0,
+                'pages_vacuumed': 0,
+                'archives': [],
+                'dry_run': dry_run
+            }
+            if dry_run:
+                return result
+
+            archive = self.policy.get('archive', True)
+            if archive:
+                path = self.archive_collections(expired)
+                if path:
+                    result['archives'].append(path)
+            result['collections_deleted'] = self.delete_collections(expired)
+
+            result['price_rows_deleted'], path = self.trim_price_history(archive=archive)
+            if path:
+                result['archives'].append(path)
+
+            result['pages_vacuumed'] = self.compact(full=full_vacuum)
+            result['seconds'] = round(time.time() - started, 2)
+
+            self._metrics['runs'] += 1
+            self._metrics['collections_deleted'] += result['collections_deleted']
+            self._metrics['price_rows_deleted'] += result['price_rows_deleted']
+            self._metrics['pages_vacuumed'] += result['pages_vacuumed']
+            self._metrics['last_run'] = datetime.fromtimestamp(started).isoformat()
+            self._metrics['last_result'] = result
+
+            if result['collections_deleted'] or result['price_rows_deleted']:
+                logging.info(f"Analytics maintenance removed {result['collections_deleted']} analyses "
+                             f"and {result['price_rows_deleted']} price rows, "
+                             f"vacuumed {result['pages_vacuumed']} pages")
+            return result
+
+    def metrics(self):
+        """Return cumulative maintenance metrics"""
+        with self._run_lock:
+            metrics = dict(self._metrics)
+            metrics['running'] = bool(self._thread and self._thread.is_alive())
+            metrics['policy'] = self.policy
+            return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analytics database retention, archival and compaction')
+    parser.add_argument('db_path', nargs='?', default='analytics.db')
+    parser.add_argument('--max-age-days', type=int, default=DEFAULT_POLICY['max_age_days'])
+    parser.add_argument('--keep', type=int, default=DEFAULT_POLICY['keep_per_collection'],
+                        help='Saves kept per collection name')
+    parser.add_argument('--price-history-days', type=int, default=DEFAULT_POLICY['price_history_days'])
+    parser.add_argument('--archive-folder', default='analytics_archive')
+    parser.add_argument('--no-archive', action='store_true', help='Delete without writing archives')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the analyses that would expire')
+    parser.add_argument('--vacuum-full', action='store_true',
+                        help='Rewrite the file once to enable incremental vacuum')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Creating the analytics object applies pending schema migrations
+    from dashboard import DashboardAnalytics
+    DashboardAnalytics(args.db_path)
+
+    maintenance = AnalyticsMaintenance(args.db_path, policy={
+        'max_age_days': args.max_age_days,
+        'keep_per_collection': args.keep,
+        'price_history_days': args.price_history_days,
+        'archive': not args.no_archive
+    }, archive_folder=args.archive_folder)
+    result = maintenance.run(dry_run=args.dry_run, full_vacuum=args.vacuum_full)
+
+    print(f"Expired analyses: {len(result['expired_collections'])}"
+          + (' (dry run)' if args.dry_run else ''))
+    if not args.dry_run:
+        print(f"Deleted analyses: {result['collections_deleted']}, price rows: {result['price_rows_deleted']}, "
+              f"pages vacuumed: {result['pages_vacuumed']}")
+        for path in result['archives']:
+            print(f"Archive: {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,479 @@
+"""
+Analytics Schema Migrations for LEGO Analysis System
+Versioned schema changes for analytics.db and query plan checks for its access paths
+
+Usage:
+    python analytics_schema.py [analytics.db] --check-plans
+
+The schema version is kept in `PRAGMA user_version`. Each migration runs in
+its own transaction and bumps the version, so a database created by any
+earlier release is brought up to date on startup.
+"""
+
+import sys
+import sqlite3
+import logging
+import argparse
+
+
+# (version, description, statements); append only, never edit a released step
+MIGRATIONS = [
+    (1, "Indexes for collection_id filters and missing-part lookups", [
+        # Category distribution and the weekly summary's per-collection counts
+        """CREATE INDEX IF NOT EXISTS idx_items_collection_category
+           ON items (collection_id, category, min_qty, qty_filled)""",
+        # Missing parts only: small partial index, covering the top-missing queries
+        """CREATE INDEX IF NOT EXISTS idx_items_missing
+           ON items (collection_id, min_qty DESC, item_id, color_id, category, source_file)
+           WHERE min_qty > 0""",
+        # Color distribution ordered by size, covering
+        """CREATE INDEX IF NOT EXISTS idx_color_stats_collection
+           ON color_stats (collection_id, total_pieces DESC, color_id, owned_pieces,
+                           missing_pieces, completion_rate)""",
+        """CREATE INDEX IF NOT EXISTS idx_price_history_item
+           ON price_history (item_key, date_recorded)""",
+        "ANALYZE"
+    ]),
+    (2, "Normalize items into part/color/category/source set dimensions and an integer fact table", [
+        # Dimensions: each distinct value stored once, append-only
+        """CREATE TABLE IF NOT EXISTS parts (
+               id INTEGER PRIMARY KEY,
+               item_id TEXT NOT NULL,
+               item_type TEXT NOT NULL,
+               UNIQUE (item_id, item_type))""",
+        """CREATE TABLE IF NOT EXISTS colors (
+               id INTEGER PRIMARY KEY,
+               color_id TEXT NOT NULL UNIQUE,
+               color_name TEXT)""",
+        """CREATE TABLE IF NOT EXISTS categories (
+               id INTEGER PRIMARY KEY,
+               name TEXT NOT NULL UNIQUE)""",
+        """CREATE TABLE IF NOT EXISTS source_sets (
+               id INTEGER PRIMARY KEY,
+               source_file TEXT NOT NULL UNIQUE)""",
+        # One compact row per item per collection. The *_key columns are
+        # assigned by the save path; declaring them as foreign keys would add
+        # four parent lookups to every inserted row
+        """CREATE TABLE IF NOT EXISTS item_facts (
+               id INTEGER PRIMARY KEY,
+               collection_id INTEGER REFERENCES collections (id),
+               part_key INTEGER,
+               color_key INTEGER,
+               category_key INTEGER,
+               set_key INTEGER,
+               min_qty INTEGER,
+               qty_filled INTEGER,
+               price REAL)""",
+        """INSERT OR IGNORE INTO parts (item_id, item_type)
+           SELECT DISTINCT item_id, COALESCE(item_type, 'P') FROM items WHERE item_id IS NOT NULL""",
+        """INSERT OR IGNORE INTO colors (color_id, color_name)
+           SELECT color_id, MAX(color_name) FROM items WHERE color_id IS NOT NULL GROUP BY color_id""",
+        """INSERT OR IGNORE INTO categories (name)
+           SELECT DISTINCT category FROM items WHERE category IS NOT NULL""",
+        """INSERT OR IGNORE INTO source_sets (source_file)
+           SELECT DISTINCT source_file FROM items WHERE source_file IS NOT NULL""",
+        """INSERT INTO item_facts (id, collection_id, part_key, color_key, category_key, set_key,
+                                   min_qty, qty_filled, price)
+           SELECT i.id, i.collection_id, p.id, co.id, ca.id, s.id, i.min_qty, i.qty_filled, i.price
+           FROM items i
+           LEFT JOIN parts p ON p.item_id = i.item_id AND p.item_type = COALESCE(i.item_type, 'P')
+           LEFT JOIN colors co ON co.color_id = i.color_id
+           LEFT JOIN categories ca ON ca.name = i.category
+           LEFT JOIN source_sets s ON s.source_file = i.source_file""",
+        "DROP TABLE items",
+        # Read-only compatibility view with the old column layout for ad-hoc
+        # queries; it joins every dimension, so hot paths read item_facts directly
+        """CREATE VIEW items AS
+           SELECT f.id, f.collection_id, p.item_id, p.item_type, co.color_id, co.color_name,
+                  f.min_qty, f.qty_filled, ca.name AS category, f.price, s.source_file
+           FROM item_facts f
+           LEFT JOIN parts p ON p.id = f.part_key
+           LEFT JOIN colors co ON co.id = f.color_key
+           LEFT JOIN categories ca ON ca.id = f.category_key
+           LEFT JOIN source_sets s ON s.id = f.set_key""",
+        """CREATE INDEX IF NOT EXISTS idx_item_facts_collection_category
+           ON item_facts (collection_id, category_key, min_qty, qty_filled)""",
+        """CREATE INDEX IF NOT EXISTS idx_item_facts_missing
+           ON item_facts (collection_id, min_qty DESC, part_key, color_key, set_key, category_key)
+           WHERE min_qty > 0""",
+        "ANALYZE"
+    ]),
+    (3, "Completion snapshots per collection, set and color with daily rollups", [
+        # One row per saved analysis and scope: 'collection' (scope_key 0),
+        # 'set' (source_sets.id) or 'color' (colors.id); day is the UTC save date
+        """CREATE TABLE IF NOT EXISTS completion_snapshots (
+               id INTEGER PRIMARY KEY,
+               collection_id INTEGER REFERENCES collections (id),
+               collection_name TEXT NOT NULL,
+               day TEXT NOT NULL,
+               scope TEXT NOT NULL,
+               scope_key INTEGER NOT NULL,
+               total_pieces INTEGER,
+               owned_pieces INTEGER,
+               missing_pieces INTEGER)""",
+        """CREATE INDEX IF NOT EXISTS idx_completion_snapshots_collection
+           ON completion_snapshots (collection_id)""",
+        # Latest snapshot of each day, updated incrementally by every save
+        """CREATE TABLE IF NOT EXISTS daily_completion (
+               collection_name TEXT NOT NULL,
+               scope TEXT NOT NULL,
+               scope_key INTEGER NOT NULL,
+               day TEXT NOT NULL,
+               total_pieces INTEGER,
+               owned_pieces INTEGER,
+               missing_pieces INTEGER,
+               snapshot_count INTEGER NOT NULL,
+               last_collection_id INTEGER,
+               PRIMARY KEY (collection_name, scope, scope_key, day)
+           ) WITHOUT ROWID""",
+        # Re-analyses of a collection share its name
+        """CREATE INDEX IF NOT EXISTS idx_collections_name ON collections (name, id)""",
+        # Backfill from the analyses saved so far
+        """INSERT INTO completion_snapshots (collection_id, collection_name, day, scope, scope_key,
+                                            total_pieces, owned_pieces, missing_pieces)
+           SELECT c.id, c.name, date(c.created_at), 'collection', 0,
+                  SUM(f.min_qty + f.qty_filled), SUM(f.qty_filled), SUM(f.min_qty)
+           FROM collections c JOIN item_facts f ON f.collection_id = c.id
+           GROUP BY c.id""",
+        """INSERT INTO completion_snapshots (collection_id, collection_name, day, scope, scope_key,
+                                            total_pieces, owned_pieces, missing_pieces)
+           SELECT c.id, c.name, date(c.created_at), 'set', f.set_key,
+                  SUM(f.min_qty + f.qty_filled), SUM(f.qty_filled), SUM(f.min_qty)
+           FROM collections c JOIN item_facts f ON f.collection_id = c.id
+           WHERE f.set_key IS NOT NULL
+           GROUP BY c.id, f.set_key""",
+        """INSERT INTO completion_snapshots (collection_id, collection_name, day, scope, scope_key,
+                                            total_pieces, owned_pieces, missing_pieces)
+           SELECT c.id, c.name, date(c.created_at), 'color', f.color_key,
+                  SUM(f.min_qty + f.qty_filled), SUM(f.qty_filled), SUM(f.min_qty)
+           FROM collections c JOIN item_facts f ON f.collection_id = c.id
+           WHERE f.color_key IS NOT NULL
+           GROUP BY c.id, f.color_key""",
+        """INSERT INTO daily_completion (collection_name, scope, scope_key, day, total_pieces,
+                                        owned_pieces, missing_pieces, snapshot_count, last_collection_id)
+           SELECT collection_name, scope, scope_key, day, total_pieces, owned_pieces,
+                  missing_pieces, snapshot_count, collection_id
+           FROM (
+               SELECT s.*, COUNT(*) OVER day_window AS snapshot_count,
+                      ROW_NUMBER() OVER (day_window ORDER BY collection_id DESC) AS newest
+               FROM completion_snapshots s
+               WINDOW day_window AS (PARTITION BY collection_name, scope, scope_key, day)
+           )
+           WHERE newest = 1""",
+        "ANALYZE"
+    ]),
+    (4, "Materialized per-collection category and source set aggregates", [
+        """CREATE TABLE IF NOT EXISTS category_stats (
+               id INTEGER PRIMARY KEY,
+               collection_id INTEGER REFERENCES collections (id),
+               category_key INTEGER,
+               item_count INTEGER,
+               total_pieces INTEGER,
+               owned_pieces INTEGER,
+               missing_pieces INTEGER)""",
+        """CREATE TABLE IF NOT EXISTS set_stats (
+               id INTEGER PRIMARY KEY,
+               collection_id INTEGER REFERENCES collections (id),
+               set_key INTEGER,
+               item_count INTEGER,
+               total_pieces INTEGER,
+               owned_pieces INTEGER,
+               missing_pieces INTEGER,
+               completion_rate REAL)""",
+        # Dashboard order (largest first), covering
+        """CREATE INDEX IF NOT EXISTS idx_category_stats_collection
+           ON category_stats (collection_id, total_pieces DESC, category_key, item_count,
+                              owned_pieces, missing_pieces)""",
+        """CREATE INDEX IF NOT EXISTS idx_set_stats_collection
+           ON set_stats (collection_id, total_pieces DESC, set_key, item_count, owned_pieces,
+                         missing_pieces, completion_rate)""",
+        """INSERT INTO category_stats (collection_id, category_key, item_count, total_pieces,
+                                       owned_pieces, missing_pieces)
+           SELECT collection_id, category_key, COUNT(*), SUM(min_qty + qty_filled),
+                  SUM(qty_filled), SUM(min_qty)
+           FROM item_facts GROUP BY collection_id, category_key""",
+        """INSERT INTO set_stats (collection_id, set_key, item_count, total_pieces, owned_pieces,
+                                  missing_pieces, completion_rate)
+           SELECT collection_id, set_key, COUNT(*), SUM(min_qty + qty_filled), SUM(qty_filled),
+                  SUM(min_qty),
+                  CASE WHEN SUM(min_qty + qty_filled) > 0
+                       THEN SUM(qty_filled) * 100.0 / SUM(min_qty + qty_filled) ELSE 0 END
+           FROM item_facts GROUP BY collection_id, set_key""",
+        "ANALYZE"
+    ]),
+    (5, "Covering index for diffs between two analyses keyed by part, color and source set", [
+        """CREATE INDEX IF NOT EXISTS idx_item_facts_diff
+           ON item_facts (collection_id, part_key, color_key, set_key, min_qty, qty_filled)""",
+        # Category totals are materialized since version 4; whole-collection
+        # scans can use the diff index, so this one only slowed down saves
+        "DROP INDEX IF EXISTS idx_item_facts_collection_category",
+        "ANALYZE"
+    ]),
+    (6, "Index price history by date for the retention trim", [
+        "CREATE INDEX IF NOT EXISTS idx_price_history_recorded ON price_history (date_recorded)"
+    ]),
+    (7, "Indexes for keyset pagination of a collection's items", [
+        # The rowid is the implicit last column of every index: collection_id = ?
+        # AND id > ? ORDER BY id is a range scan starting at the cursor
+        "CREATE INDEX IF NOT EXISTS idx_item_facts_page ON item_facts (collection_id)",
+        # (min_qty, id) order for "most missing first" pages; the keys the old
+        # covering version carried are cheap row lookups for the short lists
+        # that read them (top missing items, email digests)
+        "DROP INDEX IF EXISTS idx_item_facts_missing",
+        """CREATE INDEX IF NOT EXISTS idx_item_facts_missing
+           ON item_facts (collection_id, min_qty) WHERE min_qty > 0""",
+        "ANALYZE"
+    ]),
+    (8, "Search terms (one per part and color ever stored) and their text for the item search", [
+        # Append-only like the dimensions; the category is a property of the part
+        """CREATE TABLE IF NOT EXISTS search_terms (
+               id INTEGER PRIMARY KEY,
+               part_key INTEGER NOT NULL,
+               color_key INTEGER NOT NULL,
+               category_key INTEGER,
+               UNIQUE (part_key, color_key)
+           )""",
+        """INSERT OR IGNORE INTO search_terms (part_key, color_key, category_key)
+           SELECT part_key, color_key, MIN(category_key) FROM item_facts
+           WHERE part_key IS NOT NULL AND color_key IS NOT NULL
+           GROUP BY part_key, color_key""",
+        # Content of the FTS5 index (see create_search_index) and of the LIKE fallback
+        """CREATE VIEW IF NOT EXISTS item_search_docs AS
+           SELECT t.id, p.item_id, co.color_name AS color, ca.name AS category
+           FROM search_terms t
+           JOIN parts p ON p.id = t.part_key
+           LEFT JOIN colors co ON co.id = t.color_key
+           LEFT JOIN categories ca ON ca.id = t.category_key"""
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Apply pending migrations to an open connection.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    applied = []
+    current = get_schema_version(conn)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            # Take the write lock first, then re-read: another process may have
+            # applied this migration while we waited for it
+            conn.execute("BEGIN IMMEDIATE")
+            current = get_schema_version(conn)
+            if version <= current:
+                conn.execute("COMMIT")
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logging.error(f"Analytics schema migration {version} failed: {description}")
+            raise
+        applied.append(version)
+        logging.info(f"Applied analytics schema migration {version}: {description}")
+    return applied
+
+
+def create_search_index(conn):
+    """
+    Create the FTS5 index over item_search_docs, filling it on first creation.
+
+    FTS5 is a compile-time option of SQLite, so the index lives outside the
+    migrations: without it the search falls back to LIKE over the same view.
+
+    Returns:
+        bool: True if the FTS5 index is available
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'item_search'"
+    ).fetchone()
+    if exists:
+        return True
+    try:
+        conn.execute("""
+            CREATE VIRTUAL TABLE item_search USING fts5(
+                item_id, color, category,
+                content = 'item_search_docs', content_rowid = 'id'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        logging.warning(f"FTS5 not available, item search uses LIKE: {e}")
+        return False
+    conn.execute("INSERT INTO item_search (item_search) VALUES ('rebuild')")
+    return True
+
+
+# Hot queries and the index each one must use: (name, sql, params, expected index)
+ACCESS_PATHS = [
+    ("dashboard_color_stats",
+     """SELECT color_id, total_pieces, owned_pieces, missing_pieces, completion_rate
+        FROM color_stats WHERE collection_id = ? ORDER BY total_pieces DESC""",
+     (1,), "idx_color_stats_collection"),
+    ("dashboard_category_stats",
+     """SELECT ca.name, cs.item_count, cs.total_pieces
+        FROM category_stats cs LEFT JOIN categories ca ON ca.id = cs.category_key
+        WHERE cs.collection_id = ? ORDER BY cs.total_pieces DESC""",
+     (1,), "idx_category_stats_collection"),
+    ("dashboard_set_stats",
+     """SELECT s.source_file, st.item_count, st.total_pieces, st.owned_pieces,
+               st.missing_pieces, st.completion_rate
+        FROM set_stats st LEFT JOIN source_sets s ON s.id = st.set_key
+        WHERE st.collection_id = ? ORDER BY st.total_pieces DESC""",
+     (1,), "idx_set_stats_collection"),
+    ("dashboard_missing_items",
+     """SELECT p.item_id, co.color_id, f.min_qty, s.source_file
+        FROM item_facts f
+        LEFT JOIN parts p ON p.id = f.part_key
+        LEFT JOIN colors co ON co.id = f.color_key
+        LEFT JOIN source_sets s ON s.id = f.set_key
+        WHERE f.collection_id = ? AND f.min_qty > 0 ORDER BY f.min_qty DESC LIMIT 20""",
+     (1,), "idx_item_facts_missing"),
+    ("dashboard_compare_top_colors",
+     """SELECT c.id, c.name, c.completion_percentage, cs.color_id, cs.completion_rate
+        FROM collections c
+        LEFT JOIN color_stats cs ON cs.rowid IN (
+            SELECT top.rowid FROM color_stats top WHERE top.collection_id = c.id
+            ORDER BY top.total_pieces DESC LIMIT ?)
+        WHERE c.id IN (SELECT value FROM json_each(?))""",
+     (10, '[1, 2]'), "idx_color_stats_collection"),
+    ("dashboard_progress_timeline",
+     """SELECT day, total_pieces, owned_pieces, snapshot_count FROM daily_completion
+        WHERE collection_name = ? AND scope = ? AND scope_key = ?
+        ORDER BY day DESC LIMIT ?""",
+     ('Collection', 'collection', 0, 30), "PRIMARY KEY"),
+    ("dashboard_latest_snapshot",
+     """SELECT MAX(id) FROM collections WHERE name = ?""",
+     ('Collection',), "idx_collections_name"),
+    ("dashboard_collection_diff",
+     """SELECT part_key, color_key, set_key,
+               SUM(CASE WHEN collection_id = ? THEN qty_filled END) AS old_owned,
+               SUM(CASE WHEN collection_id = ? THEN qty_filled END) AS new_owned
+        FROM item_facts WHERE collection_id IN (?, ?)
+        GROUP BY part_key, color_key, set_key""",
+     (1, 2, 1, 2), "idx_item_facts_diff"),
+    ("dashboard_items_page",
+     """SELECT f.id, p.item_id, co.color_id, f.min_qty
+        FROM item_facts f
+        LEFT JOIN parts p ON p.id = f.part_key
+        LEFT JOIN colors co ON co.id = f.color_key
+        WHERE f.collection_id = ? AND f.id > ? AND f.color_key = ?
+        ORDER BY f.id LIMIT ?""",
+     (1, 1000, 1, 101), "idx_item_facts_page"),
+    ("dashboard_items_page_missing",
+     """SELECT f.id, p.item_id, co.color_id, f.min_qty
+        FROM item_facts f
+        LEFT JOIN parts p ON p.id = f.part_key
+        LEFT JOIN colors co ON co.id = f.color_key
+        WHERE f.collection_id = ? AND f.min_qty > 0 AND (f.min_qty, f.id) < (?, ?)
+        ORDER BY f.min_qty DESC, f.id DESC LIMIT ?""",
+     (1, 4, 1000, 101), "idx_item_facts_missing"),
+    ("dashboard_search_items",
+     """SELECT c.id, f.set_key, t.id, f.min_qty, f.qty_filled
+        FROM json_each(?) matched
+        CROSS JOIN search_terms t ON t.id = matched.value
+        CROSS JOIN collections c ON c.id IN (SELECT MAX(id) FROM collections GROUP BY name)
+        CROSS JOIN item_facts f ON f.collection_id = c.id AND f.part_key = t.part_key
+                               AND f.color_key = t.color_key""",
+     ('[1, 2]',), "idx_item_facts_diff"),
+    ("maintenance_price_history_trim",
+     """SELECT id FROM price_history WHERE date_recorded < ?
+        ORDER BY date_recorded LIMIT ?""",
+     ('2024-01-01', 5000), "idx_price_history_recorded"),
+    ("email_missing_counts",
+     """SELECT c.id, c.name, COUNT(f.id) as missing_count
+        FROM collections c JOIN item_facts f ON c.id = f.collection_id
+        WHERE f.min_qty > 0 GROUP BY c.id, c.name HAVING missing_count >= ?""",
+     (5,), "idx_item_facts_missing"),
+    ("email_missing_items",
+     """SELECT p.item_id, co.color_id, f.min_qty, ca.name
+        FROM item_facts f
+        LEFT JOIN parts p ON p.id = f.part_key
+        LEFT JOIN colors co ON co.id = f.color_key
+        LEFT JOIN categories ca ON ca.id = f.category_key
+        WHERE f.collection_id = ? AND f.min_qty > 0 ORDER BY f.min_qty DESC LIMIT 50""",
+     (1,), "idx_item_facts_missing"),
+    ("email_weekly_summary",
+     """SELECT c.id, c.name, c.total_items, c.completion_percentage,
+               COUNT(f.id) as missing_count
+        FROM collections c LEFT JOIN item_facts f ON c.id = f.collection_id AND f.min_qty > 0
+        GROUP BY c.id, c.name, c.total_items, c.completion_percentage""",
+     (), "idx_item_facts_missing"),
+]
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn, access_paths=None):
+    """
+    Verify every hot query is answered through its expected index.
+
+    Returns:
+        list: One dict per access path with 'name', 'ok', 'expected_index'
+            and the 'plan' lines; 'ok' is False when the index is not used
+            or the plan contains a full table scan of the item facts or color_stats
+    """
+    results = []
+    for name, sql, params, expected_index in (access_paths or ACCESS_PATHS):
+        plan = explain(conn, sql, params)
+        uses_index = any(expected_index in line for line in plan)
+        full_scan = any(
+            line.startswith(f"SCAN {table}") and 'INDEX' not in line
+            for line in plan for table in ('item_facts', 'f', 'items', 'i', 'color_stats')
+        )
+        results.append({
+            'name': name,
+            'ok': uses_index and not full_scan,
+            'expected_index': expected_index,
+            'plan': plan
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analytics database schema tools')
+    parser.add_argument('db_path', nargs='?', default='analytics.db')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='Fail unless every hot query uses its expected index')
+    args = parser.parse_args(argv)
+
+    # Creating the analytics object applies the base schema and all migrations
+    from dashboard import DashboardAnalytics
+    DashboardAnalytics(args.db_path)
+
+    conn = sqlite3.connect(args.db_path)
+    try:
+        print(f"Schema version: {get_schema_version(conn)} (latest {SCHEMA_VERSION})")
+        if not args.check_plans:
+            return 0
+
+        failures = 0
+        for result in check_query_plans(conn):
+            status = 'OK  ' if result['ok'] else 'FAIL'
+            print(f"{status} {result['name']} (expects {result['expected_index']})")
+            for line in result['plan']:
+                print(f"       {line}")
+            failures += not result['ok']
+        return 1 if failures else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Analytics Database Benchmark for LEGO Analysis System
+Rows per second and database size of DashboardAnalytics.save_collection_analysis, before and after
+
+Usage:
+    python benchmark_analytics.py [--items 40000] [--files 20] [--snapshots 5] [--runs 3]
+
+"before" replays the original implementation (one INSERT per item and per
+color stat into the original denormalized `items` table and its indexes,
+rollback-journal mode, default pragmas); "after" is the current save_collection_analysis
+(batched, normalized fact table). Each run saves `snapshots` analyses of the
+same collection into a fresh database in a temp folder, as repeated
+re-analysis does.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+from dashboard import DashboardAnalytics
+from analytics_schema import MIGRATIONS
+
+
+def make_analysis_data(item_count, file_count, seed=42):
+    """Synthetic analysis_data shaped like the parser output"""
+    rng = random.Random(seed)
+    categories = ['Brick', 'Plate', 'Tile', 'Slope', 'Technic', 'Minifig', 'Other']
+    per_file = max(1, item_count // file_count)
+    data = {}
+    for file_index in range(file_count):
+        source_file = f"set_{file_index:03d}.xml"
+        items = []
+        for _ in range(per_file):
+            min_qty = rng.choice([0, 0, 1, 2, 4])
+            items.append({
+                'item_id': str(rng.randint(2000, 99999)),
+                'item_type': 'P',
+                'color': str(rng.randint(1, 160)),
+                'min_qty': min_qty,
+                'qty_filled': rng.randint(0, 8),
+                'category': rng.choice(categories),
+                'source_file': source_file
+            })
+        data[source_file] = {'items': items, 'count': len(items), 'format': 'XML'}
+    return data
+
+
+def legacy_save(db_path, collection_name, analysis_data):
+    """The original row-at-a-time save, kept only as the benchmark baseline"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = DELETE")
+    cursor = conn.cursor()
+    try:
+        total_items = sum(len(data['items']) for data in analysis_data.values())
+        total_pieces = sum(i['min_qty'] + i['qty_filled'] for d in analysis_data.values() for i in d['items'])
+        owned_pieces = sum(i['qty_filled'] for d in analysis_data.values() for i in d['items'])
+        completion = (owned_pieces / total_pieces * 100) if total_pieces > 0 else 0
+        cursor.execute("""
+            INSERT INTO collections (name, file_count, total_items, completion_percentage)
+            VALUES (?, ?, ?, ?)
+        """, (collection_name, len(analysis_data), total_items, completion))
+        collection_id = cursor.lastrowid
+
+        color_stats = {}
+        for file_data in analysis_data.values():
+            for item in file_data['items']:
+                cursor.execute("""
+                    INSERT INTO items (collection_id, item_id, item_type, color_id,
+                                     min_qty, qty_filled, category, source_file)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (collection_id, item['item_id'], item['item_type'], item['color'],
+                      item['min_qty'], item['qty_filled'], item['category'], item['source_file']))
+                stats = color_stats.setdefault(item['color'], [0, 0, 0])
+                stats[0] += item['min_qty'] + item['qty_filled']
+                stats[1] += item['qty_filled']
+                stats[2] += item['min_qty']
+
+        for color_id, (total, owned, missing) in color_stats.items():
+            cursor.execute("""
+                INSERT INTO color_stats (collection_id, color_id, total_pieces,
+                                       owned_pieces, missing_pieces, completion_rate)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (collection_id, color_id, total, owned, missing, (owned / total * 100) if total else 0))
+        conn.commit()
+        return collection_id
+    finally:
+        conn.close()
+
+
+def legacy_schema(db_path):
+    """Fresh database in the pre-normalization layout: original tables plus the version 1 indexes"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        DashboardAnalytics._create_tables(cursor)
+        for statement in MIGRATIONS[0][2]:
+            cursor.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _time_save(save, analysis_data, runs, snapshots=1, legacy=False):
+    """Median seconds per save and the database size after the last run"""
+    timings = []
+    size = 0
+    for run in range(runs):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'analytics.db')
+            analytics = None
+            if legacy:
+                legacy_schema(db_path)
+            else:
+                analytics = DashboardAnalytics(db_path)
+                analytics.db.close_all()  # Start each run without pooled connections
+            start = time.perf_counter()
+            for snapshot in range(snapshots):
+                save(analytics, db_path, f"Benchmark {run}.{snapshot}", analysis_data)
+            timings.append((time.perf_counter() - start) / snapshots)
+            if analytics is not None:
+                analytics.db.close_all()  # Closing the last connection checkpoints the WAL
+            size = os.path.getsize(db_path)
+    return statistics.median(timings), size
+
+
+def run_benchmark(item_count=40000, file_count=20, runs=3, snapshots=5):
+    """Return rows/second and database bytes for the legacy and current save paths"""
+    analysis_data = make_analysis_data(item_count, file_count)
+    rows = sum(len(d['items']) for d in analysis_data.values())
+
+    before, before_bytes = _time_save(lambda a, path, name, data: legacy_save(path, name, data),
+                                      analysis_data, runs, snapshots, legacy=True)
+    after, after_bytes = _time_save(lambda a, path, name, data: a.save_collection_analysis(name, data),
+                                    analysis_data, runs, snapshots)
+
+    return {
+        'rows': rows,
+        'before_seconds': before,
+        'after_seconds': after,
+        'before_rows_per_second': rows / before,
+        'after_rows_per_second': rows / after,
+        'speedup': before / after,
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark analytics database saves')
+    parser.add_argument('--items', type=int, default=40000)
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--snapshots', type=int, default=5, help='Saves per run into the same database')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    result = run_benchmark(args.items, args.files, args.runs, args.snapshots)
+    print(f"save_collection_analysis, {result['rows']} items x {args.snapshots} snapshots "
+          f"(median of {args.runs} runs, size after the last)")
+    print(f"  before: {result['before_seconds']:.3f}s  {result['before_rows_per_second']:>10,.0f} rows/s"
+          f"  {result['before_bytes'] / 1024:>8,.0f} KiB")
+    print(f"  after:  {result['after_seconds']:.3f}s  {result['after_rows_per_second']:>10,.0f} rows/s"
+          f"  {result['after_bytes'] / 1024:>8,.0f} KiB")
+    print(f"  speedup: {result['speedup']:.1f}x, size: {result['after_bytes'] / result['before_bytes']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,8 @@ import logging
 from pathlib import Path
 import os
 
+from metrics import stage_timer
+
 class BrickLinkAPIError(Exception):
     """Custom exception for BrickLink API errors"""
     pass
@@ -85,14 +87,15 @@ class BrickLinkAPI:
                 'Content-Type': 'application/json'
             }
             
-            response = self.session.request(
-                method=method,
-                url=url,
-                params=params,
-                json=data,
-                headers=headers,
-                timeout=30
-            )
+            with stage_timer('bricklink'):
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    json=data,
+                    headers=headers,
+                    timeout=30
+                )
             
             if response.status_code == 200:
                 return response.json()
@@ -214,9 +217,17 @@ class BrickLinkSync:
         self.data_folder = Path(local_data_folder)
         self.data_folder.mkdir(exist_ok=True)
         
-    def download_inventories(self, save_to_xml=True):
-        """Download all inventories and save locally"""
+    def download_inventories(self, save_to_xml=True, progress=None):
+        """
+        Download all inventories and save locally
+        
+        Args:
+            save_to_xml (bool): Also save each inventory as BrickLink XML
+            progress (progress.Operation): Optional receiver of stage and batch events
+        """
         try:
+            if progress:
+                progress.stage('download', "Downloading inventories")
             inventories = self.api.get_inventories()
             
             if not inventories.get('data'):
@@ -225,7 +236,7 @@ class BrickLinkSync:
             
             saved_files = []
             
-            for inventory in inventories['data']:
+            for index, inventory in enumerate(inventories['data'], 1):
                 inventory_id = inventory['inventory_id']
                 logging.info(f"Downloading inventory {inventory_id}...")
                 
@@ -241,6 +252,9 @@ class BrickLinkSync:
                 with open(json_file, 'w', encoding='utf-8') as f:
                     json.dump(full_inventory['data'], f, indent=2)
                 
+                if progress:
+                    progress.batch(index, len(inventories['data']), f"Inventory {inventory_id}")
+                
                 # Rate limiting
                 time.sleep(1)
             
@@ -280,7 +294,7 @@ class BrickLinkSync:
         logging.info(f"Saved inventory as XML: {xml_file}")
         return xml_file
     
-    def upload_wanted_list(self, xml_file, list_name=None, replace_existing=True):
+    def upload_wanted_list(self, xml_file, list_name=None, replace_existing=True, progress=None):
         """
         Upload XML wanted list to BrickLink with advanced replacement options
         
@@ -288,11 +302,15 @@ class BrickLinkSync:
             xml_file (str): Path to XML file containing wanted list
             list_name (str): Name for the wanted list (auto-generated if None)
             replace_existing (bool): If True, replaces existing list with same name
-        
+            progress (progress.Operation): Optional receiver of stage and batch events
+
         Returns:
             dict: Information about the uploaded wanted list
         """
         try:
+            if progress:
+                progress.stage('prepare', "Preparing wanted list")
+            
             if list_name is None:
                 # Generate name from filename or timestamp
                 filename = Path(xml_file).stem
@@ -381,6 +399,9 @@ class BrickLinkSync:
             # Upload items in batches (BrickLink API has limits)
             batch_size = 100
             uploaded_batches = 0
+            total_batches = (len(items) + batch_size - 1)//batch_size
+            if progress:
+                progress.stage('upload', f"Uploading {len(items)} items in {total_batches} batches")
             
             for i in range(0, len(items), batch_size):
                 batch = items[i:i + batch_size]
@@ -388,8 +409,9 @@ class BrickLinkSync:
                     self.api.add_wanted_list_items(wanted_list_id, batch)
                     uploaded_batches += 1
                     batch_num = i//batch_size + 1
-                    total_batches = (len(items) + batch_size - 1)//batch_size
                     logging.info(f"✅ Uploaded batch {batch_num}/{total_batches} ({len(batch)} items)")
+                    if progress:
+                        progress.batch(batch_num, total_batches, f"Uploaded batch {batch_num}/{total_batches}")
                     
                     # Rate limiting - be gentle with BrickLink API
                     if batch_num < total_batches:
@@ -397,6 +419,8 @@ class BrickLinkSync:
                         
                 except Exception as e:
                     logging.error(f"Failed to upload batch {i//batch_size + 1}: {e}")
+                    if progress:
+                        progress.batch(i//batch_size + 1, total_batches, f"Batch {i//batch_size + 1} failed: {e}")
                     # Continue with remaining batches
                     time.sleep(5)  # Longer wait after error
                     continue
@@ -0,0 +1,195 @@
+"""
+Resumable Chunked Uploads for LEGO Analysis System
+Offset-based chunk protocol for large inventory exports
+"""
+
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+
+
+class ChunkedUploadError(Exception):
+    """Error raised by the chunked upload protocol, carrying an HTTP status"""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class ChunkedUploadManager:
+    """
+    Stores chunked uploads in a staging folder until they are complete.
+
+    Each upload has a `<id>.json` session file and a `<id>.part` data file.
+    Chunks are appended at an explicit offset, so a client that lost its
+    connection asks for the current offset and resumes from there. Data is
+    streamed to disk in small blocks and never held in memory as a whole.
+    """
+
+    READ_BLOCK_SIZE = 64 * 1024
+    SESSION_MAX_AGE = 24 * 3600  # Abandoned sessions are purged after one day
+
+    def __init__(self, staging_folder, max_upload_size, chunk_size=4 * 1024 * 1024):
+        self.staging_folder = staging_folder
+        self.max_upload_size = max_upload_size
+        self.chunk_size = chunk_size
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.staging_folder, exist_ok=True)
+
+    def _session_path(self, upload_id):
+        return os.path.join(self.staging_folder, f"{upload_id}.json")
+
+    def _part_path(self, upload_id):
+        return os.path.join(self.staging_folder, f"{upload_id}.part")
+
+    def _lock_for(self, upload_id):
+        with self._locks_guard:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _load_session(self, upload_id):
+        # Upload ids are generated by us; reject anything else before touching the filesystem
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise ChunkedUploadError("Invalid upload id", 404)
+        try:
+            with open(self._session_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ChunkedUploadError("Upload not found or expired", 404)
+
+    def _save_session(self, session):
+        temp_path = self._session_path(session['upload_id']) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+        os.replace(temp_path, self._session_path(session['upload_id']))
+
+    def create(self, filename, total_size, sha256=None):
+        """Start a new upload and return its session"""
+        if total_size <= 0:
+            raise ChunkedUploadError("File size must be positive")
+        if total_size > self.max_upload_size:
+            raise ChunkedUploadError(
+                f"File too large: {total_size} bytes (max {self.max_upload_size})", 413
+            )
+
+        self.purge_stale()
+
+        upload_id = uuid.uuid4().hex
+        session = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': total_size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time()
+        }
+        open(self._part_path(upload_id), 'wb').close()
+        self._save_session(session)
+        logging.info(f"Chunked upload started: {filename} ({total_size} bytes, id {upload_id})")
+        return self.status(upload_id)
+
+    def status(self, upload_id):
+        """Return the session with the current offset (bytes received so far)"""
+        session = self._load_session(upload_id)
+        session['offset'] = os.path.getsize(self._part_path(upload_id))
+        session['chunk_size'] = self.chunk_size
+        return session
+
+    def append(self, upload_id, offset, stream, length):
+        """
+        Append `length` bytes read from `stream` at `offset`.
+
+        The offset must equal the bytes already received; otherwise a 409
+        carrying the current offset is raised so the client can resume.
+        """
+        with self._lock_for(upload_id):
+            session = self._load_session(upload_id)
+            part_path = self._part_path(upload_id)
+            current = os.path.getsize(part_path)
+
+            if offset != current:
+                raise ChunkedUploadError(
+                    f"Offset mismatch: expected {current}, got {offset}", 409, offset=current
+                )
+            if length is None or length <= 0:
+                raise ChunkedUploadError("Chunk length required", 411, offset=current)
+            if current + length > session['size']:
+                raise ChunkedUploadError("Chunk exceeds declared file size", 413, offset=current)
+
+            remaining = length
+            with open(part_path, 'ab') as f:
+                while remaining > 0:
+                    block = stream.read(min(self.READ_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    f.write(block)
+                    remaining -= len(block)
+
+            # A dropped connection leaves a short chunk; the client resumes from the new offset
+            return os.path.getsize(part_path)
+
+    def complete(self, upload_id, destination_path, sha256=None):
+        """Verify size and SHA-256, then move the data file to its destination"""
+        with self._lock_for(upload_id):
+            session = self._load_session(upload_id)
+            part_path = self._part_path(upload_id)
+            received = os.path.getsize(part_path)
+
+            if received != session['size']:
+                raise ChunkedUploadError(
+                    f"Upload incomplete: {received}/{session['size']} bytes", 409, offset=received
+                )
+
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(self.READ_BLOCK_SIZE * 16), b''):
+                    digest.update(block)
+            actual = digest.hexdigest()
+
+            expected = (sha256 or session.get('sha256') or '').lower()
+            if expected and expected != actual:
+                self._discard(upload_id)
+                raise ChunkedUploadError("SHA-256 mismatch, upload discarded", 422)
+
+            shutil.move(part_path, destination_path)
+            os.remove(self._session_path(upload_id))
+            with self._locks_guard:
+                self._locks.pop(upload_id, None)
+
+            logging.info(f"Chunked upload completed: {session['filename']} -> {destination_path}")
+            return {'sha256': actual, 'size': received, 'filename': session['filename']}
+
+    def abort(self, upload_id):
+        """Cancel an upload and delete its staged data"""
+        self._load_session(upload_id)
+        with self._lock_for(upload_id):
+            self._discard(upload_id)
+
+    def _discard(self, upload_id):
+        for path in (self._part_path(upload_id), self._session_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        with self._locks_guard:
+            self._locks.pop(upload_id, None)
+
+    def purge_stale(self):
+        """Delete sessions older than SESSION_MAX_AGE"""
+        cutoff = time.time() - self.SESSION_MAX_AGE
+        for filename in os.listdir(self.staging_folder):
+            if not filename.endswith('.json'):
+                continue
+            upload_id = filename[:-len('.json')]
+            try:
+                session = self._load_session(upload_id)
+            except ChunkedUploadError:
+                continue
+            if session.get('created_at', 0) < cutoff:
+                logging.info(f"Purging abandoned chunked upload {upload_id} "
+                             f"(started {datetime.fromtimestamp(session['created_at'])})")
+                self._discard(upload_id)
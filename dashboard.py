@@ -6,27 +6,86 @@ Advanced analytics with Chart.js and real-time filtering
 from flask import Flask, render_template, request, jsonify, session
 import json
 import os
-from datetime import datetime, timedelta
-import sqlite3
+import re
+from datetime import datetime
 from pathlib import Path
 import logging
 
 # Import our analysis modules
 from LegoStatusBuildAnalysis import LegoColorReport, LegoXmlCombiner
-from input_handlers import MultiFormatInputParser
+from input_handlers import MultiFormatInputParser, get_parse_cache
 from bricklink_api import BrickLinkAPI, BrickLinkSync, BrickLinkCredentialManager
+from http_caching import make_etag, etag_matches, not_modified_response, cached_json_response
+from analytics_schema import migrate, create_search_index
+from analytics_db import get_connection_manager
+from dashboard_cache import PayloadCache
+from progress import OperationIdInUse
+
+# Progress stages of /api/bricklink/sync, per sync type
+BRICKLINK_SYNC_STAGES = {
+    'download_inventories': ['download'],
+    'upload_wanted_list': ['prepare', 'upload']
+}
 
 class DashboardAnalytics:
     """Advanced analytics for dashboard"""
     
-    def __init__(self, db_path="analytics.db"):
+    # color_stats columns a comparison matrix can show
+    MATRIX_METRICS = ('completion_rate', 'missing_pieces', 'owned_pieces', 'total_pieces')
+    
+    # Dimension tables of the normalized schema: name -> (table, natural key columns)
+    DIMENSIONS = {
+        'part': ('parts', ('item_id', 'item_type')),
+        'color': ('colors', ('color_id',)),
+        'category': ('categories', ('name',)),
+        'source_set': ('source_sets', ('source_file',)),
+    }
+    
+    def __init__(self, db_path="analytics.db", cache_max_bytes=32 * 1024 * 1024,
+                 color_mapping_path="BL_color_mapping.json"):
         self.db_path = db_path
+        # Pooled connections (WAL, tuned pragmas) and the single-writer lock
+        self.db = get_connection_manager(db_path)
+        # Built dashboard payloads, validated against the collection ETag
+        self.cache = PayloadCache('dashboard', cache_max_bytes)
+        # Natural key -> surrogate key, per dimension; rows are never renumbered
+        self._dimension_keys = {dimension: {} for dimension in self.DIMENSIONS}
+        # BrickLink color id -> name, stored on the colors dimension for the item search
+        self.color_names = self._load_color_names(color_mapping_path)
+        self.search_fts = False
         self.init_database()
     
     def init_database(self):
         """Initialize SQLite database for analytics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.db.write() as conn:
+            self._create_tables(conn.cursor())
+        
+        # Indexes and later schema changes, tracked in PRAGMA user_version; the
+        # migrations run their own transactions, on the writer between two groups
+        self.db.execute_exclusive(migrate)
+        
+        # Names first: a new search index is filled from them
+        with self.db.write() as conn:
+            conn.executemany(
+                "UPDATE colors SET color_name = ? WHERE color_id = ? AND color_name IS NULL",
+                ((name, color_id) for color_id, name in self.color_names.items())
+            )
+            self.search_fts = create_search_index(conn)
+    
+    @staticmethod
+    def _load_color_names(color_mapping_path):
+        """BrickLink color names by color id ({} if the mapping cannot be read)"""
+        try:
+            with open(color_mapping_path, 'r', encoding='utf-8') as f:
+                mapping = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Color names unavailable for the item search: {e}")
+            return {}
+        return {str(color_id): name for color_id, name in mapping.items()} if isinstance(mapping, dict) else {}
+    
+    @staticmethod
+    def _create_tables(cursor):
+        """Base schema (version 0); changes go through analytics_schema migrations"""
         
         # Create tables
         cursor.execute("""
@@ -80,92 +139,250 @@ class DashboardAnalytics:
                 date_recorded TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
+    
+    def _resolve_dimension(self, conn, dimension, values):
+        """
+        Surrogate keys for `values` (natural keys) of one dimension.
         
-        conn.commit()
-        conn.close()
+        Unknown values are inserted and the dimension is re-read once. The
+        returned mapping is only adopted as the cache by the caller after its
+        transaction commits, so a rollback cannot leave dangling keys behind.
+        """
+        table, columns = self.DIMENSIONS[dimension]
+        known = self._dimension_keys[dimension]
+        missing = [value for value in values if value not in known]
+        if not missing:
+            return known
+        
+        # NULL natural keys violate NOT NULL and are skipped: their facts get a NULL key
+        placeholders = ', '.join('?' for _ in columns)
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            (value if len(columns) > 1 else (value,) for value in missing)
+        )
+        rows = conn.execute(f"SELECT id, {', '.join(columns)} FROM {table}")
+        if len(columns) > 1:
+            return {tuple(row[1:]): row[0] for row in rows}
+        return {row[1]: row[0] for row in rows}
     
     def save_collection_analysis(self, collection_name, analysis_data):
-        """Save collection analysis to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """
+        Save collection analysis to database.
+        
+        Totals and the color, category and set aggregates are computed in one
+        pass over the items, which also collects the distinct parts, colors,
+        categories and source sets. Items are stored as integer-keyed rows of
+        item_facts; rows are streamed to `executemany` from generators, so the
+        whole save is a handful of statements inside a single transaction. The
+        same transaction stores the aggregates the dashboard reads, records
+        completion snapshots and updates the daily rollups.
+        """
+        # Calculate stats
+        total_items = 0
+        total_pieces = 0
+        owned_pieces = 0
+        color_stats = {}
+        category_stats = {}
+        set_stats = {}
+        dimension_values = {dimension: set() for dimension in self.DIMENSIONS}
+        
+        for file_data in analysis_data.values():
+            total_items += len(file_data['items'])
+            for item in file_data['items']:
+                pieces = item['min_qty'] + item['qty_filled']
+                total_pieces += pieces
+                owned_pieces += item['qty_filled']
+                
+                stats = color_stats.get(item['color'])
+                if stats is None:
+                    stats = color_stats[item['color']] = [0, 0, 0]  # total, owned, missing
+                stats[0] += pieces
+                stats[1] += item['qty_filled']
+                stats[2] += item['min_qty']
+                
+                stats = category_stats.get(item['category'])
+                if stats is None:
+                    stats = category_stats[item['category']] = [0, 0, 0, 0]  # ..., items
+                stats[0] += pieces
+                stats[1] += item['qty_filled']
+                stats[2] += item['min_qty']
+                stats[3] += 1
+                
+                stats = set_stats.get(item['source_file'])
+                if stats is None:
+                    stats = set_stats[item['source_file']] = [0, 0, 0, 0]
+                stats[0] += pieces
+                stats[1] += item['qty_filled']
+                stats[2] += item['min_qty']
+                stats[3] += 1
+                
+                dimension_values['part'].add((item['item_id'], item['item_type'] or 'P'))
+                dimension_values['color'].add(item['color'])
+                dimension_values['category'].add(item['category'])
+                dimension_values['source_set'].add(item['source_file'])
+        
+        file_count = len(analysis_data)
+        completion_percentage = (owned_pieces / total_pieces * 100) if total_pieces > 0 else 0
+        
+        new_colors = [color for color in dimension_values['color']
+                      if color not in self._dimension_keys['color'] and color in self.color_names]
         
         try:
-            # Calculate stats
-            total_items = sum(len(data['items']) for data in analysis_data.values())
-            file_count = len(analysis_data)
-            
-            total_pieces = 0
-            owned_pieces = 0
-            
-            for file_data in analysis_data.values():
-                for item in file_data['items']:
-                    total_pieces += item['min_qty'] + item['qty_filled']
-                    owned_pieces += item['qty_filled']
-            
-            completion_percentage = (owned_pieces / total_pieces * 100) if total_pieces > 0 else 0
-            
-            # Insert collection
-            cursor.execute("""
-                INSERT INTO collections (name, file_count, total_items, completion_percentage)
-                VALUES (?, ?, ?, ?)
-            """, (collection_name, file_count, total_items, completion_percentage))
-            
-            collection_id = cursor.lastrowid
-            
-            # Insert items and calculate color stats
-            color_stats = {}
-            
-            for file_data in analysis_data.values():
-                for item in file_data['items']:
-                    cursor.execute("""
-                        INSERT INTO items (collection_id, item_id, item_type, color_id, 
-                                         min_qty, qty_filled, category, source_file)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (collection_id, item['item_id'], item['item_type'], 
-                          item['color'], item['min_qty'], item['qty_filled'],
-                          item['category'], item['source_file']))
-                    
-                    # Update color stats
-                    color_key = item['color']
-                    if color_key not in color_stats:
-                        color_stats[color_key] = {
-                            'total_pieces': 0,
-                            'owned_pieces': 0,
-                            'missing_pieces': 0
-                        }
-                    
-                    color_stats[color_key]['total_pieces'] += item['min_qty'] + item['qty_filled']
-                    color_stats[color_key]['owned_pieces'] += item['qty_filled']
-                    color_stats[color_key]['missing_pieces'] += item['min_qty']
-            
-            # Insert color stats
-            for color_id, stats in color_stats.items():
-                completion_rate = (stats['owned_pieces'] / stats['total_pieces'] * 100) if stats['total_pieces'] > 0 else 0
+            with self.db.write() as conn:  # One transaction: commit on success, rollback on error
+                keys = {
+                    dimension: self._resolve_dimension(conn, dimension, values)
+                    for dimension, values in dimension_values.items()
+                }
+                part_keys, color_keys = keys['part'], keys['color']
+                category_keys, set_keys = keys['category'], keys['source_set']
+                conn.executemany(
+                    "UPDATE colors SET color_name = ? WHERE color_id = ? AND color_name IS NULL",
+                    ((self.color_names[color], color) for color in new_colors)
+                )
+                
+                cursor = conn.execute("""
+                    INSERT INTO collections (name, file_count, total_items, completion_percentage)
+                    VALUES (?, ?, ?, ?)
+                """, (collection_name, file_count, total_items, completion_percentage))
+                collection_id = cursor.lastrowid
+                
+                conn.executemany("""
+                    INSERT INTO item_facts (collection_id, part_key, color_key, category_key,
+                                            set_key, min_qty, qty_filled)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    (collection_id, part_keys.get((item['item_id'], item['item_type'] or 'P')),
+                     color_keys.get(item['color']), category_keys.get(item['category']),
+                     set_keys.get(item['source_file']), item['min_qty'], item['qty_filled'])
+                    for file_data in analysis_data.values()
+                    for item in file_data['items']
+                ))
                 
-                cursor.execute("""
+                self._index_search_terms(conn, collection_id)
+                
+                conn.executemany("""
                     INSERT INTO color_stats (collection_id, color_id, total_pieces, 
                                            owned_pieces, missing_pieces, completion_rate)
                     VALUES (?, ?, ?, ?, ?, ?)
-                """, (collection_id, color_id, stats['total_pieces'], 
-                      stats['owned_pieces'], stats['missing_pieces'], completion_rate))
+                """, (
+                    (collection_id, color_id, total, owned, missing,
+                     (owned / total * 100) if total > 0 else 0)
+                    for color_id, (total, owned, missing) in color_stats.items()
+                ))
+                
+                conn.executemany("""
+                    INSERT INTO category_stats (collection_id, category_key, item_count,
+                                                total_pieces, owned_pieces, missing_pieces)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (
+                    (collection_id, category_keys.get(category), count, total, owned, missing)
+                    for category, (total, owned, missing, count) in category_stats.items()
+                ))
+                
+                conn.executemany("""
+                    INSERT INTO set_stats (collection_id, set_key, item_count, total_pieces,
+                                           owned_pieces, missing_pieces, completion_rate)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    (collection_id, set_keys.get(source_file), count, total, owned, missing,
+                     (owned / total * 100) if total > 0 else 0)
+                    for source_file, (total, owned, missing, count) in set_stats.items()
+                ))
+                
+                self._record_snapshots(conn, collection_id, collection_name,
+                                       (total_pieces, owned_pieces, total_pieces - owned_pieces),
+                                       [(set_keys.get(name), stats[:3]) for name, stats in set_stats.items()],
+                                       [(color_keys.get(color), stats) for color, stats in color_stats.items()])
+                
+                # Earlier analyses with this name show the new save in their timeline
+                same_name = [row[0] for row in conn.execute(
+                    "SELECT id FROM collections WHERE name = ?", (collection_name,)
+                )]
             
-            conn.commit()
+            self._dimension_keys.update(keys)
+            self.cache.invalidate(*same_name)
             logging.info(f"Saved collection analysis: {collection_name}")
             return collection_id
             
         except Exception as e:
-            conn.rollback()
             logging.error(f"Error saving collection analysis: {e}")
             raise
-        finally:
-            conn.close()
     
-    def get_collection_dashboard_data(self, collection_id):
-        """Get comprehensive dashboard data for a collection"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _index_search_terms(self, conn, collection_id):
+        """Add the part/color pairs first seen in this save to search_terms and the search index"""
+        last_term = conn.execute("SELECT IFNULL(MAX(id), 0) FROM search_terms").fetchone()[0]
+        conn.execute("""
+            INSERT OR IGNORE INTO search_terms (part_key, color_key, category_key)
+            SELECT part_key, color_key, MIN(category_key) FROM item_facts
+            WHERE collection_id = ? AND part_key IS NOT NULL AND color_key IS NOT NULL
+            GROUP BY part_key, color_key
+        """, (collection_id,))
+        if self.search_fts:
+            conn.execute("""
+                INSERT INTO item_search (rowid, item_id, color, category)
+                SELECT id, item_id, color, category FROM item_search_docs WHERE id > ?
+            """, (last_term,))
+    
+    def _record_snapshots(self, conn, collection_id, collection_name, totals, set_stats, color_stats):
+        """
+        Append this save's completion snapshots and fold them into today's rollups.
         
-        try:
+        `set_stats` and `color_stats` are (dimension key, [total, owned, missing])
+        pairs. The rollup keeps the latest snapshot of each day, so the work is
+        proportional to the sets and colors of this save, not to the history.
+        """
+        rows = [('collection', 0, totals)]
+        rows.extend(('set', key, stats) for key, stats in set_stats if key is not None)
+        rows.extend(('color', key, stats) for key, stats in color_stats if key is not None)
+        
+        conn.executemany("""
+            INSERT INTO completion_snapshots (collection_id, collection_name, day, scope, scope_key,
+                                              total_pieces, owned_pieces, missing_pieces)
+            VALUES (?, ?, date('now'), ?, ?, ?, ?, ?)
+        """, (
+            (collection_id, collection_name, scope, key, total, owned, missing)
+            for scope, key, (total, owned, missing) in rows
+        ))
+        
+        conn.execute("""
+            INSERT INTO daily_completion (collection_name, scope, scope_key, day, total_pieces,
+                                          owned_pieces, missing_pieces, snapshot_count, last_collection_id)
+            SELECT collection_name, scope, scope_key, day, total_pieces, owned_pieces,
+                   missing_pieces, 1, collection_id
+            FROM completion_snapshots WHERE collection_id = ?
+            ON CONFLICT (collection_name, scope, scope_key, day) DO UPDATE SET
+                total_pieces = excluded.total_pieces,
+                owned_pieces = excluded.owned_pieces,
+                missing_pieces = excluded.missing_pieces,
+                snapshot_count = snapshot_count + 1,
+                last_collection_id = excluded.last_collection_id
+        """, (collection_id,))
+    
+    def get_collection_dashboard_data(self, collection_id, etag=None):
+        """
+        Get comprehensive dashboard data for a collection.
+        
+        Payloads are cached per collection and reused while the collection's
+        ETag is unchanged; pass `etag` when the caller already computed it.
+        The returned dict is shared with the cache and must not be modified.
+        """
+        if etag is None:
+            etag = self.get_collection_etag(collection_id)
+            if etag is None:
+                return None
+        
+        data = self.cache.get((collection_id, 'data'), etag)
+        if data is None:
+            data = self._build_collection_dashboard_data(collection_id)
+            if data is not None:
+                self.cache.put((collection_id, 'data'), etag, data)
+        return data
+    
+    def _build_collection_dashboard_data(self, collection_id):
+        """Run the dashboard queries for a collection (None if missing)"""
+        with self.db.read() as conn:
+            cursor = conn.cursor()
+            
             # Collection overview
             cursor.execute("SELECT * FROM collections WHERE id = ?", (collection_id,))
             collection = cursor.fetchone()
@@ -181,26 +398,42 @@ class DashboardAnalytics:
             """, (collection_id,))
             color_stats = cursor.fetchall()
             
-            # Category distribution
+            # Category distribution (materialized at save time)
             cursor.execute("""
-                SELECT category, COUNT(*) as count, SUM(min_qty + qty_filled) as total_pieces
-                FROM items WHERE collection_id = ?
-                GROUP BY category
-                ORDER BY total_pieces DESC
+                SELECT ca.name, cs.item_count, cs.total_pieces
+                FROM category_stats cs
+                LEFT JOIN categories ca ON ca.id = cs.category_key
+                WHERE cs.collection_id = ?
+                ORDER BY cs.total_pieces DESC
             """, (collection_id,))
             category_stats = cursor.fetchall()
             
+            # Per-set completion (materialized at save time)
+            cursor.execute("""
+                SELECT s.source_file, st.item_count, st.total_pieces, st.owned_pieces,
+                       st.missing_pieces, st.completion_rate
+                FROM set_stats st
+                LEFT JOIN source_sets s ON s.id = st.set_key
+                WHERE st.collection_id = ?
+                ORDER BY st.total_pieces DESC
+            """, (collection_id,))
+            set_stats = cursor.fetchall()
+            
             # Top missing items
             cursor.execute("""
-                SELECT item_id, color_id, min_qty, source_file
-                FROM items WHERE collection_id = ? AND min_qty > 0
-                ORDER BY min_qty DESC
+                SELECT p.item_id, co.color_id, f.min_qty, s.source_file
+                FROM item_facts f
+                LEFT JOIN parts p ON p.id = f.part_key
+                LEFT JOIN colors co ON co.id = f.color_key
+                LEFT JOIN source_sets s ON s.id = f.set_key
+                WHERE f.collection_id = ? AND f.min_qty > 0
+                ORDER BY f.min_qty DESC
                 LIMIT 20
             """, (collection_id,))
             missing_items = cursor.fetchall()
             
-            # Progress over time (mock data for now)
-            progress_data = self._generate_progress_timeline(collection_id)
+            # Progress over time, from the daily rollups of this collection name
+            progress_data = self._read_progress_timeline(conn, collection[1])
             
             return {
                 'collection': {
@@ -213,36 +446,469 @@ class DashboardAnalytics:
                 },
                 'color_stats': color_stats,
                 'category_stats': category_stats,
+                'set_stats': set_stats,
                 'missing_items': missing_items,
                 'progress_timeline': progress_data
             }
+    
+    def get_collection_etag(self, collection_id, *options):
+        """Cheap version token for a collection's dashboard data (None if missing)"""
+        with self.db.read() as conn:
+            row = conn.execute("""
+                SELECT c.id, c.created_at, c.total_items, c.completion_percentage,
+                       (SELECT MAX(latest.id) FROM collections latest WHERE latest.name = c.name)
+                FROM collections c WHERE c.id = ?
+            """, (collection_id,)).fetchone()
+        
+        if not row:
+            return None
+        # Saved collections never change; the timeline changes when the name is saved again
+        return make_etag('collection', *row, *options)
+    
+    def get_comparison_etag(self, collection_ids, *options):
+        """Version token for a comparison of several collections (plus any view options)"""
+        with self.db.read() as conn:
+            rows = conn.execute(
+                "SELECT id, created_at FROM collections WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+                (json.dumps(list(collection_ids)),)
+            ).fetchall()
+        return make_etag('compare', list(collection_ids), rows, *options)
+    
+    # Timeline scopes and the dimension that resolves their key
+    TIMELINE_SCOPES = {'collection': None, 'set': 'source_set', 'color': 'color'}
+    
+    def _read_progress_timeline(self, conn, collection_name, scope='collection', scope_key=0, days=30):
+        """Last `days` daily rollups, oldest first: a primary key range scan of at most `days` rows"""
+        rows = conn.execute("""
+            SELECT day, total_pieces, owned_pieces, snapshot_count FROM daily_completion
+            WHERE collection_name = ? AND scope = ? AND scope_key = ?
+            ORDER BY day DESC LIMIT ?
+        """, (collection_name, scope, scope_key, days)).fetchall()
+        
+        return [
+            {
+                'date': day,
+                'completion_rate': round(owned / total * 100, 1) if total else 0,
+                'owned_pieces': owned,
+                'total_pieces': total,
+                'snapshots': snapshots
+            }
+            for day, total, owned, snapshots in reversed(rows)
+        ]
+    
+    def get_progress_timeline(self, collection_id, scope='collection', value=None, days=30):
+        """
+        Daily completion of a collection (all saves sharing its name).
+        
+        Args:
+            collection_id (int): Any saved analysis of the collection
+            scope (str): 'collection', 'set' (value = source file) or 'color' (value = color id)
+            value (str): Set or color to follow, required unless scope is 'collection'
+            days (int): Number of most recent days with a snapshot
+            
+        Returns:
+            list: {'date', 'completion_rate', 'owned_pieces', 'total_pieces',
+                'snapshots'} per day, or None if the collection does not exist
+        """
+        if scope not in self.TIMELINE_SCOPES:
+            raise ValueError(f"Unknown timeline scope '{scope}'")
+        
+        with self.db.read() as conn:
+            row = conn.execute("SELECT name FROM collections WHERE id = ?", (collection_id,)).fetchone()
+            if not row:
+                return None
+            
+            scope_key = 0
+            dimension = self.TIMELINE_SCOPES[scope]
+            if dimension is not None:
+                table, (column,) = self.DIMENSIONS[dimension]
+                key_row = conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()
+                if not key_row:
+                    return []
+                scope_key = key_row[0]
+            
+            return self._read_progress_timeline(conn, row[0], scope, scope_key, days)
+    
+    def get_previous_collection_id(self, collection_id):
+        """Id of the previous analysis saved under the same name, or None"""
+        with self.db.read() as conn:
+            row = conn.execute("""
+                SELECT MAX(previous.id) FROM collections c
+                JOIN collections previous ON previous.name = c.name AND previous.id < c.id
+                WHERE c.id = ?
+            """, (collection_id,)).fetchone()
+        return row[0] if row else None
+    
+    def get_diff_etag(self, old_id, new_id, *options):
+        """Version token for a diff; both analyses are immutable once saved"""
+        with self.db.read() as conn:
+            rows = conn.execute(
+                "SELECT id, created_at FROM collections WHERE id IN (?, ?) ORDER BY id",
+                (old_id, new_id)
+            ).fetchall()
+        if len(rows) < len({old_id, new_id}):
+            return None
+        return make_etag('diff', old_id, new_id, rows, *options)
+    
+    def diff_collections(self, old_id, new_id, limit=500):
+        """
+        What changed between two analyses, keyed by (part, color, source set).
+        
+        Both collections are read in one pass over the covering
+        idx_item_facts_diff index and grouped per key; only keys whose owned
+        or missing quantity changed are returned. Change types:
+        'acquired' / 'lost' (owned pieces went up / down), 'new_shortage'
+        (nothing missing before), 'resolved' (nothing missing now), 'added'
+        and 'removed' (key present in only one analysis).
+        
+        Args:
+            old_id (int): Earlier analysis
+            new_id (int): Later analysis
+            limit (int): Maximum changed rows returned, largest changes first;
+                the summary always covers all of them
+        
+        Returns:
+            dict: 'old', 'new', 'summary', 'changes' and 'sets', or None if
+                either collection does not exist
+        """
+        with self.db.read() as conn:
+            collections = {
+                row[0]: {'id': row[0], 'name': row[1], 'created_at': row[2],
+                         'total_items': row[3], 'completion_percentage': row[4]}
+                for row in conn.execute("""
+                    SELECT id, name, created_at, total_items, completion_percentage
+                    FROM collections WHERE id IN (?, ?)
+                """, (old_id, new_id))
+            }
+            if old_id not in collections or new_id not in collections:
+                return None
+            
+            rows = conn.execute("""
+                WITH diff AS (
+                    SELECT part_key, color_key, set_key,
+                           SUM(CASE WHEN collection_id = :old THEN qty_filled END) AS old_owned,
+                           SUM(CASE WHEN collection_id = :new THEN qty_filled END) AS new_owned,
+                           SUM(CASE WHEN collection_id = :old THEN min_qty END) AS old_missing,
+                           SUM(CASE WHEN collection_id = :new THEN min_qty END) AS new_missing
+                    FROM item_facts
+                    WHERE collection_id IN (:old, :new)
+                    GROUP BY part_key, color_key, set_key
+                )
+                SELECT p.item_id, p.item_type, co.color_id, s.source_file,
+                       d.old_owned, d.new_owned, d.old_missing, d.new_missing
+                FROM diff d
+                LEFT JOIN parts p ON p.id = d.part_key
+                LEFT JOIN colors co ON co.id = d.color_key
+                LEFT JOIN source_sets s ON s.id = d.set_key
+                WHERE d.old_owned IS NOT d.new_owned OR d.old_missing IS NOT d.new_missing
+            """, {'old': old_id, 'new': new_id}).fetchall()
+            
+            # Per-set completion before and after, from the materialized set stats
+            set_rows = conn.execute("""
+                SELECT s.source_file,
+                       MAX(CASE WHEN st.collection_id = :old THEN st.completion_rate END),
+                       MAX(CASE WHEN st.collection_id = :new THEN st.completion_rate END),
+                       MAX(CASE WHEN st.collection_id = :old THEN st.missing_pieces END),
+                       MAX(CASE WHEN st.collection_id = :new THEN st.missing_pieces END)
+                FROM set_stats st
+                LEFT JOIN source_sets s ON s.id = st.set_key
+                WHERE st.collection_id IN (:old, :new)
+                GROUP BY st.set_key
+                ORDER BY s.source_file
+            """, {'old': old_id, 'new': new_id}).fetchall()
+        
+        summary = {
+            'changed_items': len(rows),
+            'pieces_acquired': 0,
+            'pieces_lost': 0,
+            'new_shortages': 0,
+            'resolved_shortages': 0,
+            'added_items': 0,
+            'removed_items': 0,
+            'sets_completed': 0
+        }
+        changes = []
+        for item_id, item_type, color_id, source_file, old_owned, new_owned, old_missing, new_missing in rows:
+            if old_owned is None:
+                change = 'added'
+                summary['added_items'] += 1
+            elif new_owned is None:
+                change = 'removed'
+                summary['removed_items'] += 1
+            elif not old_missing and new_missing:
+                change = 'new_shortage'
+                summary['new_shortages'] += 1
+            elif old_missing and not new_missing:
+                change = 'resolved'
+                summary['resolved_shortages'] += 1
+            elif new_owned > old_owned:
+                change = 'acquired'
+            elif new_owned < old_owned:
+                change = 'lost'
+            else:
+                change = 'changed'
+            
+            owned_delta = (new_owned or 0) - (old_owned or 0)
+            if owned_delta > 0:
+                summary['pieces_acquired'] += owned_delta
+            else:
+                summary['pieces_lost'] -= owned_delta
             
-        finally:
-            conn.close()
-    
-    def _generate_progress_timeline(self, collection_id):
-        """Generate mock progress timeline data"""
-        # In a real implementation, this would track actual progress over time
-        base_date = datetime.now() - timedelta(days=30)
-        timeline = []
-        
-        for i in range(30):
-            date = base_date + timedelta(days=i)
-            # Mock progress increase
-            progress = min(95, 20 + (i * 2) + (i ** 0.5 * 5))
-            timeline.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'completion_rate': round(progress, 1)
+            changes.append({
+                'item_id': item_id,
+                'item_type': item_type,
+                'color_id': color_id,
+                'source_file': source_file,
+                'change': change,
+                'old_owned': old_owned,
+                'new_owned': new_owned,
+                'old_missing': old_missing,
+                'new_missing': new_missing,
+                'owned_delta': owned_delta,
+                'missing_delta': (new_missing or 0) - (old_missing or 0)
+            })
+        
+        changes.sort(key=lambda c: (-abs(c['owned_delta']) - abs(c['missing_delta']),
+                                    c['item_id'] or '', c['color_id'] or ''))
+        
+        sets = []
+        for source_file, old_rate, new_rate, old_missing, new_missing in set_rows:
+            completed = new_missing == 0 and bool(old_missing)
+            summary['sets_completed'] += completed
+            sets.append({
+                'source_file': source_file,
+                'old_completion': old_rate,
+                'new_completion': new_rate,
+                'old_missing': old_missing,
+                'new_missing': new_missing,
+                'completed': completed
             })
         
-        return timeline
+        return {
+            'old': collections[old_id],
+            'new': collections[new_id],
+            'summary': summary,
+            'changes': changes[:limit],
+            'sets': sets
+        }
+    
+    # Item list orders: name -> (ORDER BY, keyset condition, cursor fields); each
+    # follows an index, so every page is a range scan starting at the cursor
+    ITEM_SORTS = {
+        'file': ('f.id', 'f.id > ?', ('id',)),                    # idx_item_facts_page
+        'missing': ('f.min_qty DESC, f.id DESC', '(f.min_qty, f.id) < (?, ?)',
+                    ('min_qty', 'id')),                           # idx_item_facts_missing
+    }
+    
+    # Item list filters: name -> (dimension, item_facts key column)
+    ITEM_FILTERS = {
+        'color': ('color', 'color_key'),
+        'category': ('category', 'category_key'),
+        'source_set': ('source_set', 'set_key'),
+    }
+    
+    def get_collection_items(self, collection_id, filters=None, missing_only=False, sort='file',
+                             cursor=None, limit=100):
+        """
+        One page of a collection's full item list.
+        
+        Keyset pagination: `cursor` is the `next_cursor` of the previous page
+        and the query seeks straight to it in the sort index, so a deep page
+        costs the same as the first one (OFFSET would read and discard every
+        row before it). Filters are checked while walking the index.
+        
+        Args:
+            collection_id (int): Saved analysis
+            filters (dict): 'color' (color id), 'category', 'source_set' (file name)
+            missing_only (bool): Only items with missing pieces (implied by sort='missing')
+            sort (str): 'file' (file order) or 'missing' (most missing pieces first)
+            cursor (str): Position returned by the previous page, None for the first
+            limit (int): Items per page
+        
+        Returns:
+            dict: {'items', 'next_cursor'} (next_cursor is None on the last page),
+                or None if the collection does not exist
+        
+        Raises:
+            ValueError: Unknown sort or filter, or a malformed cursor
+        """
+        if sort not in self.ITEM_SORTS:
+            raise ValueError(f"Unknown sort '{sort}', expected one of {tuple(self.ITEM_SORTS)}")
+        order_by, seek, cursor_fields = self.ITEM_SORTS[sort]
+        
+        conditions = ['f.collection_id = ?']
+        params = [collection_id]
+        if missing_only or sort == 'missing':
+            conditions.append('f.min_qty > 0')
+        if cursor:
+            try:
+                position = [int(part) for part in cursor.split('.')]
+            except ValueError:
+                position = []
+            if len(position) != len(cursor_fields):
+                raise ValueError(f"Malformed cursor '{cursor}' for sort '{sort}'")
+            conditions.append(seek)
+            params.extend(position)
+        
+        with self.db.read() as conn:
+            if not conn.execute("SELECT 1 FROM collections WHERE id = ?", (collection_id,)).fetchone():
+                return None
+            
+            for name, value in (filters or {}).items():
+                if name not in self.ITEM_FILTERS:
+                    raise ValueError(f"Unknown filter '{name}'")
+                if value is None:
+                    continue
+                dimension, key_column = self.ITEM_FILTERS[name]
+                table, (column,) = self.DIMENSIONS[dimension]
+                key_row = conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()
+                if not key_row:
+                    return {'items': [], 'next_cursor': None}
+                conditions.append(f"f.{key_column} = ?")
+                params.append(key_row[0])
+            
+            # One extra row tells whether another page follows
+            rows = conn.execute(f"""
+                SELECT f.id, p.item_id, p.item_type, co.color_id, co.color_name, ca.name,
+                       s.source_file, f.min_qty, f.qty_filled, f.price
+                FROM item_facts f
+                LEFT JOIN parts p ON p.id = f.part_key
+                LEFT JOIN colors co ON co.id = f.color_key
+                LEFT JOIN categories ca ON ca.id = f.category_key
+                LEFT JOIN source_sets s ON s.id = f.set_key
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order_by}
+                LIMIT ?
+            """, (*params, limit + 1)).fetchall()
+        
+        items = [
+            {
+                'id': row[0],
+                'item_id': row[1],
+                'item_type': row[2],
+                'color_id': row[3],
+                'color_name': row[4],
+                'category': row[5],
+                'source_file': row[6],
+                'min_qty': row[7],
+                'qty_filled': row[8],
+                'price': row[9]
+            }
+            for row in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = '.'.join(str(items[-1][field]) for field in cursor_fields)
+        return {'items': items, 'next_cursor': next_cursor}
+    
+    def get_search_etag(self, *options):
+        """Version token for search results: changes whenever an analysis is saved or deleted"""
+        with self.db.read() as conn:
+            row = conn.execute("SELECT MAX(id), COUNT(*) FROM collections").fetchone()
+        return make_etag('search', *row, *options)
+    
+    def search_items(self, query, latest_only=True, missing_only=False, limit=500, max_terms=200):
+        """
+        Items matching `query` across stored collections, grouped by collection and set.
+        
+        Every word must match, as a prefix, the part id, color name or category
+        ("3001 red" finds part 3001 in Red, Dark Red, Trans-Red...). The FTS5
+        index (or LIKE when FTS5 is unavailable) returns the matching
+        part/color pairs, up to `max_terms` of them; each pair is then a lookup
+        in idx_item_facts_diff per collection searched.
+        
+        Args:
+            query (str): Words to match
+            latest_only (bool): Search only the latest analysis of each collection name
+            missing_only (bool): Only items with missing pieces
+            limit (int): Maximum item rows returned
+            max_terms (int): Maximum part/color pairs looked up
+        
+        Returns:
+            dict: {'query', 'total_items', 'truncated', 'collections'}, where each
+                collection has 'id', 'name', 'created_at' and 'sets' with their 'items'
+        """
+        result = {'query': query, 'total_items': 0, 'truncated': False, 'collections': []}
+        words = re.findall(r'\w+', query or '')
+        if not words:
+            return result
+        
+        with self.db.read() as conn:
+            if self.search_fts:
+                terms = conn.execute("""
+                    SELECT rowid FROM item_search WHERE item_search MATCH ? LIMIT ?
+                """, (' '.join(f'"{word}"*' for word in words), max_terms)).fetchall()
+            else:
+                # Same prefix-of-a-token semantics as FTS: each word must start a
+                # token of the space/dash/slash separated document text
+                document = ("' ' || replace(replace(item_id || ' ' || coalesce(color, '') || ' ' || "
+                            "coalesce(category, ''), '-', ' '), '/', ' ')")
+                conditions = ' AND '.join(f"{document} LIKE ? ESCAPE '\\'" for _ in words)
+                terms = conn.execute(
+                    f"SELECT id FROM item_search_docs WHERE {conditions} LIMIT ?",
+                    (*['% ' + word.replace('_', r'\_') + '%' for word in words], max_terms)
+                ).fetchall()
+            if not terms:
+                return result
+            
+            # CROSS JOIN fixes the join order: matched pairs, then the collections
+            # searched, then one index seek per (collection, part, color)
+            scope = "SELECT MAX(id) FROM collections GROUP BY name" if latest_only else "SELECT id FROM collections"
+            rows = conn.execute(f"""
+                SELECT c.id, c.name, c.created_at, s.source_file, p.item_id, p.item_type,
+                       co.color_id, co.color_name, ca.name, f.min_qty, f.qty_filled
+                FROM json_each(?) matched
+                CROSS JOIN search_terms t ON t.id = matched.value
+                CROSS JOIN collections c ON c.id IN ({scope})
+                CROSS JOIN item_facts f ON f.collection_id = c.id AND f.part_key = t.part_key
+                                       AND f.color_key = t.color_key
+                JOIN parts p ON p.id = t.part_key
+                LEFT JOIN colors co ON co.id = t.color_key
+                LEFT JOIN categories ca ON ca.id = f.category_key
+                LEFT JOIN source_sets s ON s.id = f.set_key
+                {'WHERE f.min_qty > 0' if missing_only else ''}
+                ORDER BY c.id DESC, s.source_file, p.item_id, co.color_id
+                LIMIT ?
+            """, (json.dumps([row[0] for row in terms]), limit + 1)).fetchall()
+        
+        result['truncated'] = len(rows) > limit or len(terms) == max_terms
+        rows = rows[:limit]
+        result['total_items'] = len(rows)
+        
+        collections = {}
+        for (collection_id, name, created_at, source_file, item_id, item_type,
+             color_id, color_name, category, min_qty, qty_filled) in rows:
+            collection = collections.get(collection_id)
+            if collection is None:
+                collection = collections[collection_id] = {
+                    'id': collection_id,
+                    'name': name,
+                    'created_at': created_at,
+                    'sets': {}
+                }
+            collection['sets'].setdefault(source_file, []).append({
+                'item_id': item_id,
+                'item_type': item_type,
+                'color_id': color_id,
+                'color_name': color_name,
+                'category': category,
+                'min_qty': min_qty,
+                'qty_filled': qty_filled
+            })
+        
+        for collection in collections.values():
+            collection['sets'] = [
+                {'source_file': source_file, 'items': items}
+                for source_file, items in collection['sets'].items()
+            ]
+        result['collections'] = list(collections.values())
+        return result
     
     def get_collections_summary(self):
         """Get summary of all collections"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
+        with self.db.read() as conn:
+            cursor = conn.cursor()
+            
             cursor.execute("""
                 SELECT id, name, created_at, file_count, total_items, completion_percentage
                 FROM collections
@@ -261,48 +927,118 @@ class DashboardAnalytics:
                 }
                 for row in collections
             ]
-            
-        finally:
-            conn.close()
     
-    def compare_collections(self, collection_ids):
-        """Compare multiple collections"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def compare_collections(self, collection_ids, top_colors=10):
+        """
+        Compare multiple collections.
         
-        try:
-            comparison_data = {}
-            
-            for collection_id in collection_ids:
-                cursor.execute("SELECT name, completion_percentage FROM collections WHERE id = ?", (collection_id,))
-                collection = cursor.fetchone()
-                
-                if collection:
-                    cursor.execute("""
-                        SELECT color_id, completion_rate
-                        FROM color_stats WHERE collection_id = ?
-                        ORDER BY total_pieces DESC
-                        LIMIT 10
-                    """, (collection_id,))
-                    color_stats = cursor.fetchall()
-                    
-                    comparison_data[collection_id] = {
-                        'name': collection[0],
-                        'overall_completion': collection[1],
-                        'top_colors': color_stats
-                    }
-            
-            return comparison_data
+        One query for any number of collections: the requested ids are passed
+        as a single JSON parameter and each collection's top colors come from
+        a correlated LIMIT subquery that reads only those rows of the
+        idx_color_stats_collection index (a ROW_NUMBER() window would rank
+        every color of every collection first).
+        """
+        with self.db.read() as conn:
+            rows = conn.execute("""
+                SELECT c.id, c.name, c.completion_percentage, cs.color_id, cs.completion_rate
+                FROM collections c
+                LEFT JOIN color_stats cs ON cs.rowid IN (
+                    SELECT top.rowid FROM color_stats top
+                    WHERE top.collection_id = c.id
+                    ORDER BY top.total_pieces DESC
+                    LIMIT ?
+                )
+                WHERE c.id IN (SELECT value FROM json_each(?))
+                ORDER BY c.id, cs.total_pieces DESC, cs.color_id
+            """, (top_colors, json.dumps(list(collection_ids)))).fetchall()
+        
+        found = {}
+        for collection_id, name, completion, color_id, completion_rate in rows:
+            entry = found.get(collection_id)
+            if entry is None:
+                entry = found[collection_id] = {
+                    'name': name,
+                    'overall_completion': completion,
+                    'top_colors': []
+                }
+            if color_id is not None:
+                entry['top_colors'].append((color_id, completion_rate))
+        
+        # Keep the caller's order, like the per-collection loop did
+        return {collection_id: found[collection_id] for collection_id in collection_ids
+                if collection_id in found}
+    
+    def compare_collections_matrix(self, collection_ids, metric='completion_rate', max_colors=50):
+        """
+        Compact collections x colors matrix for heatmaps over many collections.
+        
+        Colors are the `max_colors` with the most pieces across the requested
+        collections. `values[i][j]` is the metric of collection i for color j,
+        or None when the collection has no pieces of that color.
+        """
+        if metric not in self.MATRIX_METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {self.MATRIX_METRICS}")
+        
+        ids_param = json.dumps(list(collection_ids))
+        with self.db.read() as conn:
+            collections = conn.execute("""
+                SELECT id, name, completion_percentage FROM collections
+                WHERE id IN (SELECT value FROM json_each(?))
+            """, (ids_param,)).fetchall()
             
-        finally:
-            conn.close()
+            cells = conn.execute(f"""
+                WITH requested(id) AS (SELECT DISTINCT value FROM json_each(?)),
+                top_colors AS (
+                    SELECT color_id, SUM(total_pieces) AS pieces
+                    FROM color_stats
+                    WHERE collection_id IN (SELECT id FROM requested)
+                    GROUP BY color_id
+                    ORDER BY pieces DESC
+                    LIMIT ?
+                )
+                SELECT cs.collection_id, cs.color_id, cs.{metric}, t.pieces
+                FROM color_stats cs
+                JOIN top_colors t ON t.color_id = cs.color_id
+                WHERE cs.collection_id IN (SELECT id FROM requested)
+            """, (ids_param, max_colors)).fetchall()
+        
+        by_id = {row[0]: row for row in collections}
+        ordered = [by_id[collection_id] for collection_id in dict.fromkeys(collection_ids)
+                   if collection_id in by_id]
+        color_pieces = {}
+        for _, color_id, _, pieces in cells:
+            color_pieces[color_id] = pieces
+        colors = sorted(color_pieces, key=lambda color_id: (-color_pieces[color_id], color_id))
+        
+        row_index = {row[0]: i for i, row in enumerate(ordered)}
+        column_index = {color_id: j for j, color_id in enumerate(colors)}
+        values = [[None] * len(colors) for _ in ordered]
+        for collection_id, color_id, value, _ in cells:
+            values[row_index[collection_id]][column_index[color_id]] = value
+        
+        return {
+            'metric': metric,
+            'collections': [
+                {'id': row[0], 'name': row[1], 'overall_completion': row[2]} for row in ordered
+            ],
+            'colors': colors,
+            'values': values
+        }
 
-def create_dashboard_app():
-    """Create Flask app with dashboard routes"""
+def create_dashboard_app(admission=None, progress_tracker=None):
+    """
+    Create Flask app with dashboard routes
+    
+    Args:
+        admission (admission.AdmissionController): Concurrency limits for the
+            BrickLink sync (the main app's, so the limit is shared with its routes)
+        progress_tracker (progress.ProgressTracker): Progress events for the sync
+    """
     app = Flask(__name__)
     app.secret_key = 'dashboard_secret_key_change_in_production'
     
     analytics = DashboardAnalytics()
+    limit = admission.limit if admission is not None else (lambda endpoint_class: lambda view: view)
     
     @app.route('/dashboard')
     def dashboard_home():
@@ -321,20 +1057,177 @@ def create_dashboard_app():
     @app.route('/api/dashboard/collection/<int:collection_id>/data')
     def collection_data_api(collection_id):
         """API endpoint for collection dashboard data"""
-        data = analytics.get_collection_dashboard_data(collection_id)
+        etag = analytics.get_collection_etag(collection_id)
+        if etag is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        if etag_matches(etag):
+            return not_modified_response(etag)
+        
+        data = analytics.get_collection_dashboard_data(collection_id, etag)
         if not data:
             return jsonify({'error': 'Collection not found'}), 404
-        return jsonify(data)
+        return cached_json_response(data, etag)
+    
+    @app.route('/api/dashboard/cache')
+    def dashboard_cache_api():
+        """Size and hit rate of the dashboard payload cache (this worker process)"""
+        return jsonify(analytics.cache.stats())
+    
+    @app.route('/api/dashboard/collection/<int:collection_id>/timeline')
+    def collection_timeline_api(collection_id):
+        """
+        API endpoint for a collection's daily progress.
+        
+        `scope=set|color` with `value` follows one set or color; `days` limits
+        the number of points.
+        """
+        scope = request.args.get('scope', 'collection')
+        if scope not in analytics.TIMELINE_SCOPES:
+            return jsonify({'error': f'Unknown scope: {scope}'}), 400
+        value = request.args.get('value')
+        if scope != 'collection' and not value:
+            return jsonify({'error': f'A value is required for scope {scope}'}), 400
+        days = max(1, min(request.args.get('days', 30, type=int), 366))
+        
+        etag = analytics.get_collection_etag(collection_id, 'timeline', scope, value, days)
+        if etag is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        if etag_matches(etag):
+            return not_modified_response(etag)
+        
+        timeline = analytics.get_progress_timeline(collection_id, scope, value, days)
+        if timeline is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        return cached_json_response({'scope': scope, 'value': value, 'timeline': timeline}, etag)
+    
+    @app.route('/api/dashboard/collection/<int:collection_id>/items')
+    def collection_items_api(collection_id):
+        """
+        API endpoint for browsing a collection's items, one keyset page at a time.
+        
+        Filters: `color`, `category`, `source_set`, `missing=1`. `sort=file|missing`;
+        pass the returned `next_cursor` as `cursor` for the following page.
+        """
+        sort = request.args.get('sort', 'file')
+        if sort not in analytics.ITEM_SORTS:
+            return jsonify({'error': f'Unknown sort: {sort}'}), 400
+        filters = {name: request.args.get(name) for name in analytics.ITEM_FILTERS}
+        missing_only = request.args.get('missing', '').lower() in ('1', 'true', 'yes')
+        cursor = request.args.get('cursor')
+        limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+        
+        etag = analytics.get_collection_etag(collection_id, 'items', sort, sorted(filters.items()),
+                                             missing_only, cursor, limit)
+        if etag is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        if etag_matches(etag):
+            return not_modified_response(etag)
+        
+        try:
+            page = analytics.get_collection_items(collection_id, filters, missing_only, sort, cursor, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if page is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        return cached_json_response(page, etag)
+    
+    @app.route('/api/dashboard/search')
+    def search_items_api():
+        """
+        API endpoint for searching items across collections (`q`).
+        
+        Searches the latest analysis of each collection unless `all=1`;
+        `missing=1` keeps only items with missing pieces.
+        """
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'A search query (q) is required'}), 400
+        latest_only = request.args.get('all', '').lower() not in ('1', 'true', 'yes')
+        missing_only = request.args.get('missing', '').lower() in ('1', 'true', 'yes')
+        limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+        
+        etag = analytics.get_search_etag(query, latest_only, missing_only, limit)
+        if etag_matches(etag):
+            return not_modified_response(etag)
+        return cached_json_response(analytics.search_items(query, latest_only, missing_only, limit), etag)
+    
+    def _diff_ids(collection_id=None):
+        """(old, new) ids from the query string; `from` defaults to the previous save of `to`"""
+        new_id = collection_id or request.args.get('to', type=int)
+        old_id = request.args.get('from', type=int)
+        if new_id is not None and old_id is None:
+            old_id = analytics.get_previous_collection_id(new_id)
+        return old_id, new_id
+    
+    @app.route('/api/dashboard/diff')
+    def collection_diff_api():
+        """
+        API endpoint for the diff between two analyses (`from`, `to`).
+        
+        Without `from`, `to` is compared with the previous analysis saved under
+        the same name. `limit` caps the changed rows returned.
+        """
+        old_id, new_id = _diff_ids()
+        if new_id is None or old_id is None:
+            return jsonify({'error': 'Two collection IDs are required (from, to)'}), 400
+        limit = max(1, min(request.args.get('limit', 500, type=int), 50000))
+        
+        etag = analytics.get_diff_etag(old_id, new_id, limit)
+        if etag is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        if etag_matches(etag):
+            return not_modified_response(etag)
+        
+        diff = analytics.diff_collections(old_id, new_id, limit)
+        if diff is None:
+            return jsonify({'error': 'Collection not found'}), 404
+        return cached_json_response(diff, etag)
+    
+    @app.route('/dashboard/collection/<int:collection_id>/diff')
+    def collection_diff_report(collection_id):
+        """Diff report of a collection against `from` (default: its previous analysis)"""
+        old_id, new_id = _diff_ids(collection_id)
+        if old_id is None:
+            return "No previous analysis to compare with", 404
+        diff = analytics.diff_collections(old_id, new_id, limit=1000)
+        if not diff:
+            return "Collection not found", 404
+        return render_template('collection_diff.html', diff=diff)
     
     @app.route('/api/dashboard/compare')
     def compare_collections_api():
-        """API endpoint for collection comparison"""
-        collection_ids = request.args.getlist('ids', type=int)
+        """
+        API endpoint for collection comparison.
+        
+        `ids` may be repeated or comma-separated. `mode=matrix` returns a
+        collections x colors matrix (`metric`, `max_colors`) for heatmaps.
+        """
+        try:
+            collection_ids = [int(value) for raw in request.args.getlist('ids')
+                              for value in raw.split(',') if value.strip()]
+        except ValueError:
+            return jsonify({'error': 'Collection IDs must be integers'}), 400
         if not collection_ids:
             return jsonify({'error': 'No collection IDs provided'}), 400
         
+        mode = request.args.get('mode', 'top_colors')
+        if mode == 'matrix':
+            metric = request.args.get('metric', 'completion_rate')
+            if metric not in analytics.MATRIX_METRICS:
+                return jsonify({'error': f'Unknown metric: {metric}'}), 400
+            max_colors = min(request.args.get('max_colors', 50, type=int), 500)
+            etag = analytics.get_comparison_etag(collection_ids, mode, metric, max_colors)
+            if etag_matches(etag):
+                return not_modified_response(etag)
+            matrix = analytics.compare_collections_matrix(collection_ids, metric, max_colors)
+            return cached_json_response(matrix, etag)
+        
+        etag = analytics.get_comparison_etag(collection_ids)
+        if etag_matches(etag):
+            return not_modified_response(etag)
+        
         comparison = analytics.compare_collections(collection_ids)
-        return jsonify(comparison)
+        return cached_json_response(comparison, etag)
     
     @app.route('/dashboard/analyze', methods=['POST'])
     def analyze_for_dashboard():
@@ -347,19 +1240,19 @@ def create_dashboard_app():
             if not filenames:
                 return jsonify({'error': 'No files provided'}), 400
             
-            # Parse files
-            parser = MultiFormatInputParser()
+            # Parse files (warm results from upload time when ready)
+            parse_cache = get_parse_cache()
             analysis_results = {}
             
             upload_folder = 'uploads'  # Should match main app
             for filename in filenames:
                 filepath = os.path.join(upload_folder, filename)
                 if os.path.exists(filepath):
-                    items = parser.parse_file(filepath)
+                    parsed = parse_cache.get(filepath)
                     analysis_results[filename] = {
-                        'items': items,
-                        'count': len(items),
-                        'format': parser._get_format_name(filepath)
+                        'items': parsed['items'],
+                        'count': parsed['count'],
+                        'format': parsed['format']
                     }
             
             # Save to database
@@ -376,8 +1269,10 @@ def create_dashboard_app():
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/bricklink/sync', methods=['POST'])
+    @limit('bricklink_sync')
     def bricklink_sync_api():
         """API endpoint for BrickLink synchronization"""
+        operation = None
         try:
             # Check if BrickLink credentials exist
             cred_manager = BrickLinkCredentialManager()
@@ -394,34 +1289,47 @@ def create_dashboard_app():
             sync = BrickLinkSync(api)
             
             sync_type = request.json.get('type', 'download_inventories')
+            if sync_type not in BRICKLINK_SYNC_STAGES:
+                return jsonify({'error': 'Invalid sync type'}), 400
+            
+            if sync_type == 'upload_wanted_list' and not request.json.get('xml_file'):
+                return jsonify({'error': 'XML file required'}), 400
+            
+            if progress_tracker is not None:
+                operation = progress_tracker.start('bricklink_sync', BRICKLINK_SYNC_STAGES[sync_type],
+                                                   request.json.get('operation_id'))
             
             if sync_type == 'download_inventories':
-                files = sync.download_inventories()
+                files = sync.download_inventories(progress=operation)
+                if operation is not None:
+                    operation.complete(files=len(files))
                 return jsonify({
                     'success': True,
                     'message': f'Downloaded {len(files)} inventories',
-                    'files': [str(f) for f in files]
+                    'files': [str(f) for f in files],
+                    'operation_id': operation.operation_id if operation else None
                 })
             
-            elif sync_type == 'upload_wanted_list':
+            else:
                 xml_file = request.json.get('xml_file')
                 list_name = request.json.get('list_name')
                 
-                if not xml_file:
-                    return jsonify({'error': 'XML file required'}), 400
-                
-                wanted_list_id = sync.upload_wanted_list(xml_file, list_name)
+                result = sync.upload_wanted_list(xml_file, list_name, progress=operation)
+                if operation is not None:
+                    operation.complete(list_name=result['list_name'], uploaded_items=result['uploaded_items'])
                 return jsonify({
                     'success': True,
-                    'message': f'Uploaded wanted list: {list_name}',
-                    'wanted_list_id': wanted_list_id
+                    'message': f"Uploaded wanted list: {result['list_name']}",
+                    'wanted_list_id': result['wanted_list_id'],
+                    'operation_id': operation.operation_id if operation else None
                 })
-            
-            else:
-                return jsonify({'error': 'Invalid sync type'}), 400
                 
+        except OperationIdInUse as e:
+            return jsonify({'error': str(e)}), 409
         except Exception as e:
             logging.error(f"BrickLink sync error: {e}")
+            if operation is not None:
+                operation.fail(e)
             return jsonify({'error': str(e)}), 500
     
     return app
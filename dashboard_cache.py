@@ -0,0 +1,126 @@
+"""
+Dashboard Payload Cache for LEGO Analysis System
+In-process LRU cache of built dashboard payloads with a memory budget
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+import metrics
+
+
+CACHE_REQUESTS = metrics.registry.counter(
+    'lego_dashboard_cache_requests_total', 'Dashboard payload cache lookups', ('cache', 'result')
+)
+CACHE_EVICTIONS = metrics.registry.counter(
+    'lego_dashboard_cache_evictions_total', 'Entries dropped by the cache', ('cache', 'reason')
+)
+CACHE_BYTES = metrics.registry.gauge(
+    'lego_dashboard_cache_bytes', 'Estimated size of the cached payloads', ('cache',)
+)
+CACHE_ENTRIES = metrics.registry.gauge(
+    'lego_dashboard_cache_entries', 'Payloads currently cached', ('cache',)
+)
+
+
+class PayloadCache:
+    """
+    LRU cache of JSON-serializable payloads, bounded by their estimated size.
+
+    Keys are tuples whose first element is the collection id, so every view
+    of a collection can be invalidated at once. Each entry also stores the
+    version token (ETag) it was built for: a lookup with a different version
+    is a miss. Writers in this process invalidate explicitly; the version
+    check catches writes made by other worker processes.
+
+    Cached payloads are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, name='dashboard', max_bytes=32 * 1024 * 1024):
+        """
+        Args:
+            name (str): Label for the cache metrics
+            max_bytes (int): Memory budget, measured as serialized JSON size
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, payload, size)
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_size(payload):
+        """Approximate memory cost of a payload (its JSON length)"""
+        return len(json.dumps(payload, default=str))
+
+    def get(self, key, version):
+        """Cached payload for `key` built at `version`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                self._remove(key)
+                self._update_gauges()
+                CACHE_EVICTIONS.inc(cache=self.name, reason='stale')
+                entry = None
+            if entry is None:
+                self._misses += 1
+                CACHE_REQUESTS.inc(cache=self.name, result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result='hit')
+        return entry[1]
+
+    def put(self, key, version, payload):
+        """Store a payload; entries larger than the whole budget are not cached"""
+        size = self.estimate_size(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, payload, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                CACHE_EVICTIONS.inc(cache=self.name, reason='budget')
+            self._update_gauges()
+
+    def invalidate(self, *collection_ids):
+        """Drop every cached view of the given collections"""
+        targets = set(collection_ids)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in targets]:
+                self._remove(key)
+                CACHE_EVICTIONS.inc(cache=self.name, reason='invalidated')
+            self._update_gauges()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._update_gauges()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else None
+            }
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _update_gauges(self):
+        CACHE_BYTES.set(self._bytes, cache=self.name)
+        CACHE_ENTRIES.set(len(self._entries), cache=self.name)
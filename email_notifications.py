@@ -14,12 +14,13 @@ import os
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
-import sqlite3
 from typing import List, Dict, Optional
 import threading
 import schedule
 import time
 
+from analytics_db import get_connection_manager
+
 class EmailConfig:
     """Email configuration management"""
     
@@ -353,6 +354,7 @@ class EmailNotificationSystem:
     def __init__(self, analytics_db="analytics.db"):
         self.config = EmailConfig()
         self.analytics_db = analytics_db
+        self.db = get_connection_manager(analytics_db)  # Shared with the dashboard
         self.scheduler_running = False
         
         # Setup logging
@@ -421,52 +423,58 @@ class EmailNotificationSystem:
     def check_missing_parts(self):
         """Check for collections with significant missing parts"""
         try:
-            conn = sqlite3.connect(self.analytics_db)
-            cursor = conn.cursor()
-            
-            # Get collections with many missing items
-            cursor.execute("""
-                SELECT c.id, c.name, COUNT(i.id) as missing_count
-                FROM collections c
-                JOIN items i ON c.id = i.collection_id
-                WHERE i.min_qty > 0
-                GROUP BY c.id, c.name
-                HAVING missing_count >= ?
-            """, (self.config.thresholds.get('min_missing_parts', 5),))
-            
-            collections_with_missing = cursor.fetchall()
-            
-            for collection_id, collection_name, missing_count in collections_with_missing:
-                # Get detailed missing items
+            alerts = []
+            with self.db.read() as conn:
+                cursor = conn.cursor()
+                
+                # Get collections with many missing items
                 cursor.execute("""
-                    SELECT item_id, color_id, min_qty, category
-                    FROM items
-                    WHERE collection_id = ? AND min_qty > 0
-                    ORDER BY min_qty DESC
-                    LIMIT 50
-                """, (collection_id,))
+                    SELECT c.id, c.name, COUNT(f.id) as missing_count
+                    FROM collections c
+                    JOIN item_facts f ON c.id = f.collection_id
+                    WHERE f.min_qty > 0
+                    GROUP BY c.id, c.name
+                    HAVING missing_count >= ?
+                """, (self.config.thresholds.get('min_missing_parts', 5),))
                 
-                missing_items = [
-                    {
-                        'item_id': row[0],
-                        'color_name': row[1],
-                        'quantity': row[2],
-                        'category': row[3],
-                        'estimated_price': 0.50  # Mock price
-                    }
-                    for row in cursor.fetchall()
-                ]
+                collections_with_missing = cursor.fetchall()
                 
-                if missing_items:
-                    email_content = EmailTemplates.missing_parts_alert(collection_name, missing_items)
-                    self.send_email(
-                        self.config.recipients,
-                        email_content['subject'],
-                        email_content['html_body'],
-                        email_content['text_body']
-                    )
+                for collection_id, collection_name, missing_count in collections_with_missing:
+                    # Get detailed missing items
+                    cursor.execute("""
+                        SELECT p.item_id, co.color_id, f.min_qty, ca.name
+                        FROM item_facts f
+                        LEFT JOIN parts p ON p.id = f.part_key
+                        LEFT JOIN colors co ON co.id = f.color_key
+                        LEFT JOIN categories ca ON ca.id = f.category_key
+                        WHERE f.collection_id = ? AND f.min_qty > 0
+                        ORDER BY f.min_qty DESC
+                        LIMIT 50
+                    """, (collection_id,))
+                    
+                    missing_items = [
+                        {
+                            'item_id': row[0],
+                            'color_name': row[1],
+                            'quantity': row[2],
+                            'category': row[3],
+                            'estimated_price': 0.50  # Mock price
+                        }
+                        for row in cursor.fetchall()
+                    ]
+                    
+                    if missing_items:
+                        alerts.append((collection_name, missing_items))
             
-            conn.close()
+            # Send outside the read transaction: SMTP can be slow
+            for collection_name, missing_items in alerts:
+                email_content = EmailTemplates.missing_parts_alert(collection_name, missing_items)
+                self.send_email(
+                    self.config.recipients,
+                    email_content['subject'],
+                    email_content['html_body'],
+                    email_content['text_body']
+                )
             
         except Exception as e:
             self.logger.error(f"Error checking missing parts: {e}")
@@ -474,20 +482,18 @@ class EmailNotificationSystem:
     def send_weekly_summary(self):
         """Send weekly collection summary"""
         try:
-            conn = sqlite3.connect(self.analytics_db)
-            cursor = conn.cursor()
-            
-            # Get all collections with stats
-            cursor.execute("""
-                SELECT c.id, c.name, c.total_items, c.completion_percentage,
-                       COUNT(CASE WHEN i.min_qty > 0 THEN 1 END) as missing_count
-                FROM collections c
-                LEFT JOIN items i ON c.id = i.collection_id
-                GROUP BY c.id, c.name, c.total_items, c.completion_percentage
-            """)
+            with self.db.read() as conn:
+                # Get all collections with stats
+                rows = conn.execute("""
+                    SELECT c.id, c.name, c.total_items, c.completion_percentage,
+                           COUNT(f.id) as missing_count
+                    FROM collections c
+                    LEFT JOIN item_facts f ON c.id = f.collection_id AND f.min_qty > 0
+                    GROUP BY c.id, c.name, c.total_items, c.completion_percentage
+                """).fetchall()
             
             collections_data = {}
-            for row in cursor.fetchall():
+            for row in rows:
                 collections_data[row[1]] = {
                     'id': row[0],
                     'total_items': row[2],
@@ -504,8 +510,6 @@ class EmailNotificationSystem:
                     email_content['text_body']
                 )
             
-            conn.close()
-            
         except Exception as e:
             self.logger.error(f"Error sending weekly summary: {e}")
     
@@ -0,0 +1,316 @@
+"""
+File Metadata Index for LEGO Analysis System
+Persistent index of uploaded inventories and generated reports
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: the server runs a single process
+    fcntl = None
+
+
+class FileMetadataIndex:
+    """
+    Persistent metadata index for the upload and report folders.
+
+    Keeps one entry per file (format, size, hash, timestamps) plus running
+    counters, so statistics can be served without listing the folders.
+    The index is updated by the web app on upload, generation and cleanup.
+
+    Several worker processes can share one index file. Saves hold an
+    exclusive lock on `<index_path>.lock`, merge this process's unsaved
+    changes over what other processes saved, and replace the file
+    atomically; queries reload the file first when another process has
+    replaced it (a stat() call otherwise). Only load() walks the folders.
+    """
+
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, folders, index_path="file_index.json", format_resolver=None):
+        """
+        Args:
+            folders (dict): Logical folder name -> path on disk (e.g. {'uploads': 'uploads'})
+            index_path (str): JSON file where the index is persisted
+            format_resolver (callable): Returns a format name for an uploaded file path
+        """
+        self.folders = dict(folders)
+        self.index_path = index_path
+        self.lock_path = index_path + '.lock'
+        self.format_resolver = format_resolver
+        self._lock = threading.RLock()
+        self._entries = {name: {} for name in self.folders}
+        self._counters = self._empty_counters()
+        self._pending = {}  # (folder, rel_path) -> entry, or None if removed; not saved yet
+        self._signature = None  # Identity of the index file last read or written
+        self.load()
+
+    def _empty_counters(self):
+        return {
+            name: {'files': 0, 'bytes': 0, 'kinds': {}, 'formats': {}}
+            for name in self.folders
+        }
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def load(self):
+        """Load the index from disk and reconcile it with the folders"""
+        with self._lock:
+            self._read()
+            self.reconcile()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read(self):
+        """Replace the in-memory entries with the file's, keeping unsaved changes on top"""
+        self._signature = self._file_signature()
+        stored = {}
+        if self._signature is not None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f).get('entries', {})
+            except Exception as e:
+                logging.warning(f"Could not load file index, rebuilding: {e}")
+                stored = {}
+
+        self._entries = {name: dict(stored.get(name, {})) for name in self.folders}
+        self._recount()
+        for (folder_name, rel_path), entry in self._pending.items():
+            self._set(folder_name, rel_path, entry)
+
+    def refresh(self):
+        """Pick up changes saved by other processes (cheap when there are none)"""
+        with self._lock:
+            if self._file_signature() != self._signature:
+                self._read()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared with the other processes using the index"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self):
+        """Persist the index atomically (write to temp file, then rename)"""
+        with self._lock, self._file_lock():
+            # Start from what other processes saved, with this process's changes on top
+            self.refresh()
+            payload = {
+                'updated_at': datetime.now().isoformat(),
+                'entries': self._entries
+            }
+            temp_path = self.index_path + '.tmp'
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f)
+                os.replace(temp_path, self.index_path)
+                self._signature = self._file_signature()
+                self._pending = {}
+            except Exception as e:
+                logging.error(f"Could not save file index: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def reconcile(self):
+        """
+        Drop entries whose file disappeared and index files added outside the app.
+
+        Called once at startup; request handlers never walk the folders.
+        """
+        with self._lock:
+            changed = False
+
+            for folder_name, folder_path in self.folders.items():
+                on_disk = set()
+                if os.path.isdir(folder_path):
+                    for root, _, files in os.walk(folder_path):
+                        for filename in files:
+                            if filename.endswith('.tmp'):
+                                continue
+                            full_path = os.path.join(root, filename)
+                            on_disk.add(Path(os.path.relpath(full_path, folder_path)).as_posix())
+
+                for rel_path in list(self._entries[folder_name]):
+                    if rel_path not in on_disk:
+                        self._stage(folder_name, rel_path, None)
+                        changed = True
+
+                for rel_path in on_disk - set(self._entries[folder_name]):
+                    self._stage(folder_name, rel_path, self._build_entry(folder_name, rel_path))
+                    changed = True
+
+            if changed:
+                self.save()
+                logging.info("File index reconciled with upload and report folders")
+
+    # ------------------------------------------------------------------
+    # Updates
+    # ------------------------------------------------------------------
+
+    def register(self, folder_name, rel_path, save=True):
+        """Add or refresh the entry for a file and return it"""
+        with self._lock:
+            rel_path = Path(rel_path).as_posix()
+            entry = self._build_entry(folder_name, rel_path)
+            self._stage(folder_name, rel_path, entry)
+            if save:
+                self.save()
+            return entry
+
+    def register_tree(self, folder_name, rel_dir):
+        """Register every file below a subdirectory (e.g. a filtered_* folder)"""
+        with self._lock:
+            base = os.path.join(self.folders[folder_name], rel_dir)
+            registered = []
+            for root, _, files in os.walk(base):
+                for filename in files:
+                    full_path = os.path.join(root, filename)
+                    rel_path = os.path.relpath(full_path, self.folders[folder_name])
+                    registered.append(self.register(folder_name, rel_path, save=False))
+            self.save()
+            return registered
+
+    def remove(self, folder_name, rel_path, save=True):
+        """Remove the entry for a file (the file itself is not touched)"""
+        with self._lock:
+            rel_path = Path(rel_path).as_posix()
+            self.refresh()
+            entry = self._stage(folder_name, rel_path, None)
+            if entry is not None and save:
+                self.save()
+            return entry
+
+    def _stage(self, folder_name, rel_path, entry):
+        """Apply a change in memory and remember it for the next save; returns the old entry"""
+        self._pending[(folder_name, rel_path)] = entry
+        return self._set(folder_name, rel_path, entry)
+
+    def _set(self, folder_name, rel_path, entry):
+        previous = self._discard(folder_name, rel_path)
+        if entry is not None:
+            self._entries[folder_name][rel_path] = entry
+            self._count(folder_name, entry, 1)
+        return previous
+
+    def _build_entry(self, folder_name, rel_path):
+        full_path = os.path.join(self.folders[folder_name], rel_path)
+        try:
+            stat = os.stat(full_path)
+        except OSError as e:
+            logging.warning(f"Cannot index {full_path}: {e}")
+            return None
+
+        return {
+            'kind': self._classify(folder_name, rel_path),
+            'format': self._detect_format(folder_name, full_path),
+            'size': stat.st_size,
+            'sha256': self._hash_file(full_path),
+            'created_at': stat.st_ctime,
+            'modified_at': stat.st_mtime,
+            'indexed_at': datetime.now().timestamp()
+        }
+
+    def _discard(self, folder_name, rel_path):
+        entry = self._entries[folder_name].pop(rel_path, None)
+        if entry is not None:
+            self._count(folder_name, entry, -1)
+        return entry
+
+    def _count(self, folder_name, entry, sign):
+        counters = self._counters[folder_name]
+        counters['files'] += sign
+        counters['bytes'] += sign * entry['size']
+        for key, value in (('kinds', entry['kind']), ('formats', entry['format'])):
+            counters[key][value] = counters[key].get(value, 0) + sign
+            if counters[key][value] <= 0:
+                del counters[key][value]
+
+    def _recount(self):
+        self._counters = self._empty_counters()
+        for folder_name, entries in self._entries.items():
+            for entry in entries.values():
+                self._count(folder_name, entry, 1)
+
+    @staticmethod
+    def _classify(folder_name, rel_path):
+        """Classify a file by folder and naming convention"""
+        name = Path(rel_path).name
+        if folder_name == 'uploads':
+            return 'upload'
+        if '/' in rel_path:
+            return 'filtered'
+        if name.startswith('wanted_list_'):
+            return 'wanted_list'
+        if name.lower().endswith('.pdf'):
+            return 'report'
+        return 'other'
+
+    def _detect_format(self, folder_name, full_path):
+        if folder_name == 'uploads' and self.format_resolver:
+            try:
+                return self.format_resolver(full_path)
+            except Exception:
+                return "Unknown"
+        suffix = Path(full_path).suffix.lstrip('.').upper()
+        return suffix or "Unknown"
+
+    @classmethod
+    def _hash_file(cls, full_path):
+        digest = hashlib.sha256()
+        with open(full_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def get(self, folder_name, rel_path):
+        """Return a copy of the entry for a file, or None"""
+        with self._lock:
+            self.refresh()
+            entry = self._entries[folder_name].get(Path(rel_path).as_posix())
+            return dict(entry) if entry else None
+
+    def entries(self, folder_name):
+        """Return a snapshot list of (rel_path, entry) for a folder"""
+        with self._lock:
+            self.refresh()
+            return [(rel_path, dict(entry)) for rel_path, entry in self._entries[folder_name].items()]
+
+    def stats(self):
+        """Return the running counters (independent of the number of files)"""
+        with self._lock:
+            self.refresh()
+            return {
+                name: {
+                    'files': counters['files'],
+                    'bytes': counters['bytes'],
+                    'kinds': dict(counters['kinds']),
+                    'formats': dict(counters['formats'])
+                }
+                for name, counters in self._counters.items()
+            }
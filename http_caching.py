@@ -0,0 +1,78 @@
+"""
+HTTP Caching Helpers for LEGO Analysis System
+ETag/Last-Modified validators, 304 responses and byte ranges
+"""
+
+import os
+import hashlib
+from flask import request, send_file, Response
+from http_compression import json_response
+
+
+# Generated outputs are named with their creation timestamp and never rewritten
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def make_etag(*parts):
+    """Build an opaque ETag value from version components"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def etag_matches(etag):
+    """True if the request's If-None-Match already names this ETag"""
+    return bool(etag) and request.if_none_match.contains_weak(etag)
+
+
+def not_modified_response(etag):
+    """Empty 304 response carrying the validator"""
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def send_cached_file(path, etag=None, immutable=False, as_attachment=True):
+    """
+    Send a file with validators, conditional 304 handling and Range support.
+
+    Args:
+        path (str): File to send
+        etag (str): Strong ETag (e.g. the content SHA-256); derived from mtime/size if None
+        immutable (bool): Mark as cacheable forever (content-addressed or timestamped outputs)
+        as_attachment (bool): Send with Content-Disposition: attachment
+    """
+    response = send_file(
+        os.path.abspath(path),
+        as_attachment=as_attachment,
+        conditional=True,  # If-None-Match / If-Modified-Since -> 304, Range -> 206
+        etag=etag if etag else True,
+        max_age=IMMUTABLE_MAX_AGE if immutable else 0
+    )
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def cached_json_response(payload, etag, max_age=0):
+    """
+    JSON response with a weak ETag, answered with 304 when the client has it.
+
+    Clients must revalidate (no-cache) unless `max_age` is given; a
+    revalidation costs one cheap version lookup instead of the full payload.
+    The body is encoded and compressed by http_compression.json_response.
+    """
+    if etag_matches(etag):
+        return not_modified_response(etag)
+
+    response = json_response(payload)
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    if max_age:
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,111 @@
+"""
+HTTP Compression Helpers for LEGO Analysis System
+Negotiated gzip/brotli compression with streaming JSON encoding
+"""
+
+import json
+import zlib
+from flask import request, current_app, Response
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+
+# Payloads smaller than this are sent as-is: compression would cost more than it saves
+COMPRESSION_MIN_SIZE = 1024
+STREAM_BLOCK_SIZE = 16 * 1024
+
+
+def negotiate_encoding():
+    """Pick the best content coding accepted by the client ('br', 'gzip' or None)"""
+    accepted = request.accept_encodings
+    candidates = (['br'] if BROTLI_AVAILABLE else []) + ['gzip']
+    best = None
+    best_quality = 0
+    for coding in candidates:
+        quality = accepted[coding]
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _json_encoder():
+    provider = current_app.json
+    return json.JSONEncoder(
+        default=getattr(provider, 'default', None),
+        ensure_ascii=getattr(provider, 'ensure_ascii', True),
+        sort_keys=getattr(provider, 'sort_keys', False),
+        separators=(',', ':')
+    )
+
+
+def _blocks(first, chunks):
+    """Coalesce the encoder's many small strings into STREAM_BLOCK_SIZE byte blocks"""
+    pending = [first] if first else []
+    size = len(first)
+    for chunk in chunks:
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_BLOCK_SIZE:
+            yield ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+    if pending:
+        yield ''.join(pending).encode('utf-8')
+
+
+def _compress(blocks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        for block in blocks:
+            data = compressor.process(block)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+        for block in blocks:
+            data = compressor.compress(block)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def json_response(payload, status=200):
+    """
+    Serialize `payload` incrementally and compress it when worthwhile.
+
+    The encoder output is buffered only until COMPRESSION_MIN_SIZE is
+    reached: small payloads are returned uncompressed with a length, large
+    ones are streamed block by block through gzip (or brotli when installed
+    and preferred), so the full JSON string is never materialized.
+    """
+    chunks = _json_encoder().iterencode(payload)
+
+    head = []
+    head_size = 0
+    exhausted = True
+    for chunk in chunks:
+        head.append(chunk)
+        head_size += len(chunk)
+        if head_size >= COMPRESSION_MIN_SIZE:
+            exhausted = False
+            break
+
+    if exhausted:
+        response = Response(''.join(head) + '\n', status=status, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        return response
+
+    encoding = negotiate_encoding()
+    blocks = _blocks(''.join(head), chunks)
+    body = _compress(blocks, encoding) if encoding else blocks
+
+    response = Response(body, status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
@@ -9,7 +9,12 @@ import xml.etree.ElementTree as ET
 import csv
 from pathlib import Path
 import logging
+import os
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from metrics import stage_timer
 
 class InputFormatHandler(ABC):
     """Abstract base class for input format handlers"""
@@ -248,7 +253,8 @@ class MultiFormatInputParser:
         for handler in self.handlers:
             if handler.can_handle(file_path):
                 logging.info(f"Parsing {file_path} as {handler.get_format_name()}")
-                return handler.parse_file(file_path)
+                with stage_timer('parse'):
+                    return handler.parse_file(file_path)
         
         raise ValueError(f"Unsupported file format: {file_path}")
     
@@ -288,6 +294,146 @@ class MultiFormatInputParser:
         """Get list of supported formats"""
         return [handler.get_format_name() for handler in self.handlers]
 
+class ParsedFileCache:
+    """
+    Parse-on-arrival cache for uploaded inventory files.
+
+    Uploads call warm() to parse files in a background thread pool; readers
+    call get(), which returns the warm result, waits for a parse that is
+    still running, or parses synchronously on a miss. Entries are keyed by
+    path, size and modification time, so a replaced file is parsed again.
+    
+    Memory is bounded by the number of parsed items held (`max_items`),
+    counted once a parse completes, as well as by `max_entries`; least
+    recently used files are evicted first.
+    """
+    
+    def __init__(self, parser=None, max_workers=2, max_entries=256, max_items=200000):
+        self.parser = parser or MultiFormatInputParser()
+        self.max_entries = max_entries
+        self.max_items = max_items
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='parse-warmup')
+        self._entries = OrderedDict()  # cache key -> Future
+        self._sizes = {}  # cache key -> parsed item count, once the parse is done
+        self._items = 0
+        self._lock = threading.RLock()  # Re-entered when a done future's callback runs at once
+    
+    @staticmethod
+    def _cache_key(file_path):
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    
+    def warm(self, file_path):
+        """Schedule background parsing of a file and return its future"""
+        try:
+            key = self._cache_key(file_path)
+        except OSError as e:
+            logging.warning(f"Cannot warm {file_path}: {e}")
+            return None
+        
+        with self._lock:
+            future = self._entries.get(key)
+            if future is None:
+                future = self._executor.submit(self._parse, file_path)
+                self._store(key, future)
+            return future
+    
+    def get(self, file_path, timeout=None):
+        """Return {'items', 'count', 'format', 'summary'} for a file"""
+        key = self._cache_key(file_path)
+        
+        with self._lock:
+            future = self._entries.get(key)
+            if future is not None:
+                self._entries.move_to_end(key)
+        
+        if future is None:
+            result = self._parse(file_path)
+            future = Future()
+            future.set_result(result)
+            with self._lock:
+                self._store(key, future)
+            return result
+        
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            # Do not keep failed parses around; the next reader retries
+            with self._lock:
+                if self._entries.get(key) is future:
+                    self._remove(key)
+            raise
+    
+    def _store(self, key, future):
+        # Drop stale versions of the same path before inserting
+        for old_key in [k for k in self._entries if k[0] == key[0] and k != key]:
+            self._remove(old_key)
+        self._entries[key] = future
+        self._evict()
+        future.add_done_callback(lambda done: self._account(key, done))
+    
+    def _account(self, key, future):
+        """Charge a completed parse against the item budget"""
+        if future.cancelled() or future.exception() is not None:
+            return
+        size = future.result()['count']
+        with self._lock:
+            if self._entries.get(key) is not future:
+                return  # Evicted or replaced while parsing
+            self._sizes[key] = size
+            self._items += size
+            if size > self.max_items:
+                # Larger than the whole budget: readers holding the future still get it
+                self._remove(key)
+            self._evict()
+    
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._items > self.max_items):
+            self._remove(next(iter(self._entries)))
+    
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        self._items -= self._sizes.pop(key, 0)
+    
+    def _parse(self, file_path):
+        items = self.parser.parse_file(file_path)
+        with stage_timer('aggregate'):
+            summary = self._summarize(items)
+        logging.info(f"Warm parse complete: {Path(file_path).name} ({len(items)} items)")
+        return {
+            'items': items,
+            'count': len(items),
+            'format': self.parser._get_format_name(file_path),
+            'summary': summary
+        }
+    
+    @staticmethod
+    def _summarize(items):
+        """Precompute piece totals overall and per color"""
+        summary = {'total_pieces': 0, 'owned_pieces': 0, 'missing_pieces': 0, 'colors': {}}
+        for item in items:
+            owned = item['qty_filled']
+            missing = item['min_qty']
+            color = summary['colors'].setdefault(
+                item['color'], {'total_pieces': 0, 'owned_pieces': 0, 'missing_pieces': 0}
+            )
+            for stats in (summary, color):
+                stats['total_pieces'] += owned + missing
+                stats['owned_pieces'] += owned
+                stats['missing_pieces'] += missing
+        return summary
+
+_parse_cache = None
+_parse_cache_lock = threading.Lock()
+
+def get_parse_cache() -> ParsedFileCache:
+    """Return the process-wide parse cache shared by the web app and dashboard"""
+    global _parse_cache
+    with _parse_cache_lock:
+        if _parse_cache is None:
+            _parse_cache = ParsedFileCache()
+        return _parse_cache
+
 # Example usage
 if __name__ == "__main__":
     parser = MultiFormatInputParser()
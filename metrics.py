@@ -0,0 +1,332 @@
+"""
+Metrics for LEGO Analysis System
+Request timing middleware, pipeline stage timers and Prometheus text exposition
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+
+# Latency buckets in seconds: fast JSON calls up to multi-minute PDF builds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self, samples=None):
+        """Exposition lines for this process's samples, or for `samples` merged across workers"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._render_samples(self.collect() if samples is None else samples))
+        return lines
+
+    def collect(self):
+        """Current samples: label values tuple -> value"""
+        return {}
+
+    def merge(self, target, key, value):
+        """Fold another worker's sample into `target`"""
+
+    def _render_samples(self, samples):
+        return []
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, label_names=(), callback=None):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        if self.callback:
+            value = self.callback()
+            return dict(value) if isinstance(value, dict) else {(): value}
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, target, key, value):
+        # Counters add up; so do the gauges here, which all measure per-worker occupancy
+        target[key] = target.get(key, 0) + value
+
+    def _render_samples(self, samples):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in samples.items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, or be read from a callback at scrape time"""
+
+    metric_type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative latency histogram per label set (for p95 via histogram_quantile)"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def collect(self):
+        with self._lock:
+            return {key: {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']}
+                    for key, s in self._series.items()}
+
+    def merge(self, target, key, value):
+        series = target.get(key)
+        if series is None:
+            target[key] = {'counts': list(value['counts']), 'sum': value['sum'], 'count': value['count']}
+            return
+        series['counts'] = [a + b for a, b in zip(series['counts'], value['counts'])]
+        series['sum'] += value['sum']
+        series['count'] += value['count']
+
+    def _render_samples(self, samples):
+        lines = []
+        for key, series in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together in Prometheus text format.
+
+    With several worker processes, `enable_multiprocess()` makes each worker
+    write its samples to a shared directory (every `flush_interval` seconds
+    and before each scrape); /metrics in any worker then merges all files,
+    so counters and histogram buckets cover every worker. Gauges of workers
+    that have exited are left out; their counters and histograms are kept,
+    so totals do not go backwards when a worker is restarted.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = None
+        self._flusher = None
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.metric_type}")
+            return metric
+
+    def counter(self, name, documentation, label_names=(), callback=None):
+        return self._get_or_create(Counter, name, documentation, label_names, callback=callback)
+
+    def gauge(self, name, documentation, label_names=(), callback=None):
+        return self._get_or_create(Gauge, name, documentation, label_names, callback=callback)
+
+    def histogram(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        merged = self._merge_workers() if self.multiprocess_dir else {}
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(merged.get(metric.name, {}) if self.multiprocess_dir else None))
+        return '\n'.join(lines) + '\n'
+
+    def enable_multiprocess(self, directory, flush_interval=5.0):
+        """Share this process's samples with the other workers through `directory`"""
+        os.makedirs(directory, exist_ok=True)
+        self.multiprocess_dir = directory
+
+        def flush_periodically():
+            while True:
+                time.sleep(flush_interval)
+                self.flush()
+
+        self._flusher = threading.Thread(target=flush_periodically, name='metrics-flush', daemon=True)
+        self._flusher.start()
+
+    def flush(self):
+        """Write this process's samples to the multiprocess directory (atomically)"""
+        if not self.multiprocess_dir:
+            return
+        with self._lock:
+            metrics = list(self._metrics.values())
+        payload = {
+            'pid': os.getpid(),
+            'metrics': {
+                metric.name: {'type': metric.metric_type,
+                              'samples': [[list(key), value] for key, value in metric.collect().items()]}
+                for metric in metrics
+            }
+        }
+        path = os.path.join(self.multiprocess_dir, f"metrics_{os.getpid()}.json")
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Could not write metrics for worker {os.getpid()}: {e}")
+
+    def _merge_workers(self):
+        """Samples of every worker's file, merged per metric: name -> {key: value}"""
+        self.flush()
+        merged = {}
+        for filename in os.listdir(self.multiprocess_dir):
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, filename), 'r', encoding='utf-8') as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _process_alive(payload['pid'])
+            for name, data in payload['metrics'].items():
+                metric = self._metrics.get(name)
+                if metric is None or (data['type'] == 'gauge' and not alive):
+                    continue
+                target = merged.setdefault(name, {})
+                for key, value in data['samples']:
+                    metric.merge(target, tuple(key), value)
+        return merged
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    'lego_http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status')
+)
+STAGE_LATENCY = registry.histogram(
+    'lego_stage_duration_seconds',
+    'Pipeline stage latency (parse, aggregate, render, pdf_build, xml_write, bricklink)',
+    ('stage',)
+)
+STAGE_ERRORS = registry.counter(
+    'lego_stage_errors_total', 'Pipeline stage executions that raised', ('stage',)
+)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Time a pipeline stage into lego_stage_duration_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+def init_app(app, endpoint='/metrics'):
+    """Install per-request timing and the /metrics endpoint on a Flask app"""
+    from flask import request, Response
+
+    @app.before_request
+    def _start_request_timer():
+        request.start_time = time.time()
+        request.start_perf = time.perf_counter()
+
+    @app.after_request
+    def _observe_request(response):
+        start = getattr(request, 'start_perf', None)
+        if start is not None:
+            # Unmatched URLs share one label to keep cardinality bounded
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - start,
+                method=request.method, route=route, status=response.status_code
+            )
+        return response
+
+    def metrics_endpoint():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule(endpoint, 'metrics', metrics_endpoint)
+    return app
@@ -0,0 +1,275 @@
+"""
+Operation Progress for LEGO Analysis System
+Stage and batch events with ETAs, streamed to browsers as Server-Sent Events
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+
+
+OPERATION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+TERMINAL_EVENTS = ('complete', 'error')
+
+
+class OperationIdInUse(Exception):
+    """Raised when a client-chosen operation id already has an event log"""
+
+    def __init__(self, operation_id):
+        super().__init__(f"Operation id {operation_id} is already in use")
+        self.operation_id = operation_id
+
+
+class Operation:
+    """
+    Progress reporter for one long-running operation.
+
+    Events are appended as JSON lines to `<folder>/<operation_id>.jsonl`,
+    so a subscriber served by another worker process sees them too. The ETA
+    combines the recent per-stage durations of this kind of operation with
+    the observed rate of batch events inside the current stage.
+    """
+
+    def __init__(self, tracker, operation_id, kind, stages):
+        self.tracker = tracker
+        self.operation_id = operation_id
+        self.kind = kind
+        self.stages = list(stages or [])
+        self.started_at = time.time()
+        self.current_stage = None
+        self._stage_started_at = None
+        self._batch = None
+        self._sequence = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._path = tracker.event_path(operation_id)
+        try:
+            # Exclusive create: another request (in any worker) never gets its log truncated
+            open(self._path, 'x').close()
+        except FileExistsError:
+            raise OperationIdInUse(operation_id)
+        self._emit('start', message=f"{kind} started")
+
+    def _remaining_stages(self):
+        if self.current_stage in self.stages:
+            return self.stages[self.stages.index(self.current_stage) + 1:]
+        return self.stages if self.current_stage is None else []
+
+    def _eta(self):
+        """Seconds left, or None until there is something to base it on"""
+        now = time.time()
+        eta = 0.0
+        known = False
+
+        if self.current_stage is not None:
+            in_stage = now - self._stage_started_at
+            if self._batch and self._batch[0] > 0:
+                done, total, batch_started_at = self._batch
+                rate = (now - batch_started_at) / done
+                eta += rate * max(total - done, 0)
+                known = True
+            else:
+                estimate = self.tracker.stage_estimate(self.kind, self.current_stage)
+                if estimate is not None:
+                    eta += max(estimate - in_stage, 0.0)
+                    known = True
+
+        for stage in self._remaining_stages():
+            estimate = self.tracker.stage_estimate(self.kind, stage)
+            if estimate is not None:
+                eta += estimate
+                known = True
+
+        return round(eta, 1) if known else None
+
+    def _percent(self):
+        if not self.stages or self.current_stage not in self.stages:
+            return None
+        index = self.stages.index(self.current_stage)
+        fraction = 0.0
+        if self._batch and self._batch[1]:
+            fraction = min(self._batch[0] / self._batch[1], 1.0)
+        return round(100.0 * (index + fraction) / len(self.stages), 1)
+
+    def _emit(self, event_type, **fields):
+        with self._lock:
+            if self._closed:
+                return
+            self._sequence += 1
+            event = {
+                'id': self._sequence,
+                'type': event_type,
+                'operation_id': self.operation_id,
+                'kind': self.kind,
+                'stage': self.current_stage,
+                'elapsed': round(time.time() - self.started_at, 2),
+                'time': time.time()
+            }
+            if event_type not in TERMINAL_EVENTS:
+                event['percent'] = self._percent()
+                event['eta_seconds'] = self._eta()
+            event.update({key: value for key, value in fields.items() if value is not None})
+            try:
+                with open(self._path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(event) + '\n')
+            except OSError as e:
+                logging.warning(f"Could not record progress for {self.operation_id}: {e}")
+            if event_type in TERMINAL_EVENTS:
+                self._closed = True
+
+    def _finish_stage(self):
+        if self.current_stage is not None:
+            self.tracker.record_stage(self.kind, self.current_stage, time.time() - self._stage_started_at)
+
+    def stage(self, name, message=None):
+        """Enter a new stage (closing the previous one)"""
+        self._finish_stage()
+        self.current_stage = name
+        self._stage_started_at = time.time()
+        self._batch = None
+        self._emit('stage', message=message)
+
+    def batch(self, done, total, message=None):
+        """Report `done` of `total` units finished in the current stage"""
+        if self._batch is None:
+            # Rate is measured from the start of the stage, so the first batch counts too
+            self._batch = [done, total, self._stage_started_at or time.time()]
+        else:
+            self._batch[0], self._batch[1] = done, total
+        self._emit('batch', done=done, total=total, message=message)
+
+    def complete(self, **result):
+        """Mark the operation finished; `result` is passed to subscribers"""
+        self._finish_stage()
+        self.current_stage = None
+        self._emit('complete', percent=100.0, eta_seconds=0, result=result or None)
+
+    def fail(self, error):
+        self._emit('error', error=str(error))
+
+
+class ProgressTracker:
+    """Creates operations and serves their event logs as SSE streams"""
+
+    def __init__(self, folder='progress', max_age_seconds=3600, poll_interval=0.25):
+        """
+        Args:
+            folder (str): Directory for the per-operation event logs
+            max_age_seconds (int): Event logs older than this are purged
+            poll_interval (float): How often streams check the log for new events
+        """
+        self.folder = folder
+        self.max_age_seconds = max_age_seconds
+        self.poll_interval = poll_interval
+        self._estimates = {}
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def valid_id(operation_id):
+        return bool(operation_id) and bool(OPERATION_ID_PATTERN.match(operation_id))
+
+    def event_path(self, operation_id):
+        return os.path.join(self.folder, f"{operation_id}.jsonl")
+
+    def start(self, kind, stages=None, operation_id=None):
+        """
+        Begin tracking an operation.
+
+        Args:
+            kind (str): Operation type ('report', 'wanted_list', 'bricklink_upload')
+            stages (list): Expected stage names in order, for percent and ETA
+            operation_id (str): Client-chosen id (so it can subscribe before
+                starting the request); a new one is generated if missing or invalid
+
+        Raises:
+            OperationIdInUse: `operation_id` belongs to another operation whose
+                log has not been purged yet
+        """
+        self._purge_stale()
+        if not self.valid_id(operation_id):
+            operation_id = uuid.uuid4().hex
+        return Operation(self, operation_id, kind, stages)
+
+    def record_stage(self, kind, stage, duration):
+        """Fold a finished stage duration into the moving average used for ETAs"""
+        with self._lock:
+            previous = self._estimates.get((kind, stage))
+            self._estimates[(kind, stage)] = duration if previous is None else 0.7 * previous + 0.3 * duration
+
+    def stage_estimate(self, kind, stage):
+        with self._lock:
+            return self._estimates.get((kind, stage))
+
+    def _purge_stale(self):
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+        self._last_purge = now
+        try:
+            for name in os.listdir(self.folder):
+                path = os.path.join(self.folder, name)
+                if name.endswith('.jsonl') and now - os.path.getmtime(path) > self.max_age_seconds:
+                    os.remove(path)
+        except OSError as e:
+            logging.warning(f"Could not purge progress logs: {e}")
+
+    def read_events(self, operation_id, offset=0):
+        """Return (events, new_offset) for the complete lines after `offset`"""
+        try:
+            with open(self.event_path(operation_id), 'r', encoding='utf-8') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+
+        complete, _, _ = data.rpartition('\n')
+        if not complete:
+            return [], offset
+        events = [json.loads(line) for line in complete.split('\n') if line]
+        return events, offset + len(complete.encode('utf-8')) + 1
+
+    def latest(self, operation_id):
+        """Last event recorded for an operation, or None"""
+        events, _ = self.read_events(operation_id)
+        return events[-1] if events else None
+
+    def stream(self, operation_id, last_event_id=0, wait_for_start=60, heartbeat=15, timeout=3600):
+        """
+        Yield SSE messages for an operation until it completes or fails.
+
+        Subscribing before the operation has started is allowed: the stream
+        waits up to `wait_for_start` seconds for the first event. Comment
+        lines are sent every `heartbeat` seconds to keep proxies from closing
+        an idle connection. Events already seen (`Last-Event-ID`) are skipped.
+        """
+        yield "retry: 2000\n\n"
+        offset = 0
+        started = time.time()
+        last_sent = started
+        seen_any = False
+
+        while True:
+            events, offset = self.read_events(operation_id, offset)
+            for event in events:
+                seen_any = True
+                if event['id'] <= last_event_id:
+                    continue
+                last_sent = time.time()
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event['type'] in TERMINAL_EVENTS:
+                    return
+
+            now = time.time()
+            if (not seen_any and now - started > wait_for_start) or now - started > timeout:
+                yield f"event: timeout\ndata: {json.dumps({'operation_id': operation_id})}\n\n"
+                return
+            if now - last_sent >= heartbeat:
+                last_sent = now
+                yield ": keep-alive\n\n"
+            time.sleep(self.poll_interval)
@@ -0,0 +1,176 @@
+"""
+Retention Service for LEGO Analysis System
+Background sweeper enforcing age and disk quotas on uploads and reports
+"""
+
+import os
+import logging
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+class RetentionSweeper:
+    """
+    Enforces per-folder retention policies using the file metadata index.
+
+    Each policy may set `max_age_hours` (files older than this are removed)
+    and `max_total_mb` (oldest files are removed until the folder fits).
+    Files inside subdirectories such as `filtered_<timestamp>` are indexed
+    individually; directories left empty by a sweep are removed as well.
+    The index is queried directly: with several worker processes it picks up
+    their saves itself, so a sweep never walks the folders.
+    """
+
+    def __init__(self, file_index, policies, interval_seconds=3600, min_age_seconds=600):
+        """
+        Args:
+            file_index (FileMetadataIndex): Index of the folders to sweep
+            policies (dict): Folder name -> {'max_age_hours': ..., 'max_total_mb': ...}
+            interval_seconds (int): Pause between background sweeps
+            min_age_seconds (int): Files younger than this are never evicted for quota
+        """
+        self.file_index = file_index
+        self.policies = policies
+        self.interval_seconds = interval_seconds
+        self.min_age_seconds = min_age_seconds
+        self._stop_event = threading.Event()
+        self._sweep_lock = threading.Lock()
+        self._thread = None
+        self._metrics = {
+            'runs': 0,
+            'files_removed': 0,
+            'dirs_removed': 0,
+            'bytes_reclaimed': 0,
+            'bytes_reclaimed_by_folder': {name: 0 for name in policies},
+            'last_run': None,
+            'last_result': None
+        }
+
+    def start(self):
+        """Start sweeping in a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+
+        def run_sweeper():
+            while not self._stop_event.wait(self.interval_seconds):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logging.error(f"Retention sweep failed: {e}")
+
+        self._thread = threading.Thread(target=run_sweeper, name='retention-sweeper', daemon=True)
+        self._thread.start()
+        logging.info(f"Retention sweeper started (every {self.interval_seconds}s)")
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        logging.info("Retention sweeper stopped")
+
+    def sweep(self, max_age_seconds=None):
+        """
+        Run one sweep over every folder with a policy.
+
+        Args:
+            max_age_seconds (float): Override the configured age limit for all folders
+
+        Returns:
+            dict: Files, directories and bytes removed per folder
+        """
+        with self._sweep_lock:
+            now = time.time()
+            result = {'files_removed': 0, 'dirs_removed': 0, 'bytes_reclaimed': 0, 'folders': {}}
+
+            for folder_name, policy in self.policies.items():
+                folder_result = self._sweep_folder(folder_name, policy, now, max_age_seconds)
+                result['folders'][folder_name] = folder_result
+                for key in ('files_removed', 'dirs_removed', 'bytes_reclaimed'):
+                    result[key] += folder_result[key]
+                self._metrics['bytes_reclaimed_by_folder'][folder_name] = (
+                    self._metrics['bytes_reclaimed_by_folder'].get(folder_name, 0)
+                    + folder_result['bytes_reclaimed']
+                )
+
+            if result['files_removed']:
+                self.file_index.save()
+
+            self._metrics['runs'] += 1
+            self._metrics['files_removed'] += result['files_removed']
+            self._metrics['dirs_removed'] += result['dirs_removed']
+            self._metrics['bytes_reclaimed'] += result['bytes_reclaimed']
+            self._metrics['last_run'] = datetime.fromtimestamp(now).isoformat()
+            self._metrics['last_result'] = result
+
+            if result['files_removed']:
+                logging.info(f"Retention sweep removed {result['files_removed']} files, "
+                             f"{result['dirs_removed']} folders, {result['bytes_reclaimed']} bytes")
+            return result
+
+    def _sweep_folder(self, folder_name, policy, now, max_age_override):
+        folder_path = self.file_index.folders[folder_name]
+        result = {'files_removed': 0, 'dirs_removed': 0, 'bytes_reclaimed': 0}
+
+        max_age_hours = policy.get('max_age_hours')
+        max_age = max_age_override if max_age_override is not None else (
+            max_age_hours * 3600 if max_age_hours else None
+        )
+        max_total_mb = policy.get('max_total_mb')
+        max_total = max_total_mb * 1024 * 1024 if max_total_mb else None
+
+        entries = sorted(self.file_index.entries(folder_name), key=lambda e: e[1]['created_at'])
+        total_bytes = self.file_index.stats()[folder_name]['bytes']
+        touched_dirs = set()
+
+        for rel_path, entry in entries:
+            age = now - entry['created_at']
+            expired = max_age is not None and age > max_age
+            over_quota = (max_total is not None and total_bytes > max_total
+                          and age > self.min_age_seconds)
+            if not (expired or over_quota):
+                # Entries are sorted oldest first: nothing newer can qualify either
+                break
+
+            full_path = os.path.join(folder_path, rel_path)
+            try:
+                if os.path.isfile(full_path):
+                    os.remove(full_path)
+            except OSError as e:
+                logging.warning(f"Retention could not remove {full_path}: {e}")
+                continue
+
+            self.file_index.remove(folder_name, rel_path, save=False)
+            total_bytes -= entry['size']
+            result['files_removed'] += 1
+            result['bytes_reclaimed'] += entry['size']
+
+            parent = Path(rel_path).parent
+            if parent != Path('.'):
+                touched_dirs.add(parent)
+
+        # Remove directories (deepest first) that the sweep left empty
+        for rel_dir in sorted(touched_dirs, key=lambda p: len(p.parts), reverse=True):
+            for candidate in [rel_dir, *rel_dir.parents]:
+                if candidate == Path('.'):
+                    break
+                try:
+                    os.rmdir(os.path.join(folder_path, candidate))
+                    result['dirs_removed'] += 1
+                except OSError:
+                    break  # Not empty or already gone
+
+        return result
+
+    def metrics(self):
+        """Return cumulative sweep metrics"""
+        with self._sweep_lock:
+            metrics = dict(self._metrics)
+            metrics['bytes_reclaimed_by_folder'] = dict(self._metrics['bytes_reclaimed_by_folder'])
+            metrics['running'] = bool(self._thread and self._thread.is_alive())
+            metrics['policies'] = self.policies
+            return metrics
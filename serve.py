@@ -0,0 +1,201 @@
+"""
+Production Server for LEGO Analysis System
+Pre-forked worker processes sharing one listening socket, with warm-up and graceful shutdown
+
+Usage:
+    python serve.py [--host 0.0.0.0] [--port 5001] [--workers N] [--graceful-timeout 30]
+
+The app is built and warmed once in the parent (dashboard routes, color
+mappings, ReportLab styles, matplotlib font cache) and then forked, so every
+worker starts with the caches already in (copy-on-write shared) memory.
+Each worker runs a threaded WSGI server on the inherited socket; the kernel
+spreads incoming connections across workers, so throughput scales with cores.
+
+SIGTERM or SIGINT stops accepting connections, lets in-flight requests finish
+(up to --graceful-timeout seconds) and then exits. Workers that die are
+restarted. Workers share state through a temporary directory: admission
+slots are lock files there, so the concurrency limits hold for the whole
+server, and /metrics merges the samples every worker writes there. The
+file index is shared through its own file lock. Caches stay per worker.
+
+Platforms without fork() (Windows) run a single threaded process.
+"""
+
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+
+
+def _run_worker(app, host, port, fd, worker_id, start_retention, shared_dir, workers):
+    """Serve requests on an inherited listening socket until SIGTERM/SIGINT"""
+    from werkzeug.serving import make_server
+    import metrics
+    import web_app
+
+    # Limits and metrics for the server as a whole, not for this worker alone
+    web_app.admission.share_across_processes(os.path.join(shared_dir, 'admission'), workers)
+    metrics.registry.enable_multiprocess(os.path.join(shared_dir, 'metrics'))
+
+    server = make_server(host, port, app, threaded=True, fd=fd)
+    # Track request threads so server_close() waits for in-flight requests
+    server.daemon_threads = False
+
+    def request_shutdown(signum, frame):
+        # shutdown() blocks until serve_forever returns: call it off the main thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+    signal.signal(signal.SIGINT, request_shutdown)
+
+    if start_retention:
+        # One sweeper for all workers; the shared index shows it what the others wrote
+        web_app.retention_sweeper.start()
+        if web_app.maintenance_config.get('enabled', False):
+            web_app.analytics_maintenance.start()
+
+    logging.info(f"Worker {worker_id} (pid {os.getpid()}) serving on {host}:{port}")
+    server.serve_forever()  # closes the server (joining request threads) on exit
+    if start_retention:
+        web_app.retention_sweeper.stop()
+        web_app.analytics_maintenance.stop()
+    metrics.registry.flush()
+    logging.info(f"Worker {worker_id} (pid {os.getpid()}) stopped")
+
+
+class PreforkServer:
+    """Parent process: binds the socket, forks workers, restarts and stops them"""
+
+    def __init__(self, app, host, port, workers, graceful_timeout=30, retention=True):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.retention = retention
+        self.children = {}  # pid -> worker id
+        self.stopping = False
+        self.socket = None
+        self.shared_dir = None
+
+    def _spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                _run_worker(self.app, self.host, self.port, self.socket.fileno(), worker_id,
+                            start_retention=self.retention and worker_id == 0,
+                            shared_dir=self.shared_dir, workers=self.workers)
+            except Exception as e:
+                logging.error(f"Worker {worker_id} crashed: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.children[pid] = worker_id
+        return pid
+
+    def _handle_stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        logging.info(f"Shutting down {len(self.children)} workers (graceful timeout {self.graceful_timeout}s)")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        timer = threading.Timer(self.graceful_timeout, self._kill_remaining)
+        timer.daemon = True
+        timer.start()
+
+    def _kill_remaining(self):
+        for pid in list(self.children):
+            logging.warning(f"Worker pid {pid} did not stop in time, killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        self.socket = socket.create_server((self.host, self.port), backlog=128)
+        self.shared_dir = tempfile.mkdtemp(prefix='lego-serve-')
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        logging.info(f"Serving on http://{self.host}:{self.port} with {self.workers} workers")
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            worker_id = self.children.pop(pid, None)
+            if worker_id is None or self.stopping:
+                continue
+            logging.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)  # Avoid a tight crash loop
+            if not self.stopping:
+                self._spawn(worker_id)
+
+        self.socket.close()
+        shutil.rmtree(self.shared_dir, ignore_errors=True)
+        logging.info("Server stopped")
+
+
+def _run_single_process(app, host, port, retention=True):
+    """Fallback without fork(): one threaded server, stopped cleanly on Ctrl+C"""
+    from werkzeug.serving import make_server
+    import web_app
+
+    server = make_server(host, port, app, threaded=True)
+    server.daemon_threads = False
+    if retention:
+        web_app.retention_sweeper.start()
+        if web_app.maintenance_config.get('enabled', False):
+            web_app.analytics_maintenance.start()
+    logging.info(f"Serving on http://{host}:{port} (single process)")
+    try:
+        server.serve_forever()
+    finally:
+        if retention:
+            web_app.retention_sweeper.stop()
+            web_app.analytics_maintenance.stop()
+
+
+def main(argv=None):
+    import web_app
+
+    server_config = web_app.config.get('server', {})
+    parser = argparse.ArgumentParser(description='LEGO Analysis System production server')
+    parser.add_argument('--host', default=server_config.get('host', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=web_app.get_server_port())
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('LEGO_WORKERS') or server_config.get('workers', 0))
+                        or os.cpu_count() or 1)
+    parser.add_argument('--graceful-timeout', type=int, default=server_config.get('graceful_timeout', 30))
+    parser.add_argument('--no-warm-up', action='store_true', help='Skip cache warm-up at startup')
+    args = parser.parse_args(argv)
+
+    app = web_app.create_app(warm=not args.no_warm_up)
+    retention = web_app.retention_config.get('enabled', True)
+
+    if args.workers > 1 and hasattr(os, 'fork'):
+        PreforkServer(app, args.host, args.port, args.workers,
+                      graceful_timeout=args.graceful_timeout, retention=retention).run()
+    else:
+        _run_single_process(app, args.host, args.port, retention=retention)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,17 +9,17 @@ matplotlib.use('Agg')  # Non-interactive backend for web applications
 import matplotlib.pyplot as plt
 plt.ioff()  # Turn off interactive mode
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, send_from_directory
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, Response, stream_with_context
 import os
 import logging
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import os
+import re
 import json
 import logging
 from pathlib import Path
 import tempfile
-import zipfile
 import time
 from datetime import datetime
 import sys
@@ -37,10 +37,11 @@ except ImportError as e:
     ModernReportGenerator = None
 
 try:
-    from input_handlers import MultiFormatInputParser
+    from input_handlers import MultiFormatInputParser, get_parse_cache
 except ImportError as e:
     print(f"⚠️  Warning: Could not import input_handlers: {e}")
     MultiFormatInputParser = None
+    get_parse_cache = None
 
 try:
     from dashboard import DashboardAnalytics, create_dashboard_app
@@ -64,6 +65,17 @@ except ImportError as e:
     BrickLinkAPIError = None
     BRICKLINK_AVAILABLE = False
 
+from file_index import FileMetadataIndex
+from chunked_uploads import ChunkedUploadManager, ChunkedUploadError
+from zip_transfer import iter_zip_stream, import_zip_archive
+from retention import RetentionSweeper
+from analytics_maintenance import AnalyticsMaintenance
+from http_caching import send_cached_file
+from http_compression import json_response
+from admission import AdmissionController
+from progress import ProgressTracker, OperationIdInUse
+import metrics
+
 # Load configuration
 def load_config():
     """Load application configuration"""
@@ -89,6 +101,9 @@ REPORTS_FOLDER = config.get('reports', {}).get('output_folder', 'reports')
 ALLOWED_EXTENSIONS = set(config.get('upload', {}).get('allowed_extensions', ['xml', 'csv', 'json']))
 MAX_FILE_SIZE = config.get('upload', {}).get('max_file_size', 16 * 1024 * 1024)  # 16MB
 
+# Per-request timing (sets request.start_time) and Prometheus /metrics
+metrics.init_app(app)
+
 # Configure Flask to not watch upload directory for changes
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # Disable caching
 app.config['TEMPLATES_AUTO_RELOAD'] = config.get('server', {}).get('auto_reload', False)
@@ -102,6 +117,67 @@ os.makedirs(REPORTS_FOLDER, exist_ok=True)
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# Metadata index of uploads and reports (serves /api/stats without folder scans)
+_format_parser = MultiFormatInputParser() if MultiFormatInputParser else None
+file_index = FileMetadataIndex(
+    folders={'uploads': UPLOAD_FOLDER, 'reports': REPORTS_FOLDER},
+    index_path=config.get('index', {}).get('path', 'file_index.json'),
+    format_resolver=_format_parser._get_format_name if _format_parser else None
+)
+
+# Background retention (age and size quotas per folder, driven by the metadata index)
+retention_config = config.get('retention', {})
+retention_sweeper = RetentionSweeper(
+    file_index,
+    policies={
+        'uploads': retention_config.get('uploads', {'max_age_hours': 7 * 24, 'max_total_mb': 1024}),
+        'reports': retention_config.get('reports', {'max_age_hours': 30 * 24, 'max_total_mb': 2048})
+    },
+    interval_seconds=retention_config.get('interval_minutes', 60) * 60
+)
+metrics.registry.counter(
+    'lego_retention_bytes_reclaimed_total', 'Bytes removed by the retention sweeper', ('folder',),
+    callback=lambda: {(folder,): value for folder, value in
+                      retention_sweeper.metrics()['bytes_reclaimed_by_folder'].items()}
+)
+metrics.registry.counter(
+    'lego_retention_files_removed_total', 'Files removed by the retention sweeper',
+    callback=lambda: retention_sweeper.metrics()['files_removed']
+)
+
+# Analytics database retention, archival and compaction (off unless enabled in config)
+maintenance_config = config.get('analytics_maintenance', {})
+analytics_maintenance = AnalyticsMaintenance(
+    maintenance_config.get('db_path', 'analytics.db'),
+    policy=maintenance_config.get('policy'),
+    archive_folder=maintenance_config.get('archive_folder', 'analytics_archive'),
+    interval_seconds=maintenance_config.get('interval_hours', 24) * 3600
+)
+metrics.registry.counter(
+    'lego_analytics_collections_expired_total', 'Analyses archived and deleted by analytics maintenance',
+    callback=lambda: analytics_maintenance.metrics()['collections_deleted']
+)
+metrics.registry.counter(
+    'lego_analytics_pages_vacuumed_total', 'Database pages freed by analytics maintenance',
+    callback=lambda: analytics_maintenance.metrics()['pages_vacuumed']
+)
+
+# Live progress (SSE) for report generation, wanted lists and BrickLink uploads
+progress_tracker = ProgressTracker(config.get('progress', {}).get('folder', 'progress'))
+REPORT_STAGES = ['parse', 'aggregate', 'render', 'pdf_build']
+WANTED_LIST_STAGES = ['copy', 'combine', 'xml_write']
+BRICKLINK_UPLOAD_STAGES = ['prepare', 'upload']
+
+# Concurrency limits for heavy endpoints (report, wanted list, BrickLink sync)
+admission = AdmissionController(config.get('admission'))
+
+# Resumable chunked uploads (each chunk stays below MAX_CONTENT_LENGTH)
+chunked_uploads = ChunkedUploadManager(
+    staging_folder=config.get('upload', {}).get('chunk_folder', 'uploads_partial'),
+    max_upload_size=config.get('upload', {}).get('max_chunked_size', 1024 * 1024 * 1024),  # 1GB
+    chunk_size=min(4 * 1024 * 1024, MAX_FILE_SIZE // 2)
+)
+
 # Color mapping function
 def get_color_hex(color_id):
     """Convert BrickLink color ID to hex color for display"""
@@ -140,6 +216,23 @@ def utility_processor():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def new_upload_destination(original_name):
+    """Return (stored_filename, filepath) for a new upload, avoiding collisions"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    stem, dot, ext = original_name.rpartition('.')
+    candidate = original_name
+    counter = 1
+    while os.path.exists(os.path.join(UPLOAD_FOLDER, f"{timestamp}_{candidate}")):
+        counter += 1
+        candidate = f"{stem}_{counter}.{ext}" if dot else f"{original_name}_{counter}"
+    filename = f"{timestamp}_{candidate}"
+    return filename, os.path.join(UPLOAD_FOLDER, filename)
+
+def warm_uploaded_file(filepath):
+    """Queue background parsing so /analyze and report generation find warm results"""
+    if get_parse_cache is not None:
+        get_parse_cache().warm(filepath)
+
 @app.route('/')
 def index():
     """Main dashboard page"""
@@ -157,6 +250,21 @@ def upload_files():
         uploaded_files = []
         
         for file in files:
+            # ZIP archives of set inventories are unpacked straight into the upload store
+            if file and file.filename.lower().endswith('.zip'):
+                try:
+                    imported = import_zip_archive(file.stream, ALLOWED_EXTENSIONS, new_upload_destination)
+                    for filename in imported:
+                        file_index.register('uploads', filename, save=False)
+                        warm_uploaded_file(os.path.join(UPLOAD_FOLDER, filename))
+                    file_index.save()
+                    uploaded_files.extend(imported)
+                    logging.info(f"Imported {len(imported)} files from archive {file.filename}")
+                except Exception as e:
+                    logging.error(f"Error importing archive {file.filename}: {e}")
+                    flash(f'Error importing {file.filename}: {str(e)}')
+                continue
+            
             if file and file.filename != '' and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -172,6 +280,8 @@ def upload_files():
                     # Quick rename to final name
                     import shutil
                     shutil.move(temp_filepath, filepath)
+                    file_index.register('uploads', filename)
+                    warm_uploaded_file(filepath)
                     
                     uploaded_files.append(filename)
                     logging.info(f"File uploaded successfully: {filename}")
@@ -191,6 +301,71 @@ def upload_files():
     
     return render_template('upload.html')
 
+@app.route('/upload/chunked', methods=['POST'])
+def chunked_upload_start():
+    """Start a resumable chunked upload"""
+    data = request.get_json() or {}
+    filename = data.get('filename', '')
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Unsupported or missing filename'}), 400
+    
+    try:
+        session = chunked_uploads.create(
+            secure_filename(filename),
+            int(data.get('size', 0)),
+            data.get('sha256')
+        )
+        return jsonify(session), 201
+    except (ChunkedUploadError, ValueError) as e:
+        return jsonify({'error': str(e)}), getattr(e, 'status_code', 400)
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def chunked_upload_session(upload_id):
+    """Query the offset of, append a chunk to, or cancel a chunked upload"""
+    try:
+        if request.method == 'GET':
+            return jsonify(chunked_uploads.status(upload_id))
+        
+        if request.method == 'DELETE':
+            chunked_uploads.abort(upload_id)
+            return jsonify({'success': True})
+        
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({'error': 'Missing offset parameter'}), 400
+        
+        new_offset = chunked_uploads.append(upload_id, offset, request.stream, request.content_length)
+        return jsonify({'upload_id': upload_id, 'offset': new_offset})
+    
+    except ChunkedUploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status_code
+
+@app.route('/upload/chunked/<upload_id>/complete', methods=['POST'])
+def chunked_upload_complete(upload_id):
+    """Verify a finished chunked upload and register it like a regular upload"""
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        session = chunked_uploads.status(upload_id)
+        filename, filepath = new_upload_destination(session['filename'])
+        
+        result = chunked_uploads.complete(upload_id, filepath, data.get('sha256'))
+        file_index.register('uploads', filename)
+        warm_uploaded_file(filepath)
+        logging.info(f"File uploaded successfully (chunked): {filename}")
+        
+        return jsonify({
+            'success': True,
+            'filename': filename,
+            'size': result['size'],
+            'sha256': result['sha256'],
+            'analyze_url': url_for('analyze', files=filename)
+        })
+    
+    except ChunkedUploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status_code
+
 @app.route('/analyze')
 def analyze():
     """Analyze uploaded files"""
@@ -214,9 +389,8 @@ def analyze():
             flash('Input parser not available. Please check dependencies.')
             return redirect(url_for('upload_files'))
         
-        logging.info("Creating MultiFormatInputParser instance")
-        # Parse files using multi-format parser
-        parser = MultiFormatInputParser()
+        # Parse files using multi-format parser (warm results from upload time when ready)
+        parse_cache = get_parse_cache()
         analysis_results = {}
         
         for filename in filenames:
@@ -226,16 +400,18 @@ def analyze():
             
             if os.path.exists(filepath):
                 logging.info(f"File exists, parsing: {filepath}")
-                items = parser.parse_file(filepath)
+                parsed = parse_cache.get(filepath)
+                items = parsed['items']
                 logging.info(f"Parsed {len(items)} items")
                 
-                format_name = parser._get_format_name(filepath)
+                format_name = parsed['format']
                 logging.info(f"Format detected: {format_name}")
                 
                 analysis_results[filename] = {
                     'parsed_items': items,  # Rinomino da 'items' a 'parsed_items' per evitare conflitto con .items()
                     'count': len(items),
-                    'format': format_name
+                    'format': format_name,
+                    'summary': parsed['summary']
                 }
                 logging.info(f"Added to results: {filename}")
                 logging.info(f"Items type: {type(items)}, Count: {len(items)}")
@@ -257,8 +433,10 @@ def analyze():
         return redirect(url_for('upload_files'))
 
 @app.route('/generate_report', methods=['POST'])
+@admission.limit('report')
 def generate_report():
     """Generate PDF report from uploaded files with different report types"""
+    operation = None
     try:
         data = request.get_json()
         filenames = data.get('files', [])
@@ -271,10 +449,14 @@ def generate_report():
         if not filenames:
             return jsonify({'error': 'No files specified'}), 400
         
+        operation = progress_tracker.start('report', REPORT_STAGES, data.get('operation_id'))
+        operation.stage('parse', f"Loading {len(filenames)} file(s)")
+        
         # Create temporary directory for processing
         with tempfile.TemporaryDirectory() as temp_dir:
             # Copy selected files to temp directory
             copied_files = 0
+            parsed_items = {}
             for filename in filenames:
                 src = os.path.join(UPLOAD_FOLDER, filename)
                 # Remove timestamp from filename (format: YYYYMMDD_HHMMSS_original_name.xml)
@@ -285,12 +467,20 @@ def generate_report():
                     shutil.copy2(src, dst)
                     copied_files += 1
                     logging.info(f"Copied file {copied_files}/{len(filenames)}: {original_name}")
+                    
+                    # Reuse items parsed at upload time instead of re-reading the XML
+                    if get_parse_cache is not None and original_name.lower().endswith('.xml'):
+                        try:
+                            parsed_items[original_name] = get_parse_cache().get(src)['items']
+                        except Exception as e:
+                            logging.warning(f"Warm parse unavailable for {filename}: {e}")
+                    operation.batch(copied_files, len(filenames), f"Loaded {original_name}")
             
             logging.info(f"Successfully copied {copied_files} files to temporary directory")
             
-            # Generate report with type-specific filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Generate report with type-specific filename (joining the wanted list run if any)
             report_type_suffix = f"_{report_type}" if report_type != 'summary' else ""
+            timestamp = run_timestamp(data.get('run'), f"lego_report{report_type_suffix}_{{run}}.pdf")
             report_filename = f"lego_report{report_type_suffix}_{timestamp}.pdf"
             report_path = os.path.join(REPORTS_FOLDER, report_filename)
             
@@ -301,7 +491,9 @@ def generate_report():
                 report_generator = ModernReportGenerator(
                     folder_path=temp_dir,
                     color_mapping_path='BL_color_mapping.json',
-                    output_pdf=report_path
+                    output_pdf=report_path,
+                    parsed_items=parsed_items,
+                    progress=operation
                 )
                 
                 # Generate report based on type
@@ -313,6 +505,7 @@ def generate_report():
                     report_generator.generate_complete_report()
             else:
                 # Fallback to existing LegoColorReport if ModernReportGenerator not available
+                operation.stage('render', 'Rendering report')
                 report = LegoColorReport(
                     folder_path=temp_dir,
                     color_mapping_path='BL_color_mapping.json',
@@ -320,34 +513,56 @@ def generate_report():
                 )
                 report.process()
             
+            if os.path.exists(report_path):
+                file_index.register('reports', report_filename)
+            
             logging.info(f"=== PDF REPORT GENERATION COMPLETED ===")
             logging.info(f"Output file: {report_filename}")
             
+            operation.complete(report_url=f'/download_report/{report_filename}', filename=report_filename)
             return jsonify({
                 'success': True,
                 'report_url': f'/download_report/{report_filename}',
                 'filename': report_filename,
                 'report_type': report_type,
-                'files_processed': copied_files
+                'run': timestamp,
+                'bundle_url': url_for('download_bundle', run=timestamp),
+                'files_processed': copied_files,
+                'operation_id': operation.operation_id
             })
     
+    except OperationIdInUse as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         logging.error(f"Error generating report: {e}")
+        if operation is not None:
+            operation.fail(e)
         return jsonify({'error': str(e)}), 500
 
+def send_report_file(filename):
+    """Send a generated output with its content hash as ETag (outputs are never rewritten)"""
+    entry = file_index.get('reports', filename)
+    return send_cached_file(
+        os.path.join(REPORTS_FOLDER, filename),
+        etag=entry['sha256'] if entry else None,
+        immutable=entry is not None
+    )
+
 @app.route('/download_report/<filename>')
 def download_report(filename):
     """Download generated report"""
     report_path = os.path.join(REPORTS_FOLDER, filename)
-    if os.path.exists(report_path):
-        return send_file(report_path, as_attachment=True)
+    if os.path.isfile(report_path):
+        return send_report_file(filename)
     else:
         flash('Report not found')
         return redirect(url_for('index'))
 
 @app.route('/generate_wanted_list', methods=['POST'])
+@admission.limit('wanted_list')
 def generate_wanted_list():
     """Generate wanted list XML from selected files with detailed logging"""
+    operation = None
     try:
         data = request.get_json()
         filenames = data.get('files', [])
@@ -360,6 +575,9 @@ def generate_wanted_list():
         for i, filename in enumerate(filenames, 1):
             logging.info(f"  {i}. {filename}")
 
+        operation = progress_tracker.start('wanted_list', WANTED_LIST_STAGES, data.get('operation_id'))
+        operation.stage('copy', f"Copying {len(filenames)} file(s)")
+
         # Create temporary directory for processing
         with tempfile.TemporaryDirectory() as temp_dir:
             logging.info(f"Created temporary directory: {temp_dir}")
@@ -376,11 +594,12 @@ def generate_wanted_list():
                     shutil.copy2(src, dst)
                     copied_files += 1
                     logging.info(f"Copied file {copied_files}/{len(filenames)}: {original_name}")
+                    operation.batch(copied_files, len(filenames), f"Copied {original_name}")
             
             logging.info(f"Successfully copied {copied_files} files to temporary directory")
             
-            # Generate wanted list XML
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Generate wanted list XML (joining the report run if any)
+            timestamp = run_timestamp(data.get('run'), "wanted_list_{run}.xml")
             wanted_list_filename = f"wanted_list_{timestamp}.xml"
             wanted_list_path = os.path.join(REPORTS_FOLDER, wanted_list_filename)
             filtered_folder = os.path.join(REPORTS_FOLDER, f"filtered_{timestamp}")
@@ -394,13 +613,17 @@ def generate_wanted_list():
             combiner = LegoXmlCombiner(
                 folder_path=temp_dir,
                 filtered_folder=filtered_folder,
-                output_file=wanted_list_path
+                output_file=wanted_list_path,
+                progress=operation
             )
             
             logging.info("Starting XML processing...")
             combiner.process()
             logging.info("XML processing completed successfully!")
             
+            file_index.register('reports', wanted_list_filename, save=False)
+            file_index.register_tree('reports', os.path.basename(filtered_folder))
+            
             # Add performance info
             combiner.stats['processing_time'] = f"{time.time() - request.start_time:.2f}s" if hasattr(request, 'start_time') else 'unknown'
             
@@ -408,44 +631,106 @@ def generate_wanted_list():
             logging.info(f"Output file: {wanted_list_filename}")
             logging.info(f"Statistics: {combiner.stats}")
             
+            operation.complete(wanted_list_url=f'/download_report/{wanted_list_filename}',
+                               filename=wanted_list_filename)
             return jsonify({
                 'success': True,
                 'wanted_list_url': f'/download_report/{wanted_list_filename}',
                 'filename': wanted_list_filename,
-                'stats': combiner.stats
+                'run': timestamp,
+                'bundle_url': url_for('download_bundle', run=timestamp),
+                'stats': combiner.stats,
+                'operation_id': operation.operation_id
             })
             
+    except OperationIdInUse as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         logging.error(f"Error generating wanted list: {e}")
+        if operation is not None:
+            operation.fail(e)
         return jsonify({'error': str(e)}), 500
 
+# Outputs of one run share its timestamp: lego_report[_<type>]_<run>.pdf, wanted_list_<run>.xml, filtered_<run>/
+RUN_ID_PATTERN = re.compile(r'\d{8}_\d{6}')
+RUN_OUTPUT_PATTERN = re.compile(
+    rf'(?:lego_report(?:_[a-z]+)?|wanted_list|filtered)_({RUN_ID_PATTERN.pattern})(?:\.\w+)?'
+)
+
+def run_timestamp(requested_run, output_name):
+    """Timestamp for new outputs: the requested run, unless it already has `output_name`"""
+    if (requested_run and RUN_ID_PATTERN.fullmatch(str(requested_run))
+            and not os.path.exists(os.path.join(REPORTS_FOLDER, output_name.format(run=requested_run)))):
+        return requested_run
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+def output_run(rel_path):
+    """Run timestamp of a reports entry, from its top-level name (None if not a run output)"""
+    match = RUN_OUTPUT_PATTERN.fullmatch(rel_path.split('/')[0])
+    return match.group(1) if match else None
+
+@app.route('/download_bundle')
+def download_bundle():
+    """Stream a ZIP of generated outputs (PDF, wanted lists, filtered_* folders)"""
+    run = request.args.get('run', '')
+    if run and not RUN_ID_PATTERN.fullmatch(run):
+        # The run also names the ZIP in Content-Disposition: only the timestamp shape is accepted
+        return jsonify({'error': 'Invalid run id'}), 400
+    requested = [name for name in request.args.get('files', '').split(',') if name]
+    reports_root = os.path.realpath(REPORTS_FOLDER)
+    
+    if run:
+        requested.extend(
+            rel_path for rel_path, _ in file_index.entries('reports')
+            if output_run(rel_path) == run
+        )
+    
+    entries = []
+    seen = set()
+    for name in requested:
+        full_path = os.path.realpath(os.path.join(REPORTS_FOLDER, name))
+        if not full_path.startswith(reports_root + os.sep):
+            continue
+        if os.path.isdir(full_path):
+            paths = [os.path.join(root, f) for root, _, files in os.walk(full_path) for f in sorted(files)]
+        elif os.path.isfile(full_path):
+            paths = [full_path]
+        else:
+            paths = []
+        for path in paths:
+            arcname = Path(os.path.relpath(path, reports_root)).as_posix()
+            if arcname not in seen:
+                seen.add(arcname)
+                entries.append((arcname, path))
+    
+    if not entries:
+        return jsonify({'error': 'No matching outputs found'}), 404
+    
+    bundle_name = f"lego_outputs_{run or datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    return Response(
+        stream_with_context(iter_zip_stream(sorted(entries))),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{bundle_name}"'}
+    )
+
 @app.route('/api/stats')
 def api_stats():
-    """API endpoint for system statistics"""
+    """API endpoint for system statistics (served from the metadata index)"""
     try:
-        upload_count = len(os.listdir(UPLOAD_FOLDER))
-        
-        # Count different types of reports
-        report_files = os.listdir(REPORTS_FOLDER)
-        total_reports = len(report_files)
-        wanted_list_count = len([f for f in report_files if f.startswith('wanted_list_')])
-        
-        # Get file format distribution
-        parser = MultiFormatInputParser()
-        format_stats = {}
-        
-        for filename in os.listdir(UPLOAD_FOLDER):
-            filepath = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isfile(filepath):
-                format_name = parser._get_format_name(filepath)
-                format_stats[format_name] = format_stats.get(format_name, 0) + 1
+        stats = file_index.stats()
+        uploads = stats['uploads']
+        reports = stats['reports']
         
         return jsonify({
-            'uploads': upload_count,
-            'reports': total_reports,
-            'wanted_lists': wanted_list_count,
-            'supported_formats': parser.get_supported_formats(),
-            'format_distribution': format_stats
+            'uploads': uploads['files'],
+            'reports': reports['files'] - reports['kinds'].get('filtered', 0),
+            'wanted_lists': reports['kinds'].get('wanted_list', 0),
+            'supported_formats': _format_parser.get_supported_formats() if _format_parser else [],
+            'format_distribution': uploads['formats'],
+            'storage_bytes': {
+                'uploads': uploads['bytes'],
+                'reports': reports['bytes']
+            }
         })
     
     except Exception as e:
@@ -453,42 +738,76 @@ def api_stats():
 
 @app.route('/cleanup', methods=['POST'])
 def cleanup_files():
-    """Clean up old uploaded files and reports"""
+    """Clean up old uploaded files and reports (including filtered_* folders)"""
     try:
         # Remove files older than 24 hours
-        import time
-        current_time = time.time()
-        cleanup_count = 0
-        
-        for folder in [UPLOAD_FOLDER, REPORTS_FOLDER]:
-            for filename in os.listdir(folder):
-                filepath = os.path.join(folder, filename)
-                if os.path.isfile(filepath):
-                    file_age = current_time - os.path.getctime(filepath)
-                    if file_age > 86400:  # 24 hours
-                        os.remove(filepath)
-                        cleanup_count += 1
+        result = retention_sweeper.sweep(max_age_seconds=86400)
         
         return jsonify({
             'success': True,
-            'cleaned_files': cleanup_count
+            'cleaned_files': result['files_removed'],
+            'cleaned_folders': result['dirs_removed'],
+            'reclaimed_bytes': result['bytes_reclaimed']
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/retention')
+def api_retention():
+    """Retention sweeper metrics (reclaimed bytes, runs, policies)"""
+    return jsonify(retention_sweeper.metrics())
+
+@app.route('/api/analytics/maintenance')
+def api_analytics_maintenance():
+    """Analytics database maintenance metrics (expired analyses, vacuumed pages, policy)"""
+    return jsonify(analytics_maintenance.metrics())
+
+@app.route('/api/progress/<operation_id>')
+def api_progress(operation_id):
+    """Latest progress event of an operation (polling fallback for the SSE stream)"""
+    if not progress_tracker.valid_id(operation_id):
+        return jsonify({'error': 'Invalid operation id'}), 400
+    event = progress_tracker.latest(operation_id)
+    if event is None:
+        return jsonify({'error': 'Unknown operation'}), 404
+    return jsonify(event)
+
+@app.route('/api/progress/<operation_id>/events')
+def api_progress_events(operation_id):
+    """Server-Sent Events stream of stage and batch events (with ETA) for an operation"""
+    if not progress_tracker.valid_id(operation_id):
+        return jsonify({'error': 'Invalid operation id'}), 400
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', '0'))
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+    response = Response(
+        stream_with_context(progress_tracker.stream(operation_id, last_event_id)),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Stop reverse proxies from buffering events
+    return response
+
+@app.route('/api/admission')
+def api_admission():
+    """Concurrency limits, in-flight requests and queue depth per endpoint class"""
+    return jsonify(admission.status())
+
 @app.route('/reports/<filename>')
 def download_xml_file(filename):
     """Download XML or PDF reports"""
     try:
-        reports_dir = os.path.join(os.getcwd(), 'reports')
-        file_path = os.path.join(reports_dir, filename)
+        reports_dir = os.path.realpath(REPORTS_FOLDER)
+        file_path = os.path.realpath(os.path.join(reports_dir, filename))
         
         # Verifica che il file esista e sia nella cartella reports
-        if not os.path.exists(file_path) or not file_path.startswith(reports_dir):
+        if not os.path.isfile(file_path) or not file_path.startswith(reports_dir + os.sep):
             return jsonify({'error': 'File non trovato'}), 404
         
-        return send_from_directory(reports_dir, filename, as_attachment=True)
+        return send_report_file(filename)
         
     except Exception as e:
         logging.error(f"Error downloading file {filename}: {e}")
@@ -596,11 +915,13 @@ def bricklink_setup():
             return jsonify({'error': str(e)}), 500
 
 @app.route('/bricklink/upload', methods=['POST'])
+@admission.limit('bricklink_sync')
 def bricklink_upload():
     """Upload wanted list to BrickLink"""
     if not BRICKLINK_AVAILABLE:
         return jsonify({'error': 'BrickLink integration not available'}), 503
     
+    operation = None
     try:
         data = request.get_json()
         xml_file = data.get('xml_file')
@@ -627,9 +948,12 @@ def bricklink_upload():
         
         # Upload with automatic replacement
         logging.info(f"📤 Starting BrickLink upload for: {xml_file}")
-        result = sync.upload_wanted_list(xml_path, list_name, replace_existing=True)
+        operation = progress_tracker.start('bricklink_upload', BRICKLINK_UPLOAD_STAGES, data.get('operation_id'))
+        result = sync.upload_wanted_list(xml_path, list_name, replace_existing=True, progress=operation)
+        operation.complete(list_name=result['list_name'], uploaded_items=result['uploaded_items'])
         
         return jsonify({
+            'operation_id': operation.operation_id,
             'success': True,
             'message': f'Successfully {result["action"]} wanted list on BrickLink!',
             'details': {
@@ -644,9 +968,15 @@ def bricklink_upload():
         
     except BrickLinkAPIError as e:
         logging.error(f"BrickLink API error: {e}")
+        if operation is not None:
+            operation.fail(e)
         return jsonify({'error': f'BrickLink API error: {str(e)}'}), 500
+    except OperationIdInUse as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         logging.error(f"Error uploading to BrickLink: {e}")
+        if operation is not None:
+            operation.fail(e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/bricklink/status')
@@ -716,7 +1046,7 @@ def bricklink_lists():
                 'created': wl.get('date_created', '')
             })
         
-        return jsonify({'wanted_lists': wanted_lists})
+        return json_response({'wanted_lists': wanted_lists})
         
     except FileNotFoundError:
         return jsonify({'error': 'BrickLink credentials not configured'}), 401
@@ -724,31 +1054,65 @@ def bricklink_lists():
         logging.error(f"Error fetching BrickLink wanted lists: {e}")
         return jsonify({'error': str(e)}), 500
 
+_dashboard_registered = False
+_app_lock = threading.Lock()
+
+def register_dashboard_routes(target_app):
+    """Copy dashboard and dashboard API routes onto the main app"""
+    global DASHBOARD_AVAILABLE
+    if not DASHBOARD_AVAILABLE:
+        return False
+    try:
+        # Shared limiter and tracker: the sync's concurrency counts against this app's limits
+        dashboard_app = create_dashboard_app(admission=admission, progress_tracker=progress_tracker)
+        for rule in dashboard_app.url_map.iter_rules():
+            # Every dashboard view except the sub-app's own static route
+            if rule.endpoint != 'static' and rule.endpoint not in target_app.view_functions:
+                endpoint_func = dashboard_app.view_functions[rule.endpoint]
+                target_app.add_url_rule(rule.rule, rule.endpoint, endpoint_func, methods=rule.methods)
+        print("✅ Dashboard Interattiva Configurata!")
+        return True
+    except Exception as e:
+        print(f"⚠️  Dashboard non disponibile: {e}")
+        DASHBOARD_AVAILABLE = False
+        return False
+
+def warm_up():
+    """Load color mappings, ReportLab styles and the matplotlib font cache ahead of the first request"""
+    if ModernReportGenerator is not None:
+        from ModernReportGenerator import warm_up as warm_report_generator
+        warm_report_generator('BL_color_mapping.json')
+
+def create_app(warm=True):
+    """
+    Application factory: the fully configured app for any WSGI server.
+
+    Registers the dashboard routes (once per process) and optionally warms
+    the report caches. Usable as e.g. `gunicorn "web_app:create_app()"` or
+    through serve.py, which pre-forks workers after calling it.
+    """
+    global _dashboard_registered
+    with _app_lock:
+        if not _dashboard_registered:
+            register_dashboard_routes(app)
+            _dashboard_registered = True
+    if warm:
+        warm_up()
+    return app
+
+def get_server_port(default=5001):
+    """Port from the LEGO_PORT environment variable, then server.port in the config"""
+    return int(os.environ.get('LEGO_PORT') or config.get('server', {}).get('port', default))
+
 if __name__ == '__main__':
     print("🚀 Avvio LEGO Analysis System...")
     
-    # Initialize dashboard analytics if available
-    if DASHBOARD_AVAILABLE:
-        try:
-            analytics = DashboardAnalytics()
-            
-            # Register dashboard routes
-            dashboard_app = create_dashboard_app()
-            
-            # Register dashboard blueprints with main app
-            from flask import Blueprint
-            dashboard_bp = Blueprint('dashboard_routes', __name__)
-            
-            # Copy dashboard routes to main app
-            for rule in dashboard_app.url_map.iter_rules():
-                if rule.endpoint.startswith('dashboard') or rule.endpoint.startswith('api'):
-                    endpoint_func = dashboard_app.view_functions[rule.endpoint]
-                    app.add_url_rule(rule.rule, rule.endpoint, endpoint_func, methods=rule.methods)
-            
-            print("✅ Dashboard Interattiva Configurata!")
-        except Exception as e:
-            print(f"⚠️  Dashboard non disponibile: {e}")
-            DASHBOARD_AVAILABLE = False
+    # Get server configuration
+    server_config = config.get('server', {})
+    debug_mode = '--debug' in sys.argv or server_config.get('debug', False)
+    
+    # Register dashboard routes on the main app (warm-up is skipped by the debug reloader)
+    create_app(warm=not debug_mode)
     
     if DASHBOARD_AVAILABLE:
         print("📊 Funzionalità disponibili:")
@@ -766,12 +1130,7 @@ if __name__ == '__main__':
         print("   • Interfaccia web semplificata")
         print("   • Funzionalità core LEGO analysis")
     
-    # Get server configuration
-    server_config = config.get('server', {})
-    debug_mode = '--debug' in sys.argv or server_config.get('debug', False)
-    
-    # Force port 5001 (override config if needed)
-    port = 5001
+    port = get_server_port()
     host = server_config.get('host', '0.0.0.0')
     
     print(f"\n🚀 Avvio server in modalità {'DEBUG' if debug_mode else 'PRODUZIONE'}...")
@@ -784,6 +1143,12 @@ if __name__ == '__main__':
         print(f"🌐 Apertura automatica browser...")
         webbrowser.open(url)
     
+    # Start background retention (only in the serving process when the reloader is active)
+    if retention_config.get('enabled', True) and (not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        retention_sweeper.start()
+    if maintenance_config.get('enabled', False) and (not debug_mode or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        analytics_maintenance.start()
+    
     # Start browser opener in a separate thread (only in production mode)
     if not debug_mode:
         threading.Thread(target=open_browser, daemon=True).start()
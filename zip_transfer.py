@@ -0,0 +1,175 @@
+"""
+Streaming ZIP Import/Export for LEGO Analysis System
+Bulk upload of set inventories and bulk download of generated outputs
+"""
+
+import os
+import zipfile
+import logging
+from pathlib import Path
+from werkzeug.utils import secure_filename
+
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class ZipTransferError(Exception):
+    """Raised when an archive cannot be imported"""
+    pass
+
+
+class _ZipStreamBuffer:
+    """
+    Write-only file object that collects what ZipFile writes so it can be
+    yielded to the client. It has no seek(), which makes ZipFile fall back to
+    streaming mode (data descriptors after each member).
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip_stream(entries, compression=zipfile.ZIP_DEFLATED):
+    """
+    Yield a ZIP archive of `entries` chunk by chunk.
+
+    Args:
+        entries (list): (arcname, file_path) pairs to include
+
+    Only one copy block and the compressor state are in memory at a time;
+    the full archive is never built.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=compression, allowZip64=True) as archive:
+        for arcname, file_path in entries:
+            try:
+                info = zipfile.ZipInfo.from_file(file_path, arcname)
+            except OSError as e:
+                logging.warning(f"Skipping {file_path} in ZIP export: {e}")
+                continue
+            info.compress_type = compression
+
+            with open(file_path, 'rb') as source, \
+                    archive.open(info, mode='w', force_zip64=info.file_size > 0x7FFFFFFF) as target:
+                for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b''):
+                    target.write(block)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory written on close
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def import_zip_archive(fileobj, allowed_extensions, destination_factory,
+                       max_members=500, max_total_size=512 * 1024 * 1024):
+    """
+    Unpack supported members of a ZIP archive straight into the upload store.
+
+    Members are streamed from the archive to their final location (through a
+    .tmp file and a rename, like regular uploads); nothing is extracted to a
+    temporary directory. Directory structure inside the archive is flattened.
+
+    Args:
+        fileobj: Seekable binary file object containing the archive
+        allowed_extensions (set): Lower-case extensions to import
+        destination_factory (callable): Maps a sanitized member name to
+            (stored_filename, full_path) in the upload store
+        max_members (int): Maximum number of files imported from one archive
+        max_total_size (int): Maximum number of uncompressed bytes imported
+
+    Returns:
+        list: Stored filenames, in archive order
+
+    The import is all-or-nothing: if any member fails, files already written
+    for this archive are removed before the error is raised.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ZipTransferError(f"Invalid ZIP archive: {e}")
+
+    imported = []
+    written_paths = []
+
+    try:
+        _import_members(archive, allowed_extensions, destination_factory,
+                        max_members, max_total_size, imported, written_paths)
+    except Exception:
+        for path in written_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        archive.close()
+
+    return imported
+
+
+def _import_members(archive, allowed_extensions, destination_factory,
+                    max_members, max_total_size, imported, written_paths):
+    """Copy supported members into the upload store, recording what was written"""
+    total_size = 0
+
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+
+        member_path = Path(info.filename)
+        if member_path.name.startswith('.') or '__MACOSX' in member_path.parts:
+            continue
+
+        name = secure_filename(member_path.name)
+        extension = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+        if extension not in allowed_extensions:
+            logging.info(f"Skipping unsupported ZIP member: {info.filename}")
+            continue
+
+        if len(imported) >= max_members:
+            raise ZipTransferError(f"Archive has more than {max_members} supported files")
+
+        stored_name, full_path = destination_factory(name)
+        temp_path = full_path + '.tmp'
+
+        try:
+            with archive.open(info) as source, open(temp_path, 'wb') as target:
+                # Count real bytes: the sizes declared in the archive cannot be trusted
+                for block in iter(lambda: source.read(COPY_BLOCK_SIZE), b''):
+                    total_size += len(block)
+                    if total_size > max_total_size:
+                        raise ZipTransferError(
+                            f"Archive expands beyond {max_total_size // (1024 * 1024)}MB"
+                        )
+                    target.write(block)
+            os.replace(temp_path, full_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        written_paths.append(full_path)
+        imported.append(stored_name)
+        logging.info(f"Imported {info.filename} from ZIP as {stored_name}")